@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_DAY = 86400
+
+
+class DaySlotAccumulator:
+    # Sums and counts per (day, time-of-day slot), fed chunk by chunk. Memory depends on the number of days in
+    # the range, not on the number of rows read.
+
+    def __init__(self, step: int) -> None:
+        if SECONDS_PER_DAY % step:
+            raise ValueError(f"Raster of {step}s does not divide a day")
+        self.step = step
+        self.slots = SECONDS_PER_DAY // step
+        self.first_day = None
+        self.sums = np.zeros((0, self.slots))
+        self.counts = np.zeros((0, self.slots), dtype=np.int64)
+
+    def update(self, dates, values):
+        seconds = np.asarray(dates, dtype='datetime64[s]').astype(np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        seconds, values = seconds[valid], values[valid]
+
+        return self.add_aggregates(
+            seconds // SECONDS_PER_DAY, (seconds % SECONDS_PER_DAY) // self.step, values, np.ones(len(values)))
+
+    def add_aggregates(self, days, slots, sums, counts):
+        # Pre-aggregated cells, e.g. from SQL: day numbers since 1970-01-01, slot numbers, sums and counts.
+        days = np.asarray(days, dtype=np.int64)
+        if len(days) == 0:
+            return self
+
+        if self.first_day is None:
+            self.first_day = int(days.min())
+        if days.min() < self.first_day:
+            self._grow(front=self.first_day - int(days.min()))
+        rows = days - self.first_day
+        if rows.max() >= len(self.sums):
+            self._grow(back=int(rows.max()) + 1 - len(self.sums))
+
+        cells = rows * self.slots + np.asarray(slots, dtype=np.int64)
+        size = self.sums.size
+        self.sums += np.bincount(cells, weights=sums, minlength=size).reshape(self.sums.shape)
+        self.counts += np.bincount(cells, weights=counts, minlength=size).astype(np.int64).reshape(self.counts.shape)
+        return self
+
+    def _grow(self, front: int = 0, back: int = 0):
+        self.sums = np.pad(self.sums, ((front, back), (0, 0)))
+        self.counts = np.pad(self.counts, ((front, back), (0, 0)))
+        self.first_day -= front
+
+    def grid(self) -> np.ndarray:
+        # (days x slots) means, NaN where a cell has no value.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 0, self.sums / self.counts, np.nan)
+
+    def hours(self) -> np.ndarray:
+        return np.arange(self.slots) * self.step / 3600
+
+    def days(self) -> np.ndarray:
+        first = 0 if self.first_day is None else self.first_day
+        return (np.arange(len(self.sums)) + first).astype('datetime64[D]')
+
+    def pivot(self) -> pd.DataFrame:
+        # Same shape as pivot_table(index='hour', columns='day', values='mean'), empty hours and days are dropped.
+        df = pd.DataFrame(self.grid().T, index=pd.Index(self.hours(), name='hour'),
+                          columns=pd.Index(pd.to_datetime(self.days()).date, name='day'))
+        return df.dropna(how='all').dropna(axis=1, how='all')
+
+    def average_day(self) -> pd.Series:
+        # Mean per time-of-day slot over all values, like groupby('hour')['mean'].mean().
+        totals = self.counts.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(totals > 0, self.sums.sum(axis=0) / totals, np.nan)
+        return pd.Series(mean, index=pd.Index(self.hours(), name='hour'), name='mean').dropna()
+
+
+def day_slot_grid(dates, values, step: int) -> DaySlotAccumulator:
+    # One series on its own raster has at most one value per cell, so the values are written straight into the
+    # (days x slots) matrix without any grouping.
+    accumulator = DaySlotAccumulator(step)
+    seconds = np.asarray(dates, dtype='datetime64[s]').astype(np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    seconds, values = seconds[valid], values[valid]
+    if len(seconds) == 0:
+        return accumulator
+
+    accumulator.first_day = int(seconds.min() // SECONDS_PER_DAY)
+    n_days = int(seconds.max() // SECONDS_PER_DAY) - accumulator.first_day + 1
+    cells = (seconds - accumulator.first_day * SECONDS_PER_DAY) // step
+
+    sums = np.zeros(n_days * accumulator.slots)
+    counts = np.zeros(n_days * accumulator.slots, dtype=np.int64)
+    sums[cells] = values
+    counts[cells] = 1
+    accumulator.sums = sums.reshape(n_days, accumulator.slots)
+    accumulator.counts = counts.reshape(n_days, accumulator.slots)
+    return accumulator
+
+
+def accumulate_day_slots(chunks, step: int) -> DaySlotAccumulator:
+    # chunks as yielded by PlantDataBase.iter_query_data, with datetime or epoch second dates.
+    accumulator = DaySlotAccumulator(step)
+    for chunk in chunks:
+        dates = np.asarray(chunk['date'])
+        if np.issubdtype(dates.dtype, np.integer):
+            dates = dates.astype('datetime64[s]')
+        accumulator.update(dates, chunk['mean'])
+    return accumulator
+
+
+class PairStats:
+    # Sufficient statistics of a least-squares line, fed chunk by chunk. Sums are taken around the mean of the
+    # first chunk so that large offsets do not cancel out in the variance terms.
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.shift_x = self.shift_y = None
+        self.sum_x = self.sum_y = self.sum_xy = self.sum_xx = self.sum_yy = 0.0
+        self.min_x = self.min_y = np.inf
+        self.max_x = self.max_y = -np.inf
+
+    def update(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = np.isfinite(x) & np.isfinite(y)
+        x, y = x[valid], y[valid]
+        if len(x) == 0:
+            return self
+
+        if self.shift_x is None:
+            self.shift_x, self.shift_y = float(x.mean()), float(y.mean())
+        self.min_x, self.max_x = min(self.min_x, x.min()), max(self.max_x, x.max())
+        self.min_y, self.max_y = min(self.min_y, y.min()), max(self.max_y, y.max())
+        x, y = x - self.shift_x, y - self.shift_y
+        self.n += len(x)
+        self.sum_x += x.sum()
+        self.sum_y += y.sum()
+        self.sum_xy += x @ y
+        self.sum_xx += x @ x
+        self.sum_yy += y @ y
+        return self
+
+    def fit(self):
+        # (slope, intercept), None without at least two distinct x values.
+        if self.n < 2:
+            return None
+        sxx = self.n * self.sum_xx - self.sum_x ** 2
+        if sxx <= 0:
+            return None
+        slope = (self.n * self.sum_xy - self.sum_x * self.sum_y) / sxx
+        intercept = (self.sum_y - slope * self.sum_x) / self.n
+        return slope, intercept + self.shift_y - slope * self.shift_x
+
+    def correlation(self) -> float:
+        sxx = self.n * self.sum_xx - self.sum_x ** 2
+        syy = self.n * self.sum_yy - self.sum_y ** 2
+        if self.n < 2 or sxx <= 0 or syy <= 0:
+            return np.nan
+        return (self.n * self.sum_xy - self.sum_x * self.sum_y) / np.sqrt(sxx * syy)
+
+
+class PairDensity:
+    # 2D histogram over fixed value ranges plus the PairStats of the pairs, fed chunk by chunk. The pairs
+    # themselves are only kept while there are at most max_points of them, enough for a plain scatter plot.
+
+    def __init__(self, x_range: tuple, y_range: tuple, bins: int = 100, max_points: int = 0) -> None:
+        self.x_edges = self._edges(*x_range, bins)
+        self.y_edges = self._edges(*y_range, bins)
+        self.counts = np.zeros((bins, bins))
+        self.stats = PairStats()
+        self.max_points = max_points
+        self._points = []
+
+    @staticmethod
+    def _edges(low: float, high: float, bins: int) -> np.ndarray:
+        # Like np.histogram2d, a range without width is widened by 0.5 on either side.
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        return np.linspace(low, high, bins + 1)
+
+    def update(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = np.isfinite(x) & np.isfinite(y)
+        x, y = x[valid], y[valid]
+        if len(x) == 0:
+            return self
+
+        self.stats.update(x, y)
+        self.counts += np.histogram2d(x, y, bins=[self.x_edges, self.y_edges])[0]
+        if self._points is not None:
+            self._points = [*self._points, (x, y)] if self.stats.n <= self.max_points else None
+        return self
+
+    def points(self):
+        # (x, y) of all pairs, None once there were more than max_points.
+        if self._points is None:
+            return None
+        if not self._points:
+            return np.empty(0), np.empty(0)
+        return np.concatenate([x for x, _ in self._points]), np.concatenate([y for _, y in self._points])
+
+    def x_centers(self) -> np.ndarray:
+        return (self.x_edges[:-1] + self.x_edges[1:]) / 2
+
+    def y_centers(self) -> np.ndarray:
+        return (self.y_edges[:-1] + self.y_edges[1:]) / 2
+
+
+def accumulate_pairs(chunks, x_range: tuple, y_range: tuple, bins: int = 100, max_points: int = 0) -> PairDensity:
+    # chunks of (x, y) arrays as yielded by PlantDataBase.iter_query_pairs.
+    density = PairDensity(x_range, y_range, bins, max_points)
+    for x, y in chunks:
+        density.update(x, y)
+    return density
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import logging
+import platform
+import statistics
+from datetime import datetime, timezone
+
+import pandas as pd
+import plotly.io as pio
+
+from db import PlantDataBase
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Query windows measured from the start of the first series, in days.
+WINDOWS = {'day': 1, 'week': 7, 'month': 31, 'year': 366}
+
+
+def time_call(fn, repeat: int = 5, setup=None) -> tuple:
+    # Returns the timing summary in seconds and the result of the last call. setup runs untimed before every call.
+    durations, result = [], None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - started)
+
+    return {
+        'min': min(durations), 'median': statistics.median(durations), 'mean': statistics.fmean(durations),
+        'max': max(durations), 'repeat': repeat
+    }, result
+
+
+def serialize_figures(figures) -> int:
+    # Dash sends figures as plotly JSON, the size of that payload is what reaches the browser.
+    return sum(len(pio.to_json(figure, validate=False)) for figure in figures)
+
+
+def run_benchmarks(db_name: str, repeat: int = 5, windows: dict = None, series_count: int = 2) -> dict:
+    from dashboard import DashApp
+
+    windows = WINDOWS if windows is None else windows
+    results = []
+
+    def record(name: str, params: dict, fn, setup=None, figures: bool = False):
+        seconds, result = time_call(fn, repeat, setup)
+        entry = {'name': name, 'params': params, 'seconds': seconds}
+        if figures:
+            entry['figure_bytes'] = serialize_figures(result)
+        elif isinstance(result, tuple):
+            entry['rows'] = len(result[0])
+        else:
+            entry['rows'] = len(result)
+        results.append(entry)
+        logger.info(f"{name} {params}: median {seconds['median'] * 1000:.1f} ms")
+
+    with PlantDataBase(db_name, read_only=True) as db:
+        meta = db.query_all_metadata()
+        selected = meta.head(series_count)
+        series_ids = list(selected['series_id'])
+        first = selected.iloc[0]
+        start = pd.Timestamp(first['start_date'])
+
+        record('query_data', {'window': 'all'}, lambda: db.query_data(first['series_id']))
+        for window, days in windows.items():
+            end = str(start + pd.Timedelta(days=days) - pd.Timedelta(seconds=1))
+            record(
+                'query_data', {'window': window}, lambda: db.query_data(first['series_id'], str(start), end)
+            )
+        record(
+            'query_measurements', {'window': 'all'},
+            lambda: db.query_measurements(
+                first['msr'], first['msr_attribute'], first['start_date'], first['end_date'],
+                int(first['raster_size']), first['raster_unit']
+            )
+        )
+        record('query_multiple', {'series': len(series_ids)}, lambda: db.query_multiple(series_ids))
+
+        dash_app = DashApp(db)
+        second_id = series_ids[1] if len(series_ids) > 1 else series_ids[0]
+        for window, days in windows.items():
+            end = str(start + pd.Timedelta(days=days) - pd.Timedelta(seconds=1))
+            for cache in ('cold', 'warm'):
+                # Cold runs start from an empty result cache, warm runs repeat a request the cache has seen.
+                setup = db.cache.invalidate if cache == 'cold' else None
+                record(
+                    'update_univariate_graphs', {'window': window, 'cache': cache},
+                    lambda: dash_app.update_univariate_graphs(first['series_id'], 0, str(start), end),
+                    setup=setup, figures=True
+                )
+                record(
+                    'update_multivariate_graphs', {'window': window, 'cache': cache},
+                    lambda: dash_app.update_multivariate_graphs(first['series_id'], second_id, 0, str(start), end),
+                    setup=setup, figures=True
+                )
+
+        environment = {
+            'db_name': os.path.abspath(db_name), 'db_bytes': os.path.getsize(db_name), 'series': len(meta),
+            'python': platform.python_version(), 'platform': platform.platform(), 'pandas': pd.__version__,
+            'cpu_count': os.cpu_count()
+        }
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'repeat': repeat,
+        'environment': environment, 'results': results
+    }
+
+
+def write_results(results: dict, path: str):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def compare_results(baseline: dict, current: dict) -> list:
+    # Median of each benchmark in both runs, a ratio above 1 means the current run is slower.
+    def key(entry):
+        return entry['name'], json.dumps(entry['params'], sort_keys=True)
+
+    medians = {key(entry): entry['seconds']['median'] for entry in baseline['results']}
+    rows = []
+    for entry in current['results']:
+        before = medians.get(key(entry))
+        after = entry['seconds']['median']
+        rows.append({
+            'name': entry['name'], 'params': entry['params'], 'baseline': before, 'current': after,
+            'ratio': after / before if before else None
+        })
+    return rows
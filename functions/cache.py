@@ -0,0 +1,172 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# One second is the finest resolution of stored dates, used to turn inclusive bounds into gaps.
+RESOLUTION = pd.Timedelta(seconds=1)
+
+
+def _bound(value, open_bound: pd.Timestamp) -> pd.Timestamp:
+    # None and empty strings (a cleared date input) are open bounds, like in the queries.
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return open_bound
+    return pd.Timestamp(value)
+
+
+class RangeCache:
+    def __init__(self, max_bytes: int = 256 * 1024 ** 2, generations=None) -> None:
+        self.max_bytes = max_bytes
+        # generations(series_ids) -> tuple, e.g. SharedCache.generations: entries read under other generations
+        # were invalidated by another process and are read again.
+        self.generations = generations
+        # series_id -> (lower, upper, frame, generation), the frame holds every row of the series within
+        # [lower, upper].
+        self._entries: OrderedDict = OrderedDict()
+        self._sizes: dict = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so frames read before it are not stored afterwards.
+        self._epoch = 0
+        self._stats = {'hits': 0, 'partial_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, series_id: str, start, end, fetch) -> pd.DataFrame:
+        # fetch(series_id, start, end) loads the rows of [start, end] with a date column, None bounds are open.
+        lower = _bound(start, pd.Timestamp.min)
+        upper = _bound(end, pd.Timestamp.max)
+
+        generation = None if self.generations is None else self.generations([series_id])
+        with self._lock:
+            epoch = self._epoch
+            entry = self._entries.get(series_id)
+            if entry is not None and entry[3] != generation:
+                self._remove(series_id)
+                self._stats['invalidations'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(series_id)
+
+        if entry is not None and entry[0] <= lower and upper <= entry[1]:
+            self._count('hits')
+            return self._slice(entry[2], lower, upper)
+
+        if entry is not None and self._touches(entry, lower, upper):
+            # Overlapping or adjacent: only the parts outside the cached range are read.
+            self._count('partial_hits')
+            cached_lower, cached_upper, frame, _ = entry
+            parts = [frame]
+            if lower < cached_lower:
+                parts.insert(0, fetch(series_id, start, cached_lower - RESOLUTION))
+            if upper > cached_upper:
+                parts.append(fetch(series_id, cached_upper + RESOLUTION, end))
+            frame = pd.concat(parts, ignore_index=True)
+            self._store(series_id, min(lower, cached_lower), max(upper, cached_upper), frame, epoch, generation)
+        else:
+            self._count('misses')
+            frame = fetch(series_id, start, end)
+            self._store(series_id, lower, upper, frame, epoch, generation)
+
+        return self._slice(frame, lower, upper)
+
+    def _touches(self, entry: tuple, lower, upper) -> bool:
+        # Overlapping or adjacent ranges, open bounds of the entry are not shifted by a second.
+        below = entry[1] == pd.Timestamp.max or lower <= entry[1] + RESOLUTION
+        above = entry[0] == pd.Timestamp.min or upper >= entry[0] - RESOLUTION
+        return below and above
+
+    def invalidate(self, series_id: str = None):
+        with self._lock:
+            self._epoch += 1
+            series_ids = list(self._entries) if series_id is None else [series_id]
+            for key in series_ids:
+                if key in self._entries:
+                    self._remove(key)
+                    self._stats['invalidations'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+    def _slice(self, frame: pd.DataFrame, lower, upper) -> pd.DataFrame:
+        dates = frame['date']
+        first = dates.searchsorted(lower, side='left')
+        last = dates.searchsorted(upper, side='right')
+        return frame.iloc[first:last].copy()
+
+    def _store(self, series_id: str, lower, upper, frame: pd.DataFrame, epoch: int, generation=None):
+        size = int(frame.memory_usage(deep=True).sum())
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            if series_id in self._entries:
+                self._remove(series_id)
+            if size > self.max_bytes:
+                logger.debug(f"Not caching {series_id}, {size} bytes exceed the cache size")
+                return
+
+            self._entries[series_id] = (lower, upper, frame, generation)
+            self._sizes[series_id] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def _remove(self, series_id: str):
+        del self._entries[series_id]
+        self._bytes -= self._sizes.pop(series_id)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+
+class SharedCache:
+    # Disk-backed cache shared by all worker processes on a host. Keys carry the generation of every series they
+    # depend on, so an invalidation in one process makes the entries stale for all of them without a scan.
+    METADATA = '__metadata__'
+
+    def __init__(self, directory: str, size_limit: int = 1024 ** 3, expire: float = 3600) -> None:
+        import diskcache
+
+        self.directory = directory
+        self.expire = expire
+        self._cache = diskcache.Cache(directory, size_limit=size_limit)
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def generation(self, series_id: str = None) -> int:
+        return self._cache.get(('generation', series_id), 0)
+
+    def invalidate(self, series_id: str = None):
+        # The None generation is part of every key, bumping it drops everything. A series change also changes
+        # the metadata the catalog is built from.
+        if series_id is not None:
+            self._cache.incr(('generation', self.METADATA), default=0)
+        self._cache.incr(('generation', series_id), default=0)
+
+    def generations(self, series_ids: list) -> tuple:
+        return tuple(self.generation(series_id) for series_id in [None, *series_ids])
+
+    def get_or_compute(self, key: tuple, series_ids: list, compute):
+        full_key = (*key, self.generations(series_ids))
+        value = self._cache.get(full_key, default=None)
+        if value is not None:
+            self._stats['hits'] += 1
+            return value
+
+        self._stats['misses'] += 1
+        value = compute()
+        self._cache.set(full_key, value, expire=self.expire)
+        return value
+
+    def metadata(self, compute) -> pd.DataFrame:
+        return self.get_or_compute(('metadata',), [self.METADATA], compute)
+
+    def stats(self) -> dict:
+        return {**self._stats, 'bytes': self._cache.volume(), 'entries': len(self._cache)}
+
+    def close(self):
+        self._cache.close()
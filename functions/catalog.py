@@ -0,0 +1,107 @@
+import re
+import heapq
+from bisect import bisect_left
+
+import pandas as pd
+
+SEARCH_FIELDS = ('msr', 'object_name', 'object_description')
+TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text) -> list:
+    return TOKEN.findall(str(text).lower()) if text is not None else []
+
+
+class MetadataCatalog:
+    # Metadata held once per process with a series_id index and a token index for the dropdown search, so neither
+    # lookups nor searches scan the whole frame.
+
+    def __init__(self, meta: pd.DataFrame) -> None:
+        self.frame = meta.reset_index(drop=True)
+        self.records = self.frame.to_dict('records')
+        self._positions = {record['series_id']: i for i, record in enumerate(self.records)}
+        self._msr = {str(record['msr']).lower(): i for i, record in enumerate(self.records)}
+        self._labels = [self._label(record) for record in self.records]
+
+        # token -> positions of the series whose search fields contain it, the sorted token list serves prefixes.
+        self._postings: dict = {}
+        for i, record in enumerate(self.records):
+            for field in SEARCH_FIELDS:
+                for token in tokenize(record.get(field)):
+                    self._postings.setdefault(token, set()).add(i)
+        self._tokens = sorted(self._postings)
+
+    @classmethod
+    def from_db(cls, db):
+        return cls(db.query_all_metadata())
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, series_id) -> bool:
+        return series_id in self._positions
+
+    def _position(self, series_id: str) -> int:
+        position = self._positions.get(series_id)
+        if position is None:
+            raise ValueError(f"Series {series_id} not found in metadata")
+        return position
+
+    def _label(self, record: dict) -> str:
+        return (
+            f"{record['object_description']} - {record['object_name']} ({record['unit']} | {record['start_date']} - "
+            f"{record['end_date']} | {record['msr']}.{record['msr_attribute']})"
+        )
+
+    def get(self, series_id: str) -> dict:
+        return self.records[self._position(series_id)]
+
+    def row(self, series_id: str) -> pd.DataFrame:
+        # Single-row frame, the shape the figure builders take their unit and names from.
+        return self.frame.iloc[[self._position(series_id)]]
+
+    def rows(self, series_ids: list) -> pd.DataFrame:
+        return self.frame.iloc[[self._position(series_id) for series_id in series_ids]].reset_index(drop=True)
+
+    def label(self, series_id: str) -> str:
+        return self._labels[self._position(series_id)]
+
+    def _prefix_matches(self, prefix: str) -> set:
+        matches = set()
+        i = bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            matches |= self._postings[self._tokens[i]]
+            i += 1
+        return matches
+
+    def search(self, query: str, limit: int = 50) -> list:
+        # Series whose search fields contain a token starting with every query token. An exact msr match ranks
+        # first, then series with more exact token matches, ties keep the catalog order.
+        terms = tokenize(query)
+        if not terms:
+            return [record['series_id'] for record in self.records[:limit]]
+
+        candidates = None
+        for term in terms:
+            matches = self._prefix_matches(term)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+
+        exact = self._msr.get(query.strip().lower())
+
+        def rank(position):
+            exact_tokens = sum(position in self._postings.get(term, ()) for term in terms)
+            return position != exact, -exact_tokens, position
+
+        return [self.records[position]['series_id'] for position in heapq.nsmallest(limit, candidates, key=rank)]
+
+    def options(self, series_ids: list) -> list:
+        return [{'label': self.label(series_id), 'value': series_id} for series_id in series_ids]
+
+    def search_options(self, query: str, limit: int = 50, selected=None) -> list:
+        # Dropdown options for the search text. The selected value is always kept, otherwise Dash blanks it.
+        series_ids = self.search(query, limit)
+        selected = [selected] if isinstance(selected, str) else list(selected or [])
+        keep = [series_id for series_id in selected if series_id in self and series_id not in series_ids]
+        return self.options(keep + series_ids)
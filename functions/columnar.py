@@ -0,0 +1,217 @@
+import json
+import shutil
+import logging
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from db import PlantDataBase, raster_seconds, to_epoch, from_epoch
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Stored status byte: 0 marks raster slots without a row, otherwise the Status table code plus one (1 = no status).
+MISSING = 0
+
+
+class ColumnarPlantDataBase(PlantDataBase):
+    # Serves Data reads from memory-mapped NumPy arrays: one float64 value and one status byte per raster
+    # slot, the date of slot i is origin + i * step. Metadata and rollups stay in the SQLite file, which also
+    # remains the source the arrays are converted from.
+
+    def __init__(self, db_name: str, store_dir: str = None, **kwargs) -> None:
+        super().__init__(db_name, **kwargs)
+        self.store_dir = Path(store_dir or f"{db_name}.columns")
+        self._series: dict = {}
+
+    def convert_from_sqlite(self, series_ids: list = None, chunk_size: int = 100_000) -> list:
+        if series_ids is None:
+            series_ids = list(self.query_all_metadata()['series_id'])
+        for series_id in series_ids:
+            self._convert_series(series_id, chunk_size)
+        return series_ids
+
+    def _convert_series(self, series_id: str, chunk_size: int):
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        cursor.execute("SELECT raster_size, raster_unit FROM Metadata WHERE series_id = ?", (series_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Series {series_id} not found in metadata")
+        step = raster_seconds(*row)
+
+        first, last = self.date_range([series_id])
+        target = self.store_dir / series_id
+        tmp = self.store_dir / f"{series_id}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        if first is None:
+            origin, length = 0, 0
+        else:
+            origin, length = first, (last - first) // step + 1
+
+        values = open_memmap(tmp / 'values.npy', mode='w+', dtype=np.float64, shape=(length,))
+        codes = open_memmap(tmp / 'status.npy', mode='w+', dtype=np.uint8, shape=(length,))
+        values[:] = np.nan
+
+        cursor.execute("SELECT date, mean, status FROM Data WHERE series_id = ? ORDER BY date", (series_id,))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            dates, means, status = zip(*rows)
+            offsets = np.array(dates, dtype=np.int64) - origin
+            status = np.nan_to_num(np.array(status, dtype=np.float64)).astype(np.int64) + 1
+            if (offsets % step).any() or status.max() > 255:
+                shutil.rmtree(tmp)
+                raise ValueError(f"Series {series_id} has samples off its {step}s raster or more than 254 status codes")
+
+            index = offsets // step
+            values[index] = np.array(means, dtype=np.float64)
+            codes[index] = status
+        cursor.close()
+
+        values.flush()
+        codes.flush()
+        del values, codes
+        with open(tmp / 'meta.json', 'w') as f:
+            json.dump({'origin': int(origin), 'step': step}, f)
+
+        self._series.pop(series_id, None)
+        shutil.rmtree(target, ignore_errors=True)
+        tmp.rename(target)
+        logger.info(f"Converted {series_id} to {target} ({length} slots)")
+
+    def _open(self, series_id: str):
+        if series_id not in self._series:
+            path = self.store_dir / series_id
+            if not path.exists():
+                return None
+            with open(path / 'meta.json') as f:
+                meta = json.load(f)
+            self._series[series_id] = (
+                meta, np.load(path / 'values.npy', mmap_mode='r'), np.load(path / 'status.npy', mmap_mode='r')
+            )
+        return self._series[series_id]
+
+    def query_arrays(self, series_id: str, start_date=None, end_date=None):
+        # Zero-copy views on the memory maps: (epoch seconds of the first slot, step, values, status codes).
+        series = self._open(series_id)
+        if series is None:
+            return 0, 1, np.empty(0), np.empty(0, np.uint8)
+
+        meta, values, codes = series
+        origin, step = meta['origin'], meta['step']
+        first, last = 0, len(values)
+        if start_date:
+            first = min(max(-(-(to_epoch(start_date) - origin) // step), 0), len(values))
+        if end_date:
+            last = min(max((to_epoch(end_date) - origin) // step + 1, first), len(values))
+
+        return origin + first * step, step, values[first:last], codes[first:last]
+
+    def _frame(self, series_id: str, start_date, end_date) -> pd.DataFrame:
+        start, step, values, codes = self.query_arrays(series_id, start_date, end_date)
+        present = np.flatnonzero(codes != MISSING)
+
+        return pd.DataFrame({
+            'date': from_epoch(start + present * step),
+            'mean': values[present].astype(self.value_dtype),
+            'status': self._decode_status(codes[present].astype(np.int64) - 1)
+        })
+
+    def query_data(self, series_id: str, start_date=None, end_date=None) -> pd.DataFrame:
+        df = self._frame(series_id, start_date, end_date)
+        df.insert(0, 'series_id', pd.Categorical.from_codes(np.zeros(len(df), np.int8), categories=[series_id]))
+
+        return df
+
+    def iter_query_data(
+            self, series_id: str, start_date=None, end_date=None, chunk_size: int = 100_000, as_numpy: bool = False):
+        start, step, values, codes = self.query_arrays(series_id, start_date, end_date)
+        for first in range(0, len(values), chunk_size):
+            present = first + np.flatnonzero(codes[first:first + chunk_size] != MISSING)
+            if not len(present):
+                # Slots inside a gap, SQLite yields no chunk for them either.
+                continue
+            status = codes[present].astype(np.int64) - 1
+            chunk = {
+                'date': start + present * step,
+                'mean': values[present],
+                'status': status
+            }
+            if as_numpy:
+                yield chunk
+            else:
+                yield pd.DataFrame({
+                    'series_id': pd.Categorical.from_codes(np.zeros(len(present), np.int8), categories=[series_id]),
+                    'date': from_epoch(chunk['date']),
+                    'mean': chunk['mean'].astype(self.value_dtype), 'status': self._decode_status(status)
+                })
+
+    def _fetch_series(self, series_id: str, start_date, end_date) -> pd.DataFrame:
+        return self._frame(series_id, start_date, end_date)
+
+    def query_aligned(self, series_ids: list, start_date=None, end_date=None, names: list = None) -> pd.DataFrame:
+        unique_ids = list(dict.fromkeys(series_ids))
+        codes, seconds, values = [], [], []
+        for code, series_id in enumerate(unique_ids):
+            start, step, series_values, status = self.query_arrays(series_id, start_date, end_date)
+            present = np.flatnonzero(status != MISSING)
+            codes.append(np.full(len(present), code, dtype=np.int64))
+            seconds.append(start + present * step)
+            values.append(series_values[present])
+
+        return self._align(
+            series_ids, names, np.concatenate(codes), np.concatenate(seconds).astype(np.int64), np.concatenate(values)
+        )
+
+    def ingest_series(self, chunks, msr: str, msr_attribute: str, start_date: str, end_date: str, *args, **kwargs):
+        stats = super().ingest_series(chunks, msr, msr_attribute, start_date, end_date, *args, **kwargs)
+        self._convert_series(stats['series_id'], 100_000)
+        return stats
+
+    def delete_measurements(self, series_id: str):
+        super().delete_measurements(series_id)
+        self._series.pop(series_id, None)
+        shutil.rmtree(self.store_dir / series_id, ignore_errors=True)
+
+    def drop_partitions(self, before) -> list:
+        # The arrays cover whole series, converted series are rewritten from the remaining partitions.
+        dropped = super().drop_partitions(before)
+        if dropped:
+            converted = [path.name for path in self.store_dir.iterdir() if (path / 'meta.json').exists()] \
+                if self.store_dir.exists() else []
+            self.convert_from_sqlite(converted)
+        return dropped
+
+
+def compare_backends(
+        reference: PlantDataBase, candidate: PlantDataBase, series_ids: list = None, ranges: list = None) -> list:
+    # Parity check between two backends, returns a description of every query whose results differ.
+    if series_ids is None:
+        series_ids = list(reference.query_all_metadata()['series_id'])
+    if ranges is None:
+        ranges = [(None, None), ('2023-01-01', '2023-03-01'), ('2023-01-01 06:00:00', '2023-01-02 18:00:00')]
+
+    mismatches = []
+    for series_id in series_ids:
+        for start_date, end_date in ranges:
+            expected = reference.query_data(series_id, start_date, end_date).reset_index(drop=True)
+            actual = candidate.query_data(series_id, start_date, end_date).reset_index(drop=True)
+            try:
+                pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_categorical=False)
+            except AssertionError as e:
+                mismatches.append(f"query_data({series_id}, {start_date}, {end_date}): {e}")
+
+        for start_date, end_date in ranges:
+            expected = reference.query_aligned([series_id], start_date, end_date)
+            actual = candidate.query_aligned([series_id], start_date, end_date)
+            try:
+                pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+            except AssertionError as e:
+                mismatches.append(f"query_aligned({series_id}, {start_date}, {end_date}): {e}")
+
+    return mismatches
@@ -1,21 +1,122 @@
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import cProfile
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import dash
 import numpy as np
 from dash import html, dcc, dash_table
+from dash.dash_table.Format import Format, Scheme
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import Response, g, has_request_context, jsonify, request, send_from_directory
 import pandas as pd
 import numexpr as ne
 import plotly.express as px
-from db import PlantDataBase
+from db import PlantDataBase, METADATA_COLUMNS, STATISTICS_COLUMNS
+from downsample import downsample
+from aggregate import SECONDS_PER_DAY, day_slot_grid, accumulate_pairs
+from metrics import MetricsRegistry
+from catalog import MetadataCatalog
+from cache import SharedCache
+from filter_query import filter_to_sql
+from export import export_series
 import plotly.graph_objects as go
 
 
+def create_background_manager(cache_dir='cache/background'):
+    # Background callbacks need the diskcache extra of dash, without it the callbacks run in the request thread.
+    try:
+        import diskcache
+        return dash.DiskcacheManager(diskcache.Cache(cache_dir))
+    except ImportError:
+        return None
+
+
+MEASUREMENT_DROPDOWNS = (
+    'univariate-measurement-dropdown', 'bivariate-measurement-dropdown-1', 'bivariate-measurement-dropdown-2'
+)
+
+
+def create_app(db_name, cache_dir=None, background_dir=None, **kwargs):
+    # App factory for WSGI servers: each worker process imports this once and gets its own connections, while the
+    # shared cache in cache_dir lets workers reuse metadata and prepared frames of each other.
+    shared_cache = SharedCache(cache_dir) if cache_dir else None
+    db = PlantDataBase(db_name, read_only=True, metrics=MetricsRegistry(), shared_cache=shared_cache).open()
+    background_manager = create_background_manager(background_dir) if background_dir else None
+    return DashApp(db, background_manager=background_manager, **kwargs)
+
+
+def create_server(db_name=None, cache_dir=None, background_dir=None, **kwargs):
+    db_name = db_name or os.getenv('PLANT_DB', 'db/test.db')
+    cache_dir = cache_dir or os.getenv('PLANT_CACHE_DIR', 'cache/shared')
+    background_dir = background_dir or os.getenv('PLANT_BACKGROUND_DIR', 'cache/background')
+    kwargs.setdefault('export_dir', os.getenv('PLANT_EXPORT_DIR'))
+    return create_app(db_name, cache_dir, background_dir, **kwargs).app.server
+
+
+def zoom_window(relayout_data, start_date, end_date):
+    # Visible x range of a relayoutData event, the typed range after an axis reset, None for events without a
+    # change of the x axis (y zoom, resize, drag mode).
+    relayout_data = relayout_data or {}
+    if relayout_data.get('xaxis.autorange'):
+        return start_date, end_date
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'][:2])
+    return None
+
+
+def ui_revision(*selection):
+    # Stays the same while only the zoom changes, so plotly keeps the axis ranges of the user until the selection
+    # or the typed range changes or Update is pressed.
+    return '|'.join(map(str, selection))
+
+
 class DashApp:
-    def __init__(self, db):
+    def __init__(
+            self, db, max_points=2000, downsample_mode='lttb', heatmap_sql_days=366, max_workers=8,
+            background_manager=None, metrics=None, profile_dir=None, profile_slow_seconds=1.0, dropdown_limit=50,
+            shared_cache=None, scatter_max_points=5000, density_bins=100, export_dir=None, export_max_age=3600):
         self.db = db
+        # Upper bound of points per line trace that is sent to the browser.
+        self.max_points = max_points
+        self.downsample_mode = downsample_mode
+        # Ranges longer than this are aggregated to hourly heatmap cells by SQLite instead of read row by row.
+        self.heatmap_sql_days = heatmap_sql_days
+        # Scatter plots with more point pairs than this are drawn as a density_bins x density_bins histogram.
+        self.scatter_max_points = scatter_max_points
+        self.density_bins = density_bins
+        # Exports are written here and downloaded from /export, so the directory must be reachable by every worker
+        # and background process. The next export removes those older than export_max_age seconds.
+        self.export_dir = os.path.abspath(export_dir or os.path.join(tempfile.gettempdir(), 'plant-exports'))
+        self.export_max_age = export_max_age
+        # Shared by all callbacks of the app for data fetches and figure builds.
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        # Set in the threads of the executor, see fetch_all.
+        self._pool_thread = threading.local()
+        self.background_manager = background_manager
+        # Callbacks and their stages report here, the same registry as the database unless one is passed.
+        self.metrics = metrics or db.metrics or MetricsRegistry()
+        # With a profile_dir every callback runs under cProfile and slow ones are dumped as <callback>-<time>.prof.
+        self.profile_dir = profile_dir
+        self.profile_slow_seconds = profile_slow_seconds
         self.app = dash.Dash(__name__, external_stylesheets=[dbc.themes.LUX])
-        self.meta_all = db.query_all_metadata()
-        self.dropdown_options = self.generate_dropdown_options()
+        self.shared_cache = shared_cache if shared_cache is not None else db.shared_cache
+        self._catalog = None
+        self._catalog_generation = None
+        # Dropdowns only receive the best matches of the search text instead of every series.
+        self.dropdown_limit = dropdown_limit
+        self.default_series_id = self.catalog.records[0]['series_id']
         self.plot_config = {
             'displayModeBar': False
         }
@@ -23,6 +124,8 @@ class DashApp:
         self.plot_template = 'plotly_white'
         self.create_layout()
         self.register_callbacks()
+        self.register_metrics()
+        self.register_export_route()
 
     def create_layout(self):
         self.app.layout = html.Div(
@@ -57,20 +160,30 @@ class DashApp:
                         ])
                     ]),
                     dcc.Tab(label='Metadata', children=[
+                        self.create_export_row(),
                         html.Div([
                             dash_table.DataTable(
                                 style_table={
                                     'overflowX': 'auto', 'maxWidth': '99%', 'margin': 'auto', 'marginTop': '10px'
                                 },
                                 id='metadata-table',
-                                columns=[{"name": i, "id": i} for i in self.meta_all.columns],
-                                data=self.meta_all.to_dict('records'),
+                                columns=[{"name": i, "id": i} for i in self.catalog.frame.columns] + [
+                                    {"name": i, "id": i, "type": "numeric",
+                                     "format": Format(precision=4, scheme=Scheme.decimal_or_exponent)}
+                                    for i in STATISTICS_COLUMNS
+                                ],
+                                data=[],
                                 row_selectable='multi',
-                                selected_rows=[],
+                                selected_row_ids=[],
+                                page_current=0,
                                 page_size=25,
                                 editable=False,
-                                filter_action="native",
-                                sort_action="native"
+                                page_action="custom",
+                                filter_action="custom",
+                                sort_action="custom",
+                                sort_mode="multi",
+                                filter_query='',
+                                sort_by=[]
                             )
                         ])
                     ])
@@ -78,16 +191,50 @@ class DashApp:
             ]
         )
 
-    def generate_dropdown_options(self):
-        return [
-            {
-                'label': f"{row['object_description']} - {row['object_name']} \
-                        ({row['unit']} | {row['start_date']} - {row['end_date']} | \
-                        {row['msr']}.{row['msr_attribute']})",
-                'value': row['series_id']
-            }
-            for index, row in self.meta_all.iterrows()
-        ]
+    def create_export_row(self):
+        return dbc.Row([
+            dbc.Col([
+                dcc.Input(
+                    id='export-start-date-input',
+                    type='text',
+                    placeholder='Enter start date (YYYY-MM-DD)',
+                    value='2023-01-01',
+                    style={'marginRight': '10px', 'width': '100%'}
+                )
+            ], width=2),
+            dbc.Col([
+                dcc.Input(
+                    id='export-end-date-input',
+                    type='text',
+                    placeholder='Enter end date (YYYY-MM-DD)',
+                    value='2023-12-31',
+                    style={'marginRight': '10px', 'width': '100%'}
+                )
+            ], width=2),
+            dbc.Col([
+                dcc.RadioItems(
+                    id='export-layout',
+                    options=[{'label': 'Long', 'value': 'long'}, {'label': 'Wide', 'value': 'wide'}],
+                    value='long',
+                    inline=True
+                )
+            ], width=2),
+            dbc.Col([
+                dcc.Dropdown(
+                    id='export-format',
+                    options=[{'label': 'Parquet', 'value': 'parquet'}, {'label': 'Arrow IPC', 'value': 'arrow'}],
+                    value='parquet',
+                    clearable=False
+                )
+            ], width=2),
+            dbc.Col([
+                html.Button('Export selected', id='export-button'),
+                html.A(id='export-link', style={'marginLeft': '10px'})
+            ], width=2)
+        ], style={'marginTop': '10px'})
+
+    def generate_dropdown_options(self, search_value=None, selected=None):
+        return self.catalog.search_options(search_value, self.dropdown_limit, selected)
 
     def create_layout_selection_row(self, graph_type):
 
@@ -95,21 +242,21 @@ class DashApp:
             dropdowns = dbc.Row([
                 dcc.Dropdown(
                     id='univariate-measurement-dropdown',
-                    options=self.dropdown_options,
-                    value=self.meta_all['series_id'][0]
+                    options=self.generate_dropdown_options(selected=self.default_series_id),
+                    value=self.default_series_id
                 )
             ])
         elif graph_type == 'bivariate':
             dropdowns = dbc.Row([
                 dcc.Dropdown(
                     id='bivariate-measurement-dropdown-1',
-                    options=self.dropdown_options,
-                    value=self.meta_all['series_id'][0]
+                    options=self.generate_dropdown_options(selected=self.default_series_id),
+                    value=self.default_series_id
                 ),
                 dcc.Dropdown(
                     id='bivariate-measurement-dropdown-2',
-                    options=self.dropdown_options,
-                    value=self.meta_all['series_id'][0]
+                    options=self.generate_dropdown_options(selected=self.default_series_id),
+                    value=self.default_series_id
                 )
             ])
         else:
@@ -143,8 +290,7 @@ class DashApp:
         ])
 
     def register_callbacks(self):
-
-        @self.app.callback(
+        self.app.callback(
             [
                 Output('line-graph', 'figure'),
                 Output('heatmap-graph', 'figure'),
@@ -157,18 +303,11 @@ class DashApp:
             [
                 State('univariate-start-date-input', 'value'),
                 State('univariate-end-date-input', 'value')
-            ]
-        )
-        def update_univariate_graphs(selected_measurement, n_clicks, start_date, end_date):
-            meta_row, df, df_pivot = self.query_and_prepare_data(selected_measurement, start_date, end_date)
-
-            line_graph = self.create_line_graph(df, meta_row)
-            heatmap_graph = self.create_heatmap_graph(df_pivot)
-            avg_day_graph = self.create_avg_day_graph(df, meta_row)
-
-            return line_graph, heatmap_graph, avg_day_graph
+            ],
+            **self.background_options('univariate-update-button')
+        )(self.instrument('univariate', self.update_univariate_graphs))
 
-        @self.app.callback(
+        self.app.callback(
             [
                 Output('scatter-graph', 'figure'),
                 Output('bivariate-line-graph', 'figure')
@@ -181,65 +320,401 @@ class DashApp:
             [
                 State('bivariate-start-date-input', 'value'),
                 State('bivariate-end-date-input', 'value')
-            ]
-        )
-        def update_multivariate_graphs(selected_measurement_1, selected_measurement_2, n_clicks, start_date, end_date):
-            meta_rows, df = self.query_multiple_measurements(
-                [selected_measurement_1, selected_measurement_2], start_date, end_date
-            )
+            ],
+            **self.background_options('bivariate-update-button')
+        )(self.instrument('multivariate', self.update_multivariate_graphs))
 
-            scatter_graph = self.create_scatter_graph(df, meta_rows)
-            line_graph = self.create_bivariate_line_graph(df, meta_rows)
-            return [scatter_graph, line_graph]
+        self.app.callback(
+            Output('line-graph', 'figure', allow_duplicate=True),
+            Input('line-graph', 'relayoutData'),
+            [
+                State('univariate-measurement-dropdown', 'value'),
+                State('univariate-update-button', 'n_clicks'),
+                State('univariate-start-date-input', 'value'),
+                State('univariate-end-date-input', 'value')
+            ],
+            prevent_initial_call=True
+        )(self.instrument('univariate-zoom', self.zoom_line_graph))
 
-        @self.app.callback(
+        self.app.callback(
+            Output('bivariate-line-graph', 'figure', allow_duplicate=True),
+            Input('bivariate-line-graph', 'relayoutData'),
             [
-                Output('univariate-measurement-dropdown', 'options'),
-                Output('bivariate-measurement-dropdown-1', 'options'),
-                Output('bivariate-measurement-dropdown-2', 'options'),
+                State('bivariate-measurement-dropdown-1', 'value'),
+                State('bivariate-measurement-dropdown-2', 'value'),
+                State('bivariate-update-button', 'n_clicks'),
+                State('bivariate-start-date-input', 'value'),
+                State('bivariate-end-date-input', 'value')
             ],
+            prevent_initial_call=True
+        )(self.instrument('multivariate-zoom', self.zoom_bivariate_line_graph))
+
+        self.app.callback(
             [
-                Input('metadata-table', 'data')
+                Output('metadata-table', 'data'),
+                Output('metadata-table', 'page_count')
+            ],
+            [
+                Input('metadata-table', 'page_current'),
+                Input('metadata-table', 'page_size'),
+                Input('metadata-table', 'sort_by'),
+                Input('metadata-table', 'filter_query')
             ]
+        )(self.instrument('metadata-table', self.update_metadata_table))
+
+        self.app.callback(
+            [
+                Output('export-link', 'href'),
+                Output('export-link', 'children')
+            ],
+            Input('export-button', 'n_clicks'),
+            [
+                State('metadata-table', 'selected_row_ids'),
+                State('export-start-date-input', 'value'),
+                State('export-end-date-input', 'value'),
+                State('export-layout', 'value'),
+                State('export-format', 'value')
+            ],
+            prevent_initial_call=True,
+            **self.background_options('export-button')
+        )(self.instrument('export', self.export_selected))
+
+        for dropdown_id in MEASUREMENT_DROPDOWNS:
+            self.app.callback(
+                Output(dropdown_id, 'options'),
+                Input(dropdown_id, 'search_value'),
+                State(dropdown_id, 'value')
+            )(self.instrument('dropdown-search', self.update_dropdown_options))
+
+    def update_metadata_table(self, page_current, page_size, sort_by, filter_query):
+        # Filter, sort and paging run as SQL on Metadata, the browser only ever holds the visible page.
+        try:
+            where, params = filter_to_sql(filter_query, METADATA_COLUMNS + STATISTICS_COLUMNS)
+        except ValueError:
+            return [], 1
+        order_by = [(column['column_id'], column['direction']) for column in sort_by or []]
+        page, total = self.db.query_metadata_page(where, params, order_by, page_current * page_size, page_size)
+        # The id key is what DataTable reports in selected_row_ids.
+        page['id'] = page['series_id']
+        return page.to_dict('records'), max(-(-total // page_size), 1)
+
+    def export_selected(self, n_clicks, series_ids, start_date, end_date, layout, fmt):
+        # The file is streamed to export_dir in column batches and only its link goes through the callback, the
+        # browser then downloads it from the /export route without the file passing through the callback JSON.
+        if not series_ids:
+            raise PreventUpdate
+        suffix = '.parquet' if fmt == 'parquet' else '.arrow'
+        names = [f"{record['msr']}.{record['msr_attribute']}" for record in map(self.catalog.get, series_ids)]
+        if len(set(names)) < len(names):
+            names = list(series_ids)
+
+        self.remove_stale_exports()
+        token, filename = str(uuid.uuid4()), f"plant-data-{layout}{suffix}"
+        directory = os.path.join(self.export_dir, token)
+        os.makedirs(directory)
+        try:
+            export_series(
+                self.db, os.path.join(directory, filename), series_ids, start_date or None, end_date or None, layout,
+                fmt, names
+            )
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return self.app.get_relative_path(f"/export/{token}/{filename}"), f"Download {filename}"
+
+    def remove_stale_exports(self):
+        if not os.path.isdir(self.export_dir):
+            return
+        cutoff = time.time() - self.export_max_age
+        for entry in os.scandir(self.export_dir):
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def register_export_route(self):
+        @self.app.server.route('/export/<uuid:token>/<filename>')
+        def download_export(token, filename):
+            # send_from_directory rejects paths outside export_dir and streams the file in blocks.
+            return send_from_directory(self.export_dir, f"{token}/{filename}", as_attachment=True)
+
+    def update_dropdown_options(self, search_value, selected):
+        # Runs on every keystroke, an empty search (the dropdown was closed) keeps the current options.
+        if not search_value:
+            raise PreventUpdate
+        return self.generate_dropdown_options(search_value, selected)
+
+    def register_metrics(self):
+        server = self.app.server
+
+        @server.before_request
+        def start_request_timer():
+            g.request_started = time.perf_counter()
+
+        @server.after_request
+        def record_request(response):
+            if request.path.endswith('_dash-update-component') and 'request_started' in g:
+                seconds = time.perf_counter() - g.request_started
+                body = request.get_json(silent=True) or {}
+                output = body.get('output', '').strip('.').split('.')[0]
+                self.metrics.observe('dash_request_seconds', seconds, output=output)
+                self.metrics.observe('dash_response_bytes', response.content_length or 0, output=output)
+                if 'callback_seconds' in g:
+                    # What the request spent outside the callback: JSON serialization and Dash dispatch.
+                    self.metrics.observe(
+                        'dash_stage_seconds', seconds - g.callback_seconds, callback=g.callback, stage='serialize'
+                    )
+            return response
+
+        @server.route('/metrics')
+        def metrics():
+            if request.args.get('format') == 'json':
+                return jsonify(self.metrics.snapshot())
+            return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    def instrument(self, name, callback):
+        @functools.wraps(callback)
+        def instrumented(*args):
+            profiler = cProfile.Profile() if self.profile_dir else None
+            started = time.perf_counter()
+            if profiler is not None:
+                # Only the callback thread is profiled, work on the executor shows up as waiting on futures.
+                profiler.enable()
+            try:
+                return callback(*args)
+            finally:
+                seconds = time.perf_counter() - started
+                self.metrics.observe('dash_callback_seconds', seconds, callback=name)
+                if has_request_context():
+                    g.callback, g.callback_seconds = name, seconds
+                if profiler is not None:
+                    profiler.disable()
+                    if seconds >= self.profile_slow_seconds:
+                        os.makedirs(self.profile_dir, exist_ok=True)
+                        profiler.dump_stats(os.path.join(self.profile_dir, f"{name}-{time.time():.0f}.prof"))
+
+        return instrumented
+
+    def stage(self, callback, stage, fn, *args):
+        with self.metrics.time('dash_stage_seconds', callback=callback, stage=stage):
+            return fn(*args)
+
+    def background_options(self, button_id):
+        # With a background manager the callback runs in a worker process instead of the request thread. Dash
+        # cancels the running job when the same callback fires again, i.e. when the selection changes.
+        if self.background_manager is None:
+            return {}
+        return {
+            'background': True,
+            'manager': self.background_manager,
+            'running': [(Output(button_id, 'disabled'), True, False)]
+        }
+
+    def executor(self):
+        # Thread pools do not survive a fork, so every (background worker) process gets its own.
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix='dash-app', initializer=self._mark_pool_thread)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _mark_pool_thread(self):
+        self._pool_thread.active = True
+
+    def fetch_all(self, fetch, series_ids):
+        # Concurrent fetches from the callback thread. A job that already runs on the executor fetches inline:
+        # waiting on the pool from its own threads hangs once every thread does so.
+        if getattr(self._pool_thread, 'active', False):
+            return [fetch(series_id) for series_id in series_ids]
+        return list(self.executor().map(fetch, series_ids))
+
+    def update_univariate_graphs(self, selected_measurement, n_clicks, start_date, end_date):
+        # SQLite releases the GIL while it runs a query, so the rollup and the grid are read in parallel.
+        executor, stage = self.executor(), functools.partial(self.stage, 'univariate')
+        grid_future = executor.submit(
+            stage, 'fetch', self.query_and_prepare_data, selected_measurement, start_date, end_date
+        )
+        line_future = executor.submit(stage, 'fetch', self.query_line_data, selected_measurement, start_date, end_date)
+        mean_day_future = executor.submit(
+            stage, 'fetch', self.query_average_day, selected_measurement, start_date, end_date
+        )
+        meta_row, grid = grid_future.result()
+        heatmap = stage('prepare', grid.pivot)
+
+        line_graph = executor.submit(
+            stage, 'figure', self.create_line_graph, line_future.result(), meta_row,
+            ui_revision(selected_measurement, n_clicks, start_date, end_date)
+        )
+        heatmap_graph = executor.submit(stage, 'figure', self.create_heatmap_graph, heatmap)
+        avg_day_graph = stage('figure', self.create_avg_day_graph, mean_day_future.result(), meta_row)
+
+        return line_graph.result(), heatmap_graph.result(), avg_day_graph
+
+    def update_multivariate_graphs(
+            self, selected_measurement_1, selected_measurement_2, n_clicks, start_date, end_date):
+        executor, stage = self.executor(), functools.partial(self.stage, 'multivariate')
+        selected_measurements = [selected_measurement_1, selected_measurement_2]
+        # The scatter plot streams the pairs into a fixed size density, the line graph is an overview at the
+        # resolution of the range.
+        line_future = executor.submit(
+            stage, 'fetch', self.query_bivariate_line_data, selected_measurements, start_date, end_date
+        )
+        meta_rows = self.catalog.rows(selected_measurements)
+        meta_rows.loc[:, 'index'] = [f"m_{i}" for i in range(len(selected_measurements))]
+        density = stage('fetch', self.query_scatter_data, selected_measurements, start_date, end_date)
+
+        scatter_graph = executor.submit(stage, 'figure', self.create_scatter_graph, density, meta_rows)
+        line_graph = stage(
+            'figure', self.create_bivariate_line_graph, line_future.result(), meta_rows,
+            ui_revision(*selected_measurements, n_clicks, start_date, end_date)
+        )
+        return [scatter_graph.result(), line_graph]
+
+    def zoom_line_graph(self, relayout_data, selected_measurement, n_clicks, start_date, end_date):
+        # Refetches the visible window at the resolution it needs, a reset of the axes goes back to the overview.
+        window = zoom_window(relayout_data, start_date, end_date)
+        if window is None:
+            raise PreventUpdate
+        return self.create_line_graph(
+            self.query_line_data(selected_measurement, *window), self.catalog.row(selected_measurement),
+            ui_revision(selected_measurement, n_clicks, start_date, end_date)
+        )
+
+    def zoom_bivariate_line_graph(
+            self, relayout_data, selected_measurement_1, selected_measurement_2, n_clicks, start_date, end_date):
+        window = zoom_window(relayout_data, start_date, end_date)
+        if window is None:
+            raise PreventUpdate
+        selected_measurements = [selected_measurement_1, selected_measurement_2]
+        meta_rows = self.catalog.rows(selected_measurements)
+        meta_rows.loc[:, 'index'] = [f"m_{i}" for i in range(len(selected_measurements))]
+        return self.create_bivariate_line_graph(
+            self.query_bivariate_line_data(selected_measurements, *window), meta_rows,
+            ui_revision(*selected_measurements, n_clicks, start_date, end_date)
         )
-        def update_dropdown_options(data):
-            options = self.generate_dropdown_options()
-            return options, options, options
 
     def query_and_prepare_data(self, selected_measurement, start_date, end_date):
-        meta_row = self.meta_all[self.meta_all['series_id'] == selected_measurement]
-        df = self.db.query_data(selected_measurement, start_date, end_date)
-        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d %H:%M:%S')
-        df['day'] = df['date'].dt.date
-        df['hour'] = df['date'].dt.hour + df['date'].dt.minute / 60
-        df_pivot = df.pivot_table(index=['hour'], columns=['day'], values='mean')
+        # The (days x time-of-day) grid of the heatmap.
+        meta_row = self.catalog.row(selected_measurement)
+        grid = self.shared(
+            ('day-slots', selected_measurement, start_date, end_date, self.heatmap_sql_days), [selected_measurement],
+            lambda: self.query_day_slots(selected_measurement, start_date, end_date)
+        )
 
-        return meta_row, df, df_pivot
+        return meta_row, grid
 
-    def query_multiple_measurements(self, selected_measurements, start_date, end_date):
-        df = pd.DataFrame()
-        meta_rows = pd.DataFrame()
+    def query_day_slots(self, selected_measurement, start_date, end_date):
+        # A raster that does not divide a day has no fixed time-of-day slots, it is averaged per hour like a long
+        # range.
+        step = self.db.raster_step([selected_measurement])
+        if not (start_date and end_date) or SECONDS_PER_DAY % step or \
+                (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days > self.heatmap_sql_days:
+            return self.db.query_day_slots(selected_measurement, start_date, end_date, slot_seconds=3600)
 
-        for i, selected_measurement in enumerate(selected_measurements):
-            name = f"m_{i}"
+        df = self.db.query_series(selected_measurement, start_date, end_date)
+        return day_slot_grid(df['date'], df['mean'], step)
 
-            meta_row = self.meta_all[self.meta_all['series_id'] == selected_measurement].copy()
-            m_df = self.db.query_data(selected_measurement, start_date, end_date)
-            m_df['date'] = pd.to_datetime(m_df['date'], format='%Y-%m-%d %H:%M:%S')
+    def query_average_day(self, selected_measurement, start_date, end_date):
+        # Read from the stored time-of-day profile at the raster of the series, raw rows only for partial months.
+        return self.shared(
+            ('avg-day', selected_measurement, start_date, end_date), [selected_measurement],
+            lambda: self.db.query_average_day(selected_measurement, start_date, end_date)
+        )
 
-            meta_row.loc[:, 'index'] = name
-            meta_rows = pd.concat([meta_rows, meta_row])
+    def query_line_data(self, selected_measurement, start_date, end_date):
+        # Long ranges are served from the coarsest rollup that still gives about max_points buckets.
+        resolution_seconds = self.line_resolution(start_date, end_date)
+        return self.shared(
+            ('line', selected_measurement, start_date, end_date, self.max_points), [selected_measurement],
+            lambda: self.db.query_rollup(selected_measurement, start_date, end_date, resolution_seconds)
+        )
 
-            m_df.loc[:, name] = m_df['mean']
-            if df.empty:
-                df = m_df[['date', name]]
-            else:
-                df = pd.merge(df, m_df[['date', name]], on='date', how='outer')
+    def line_resolution(self, start_date, end_date):
+        if not (start_date and end_date):
+            return 0
+        return (pd.Timestamp(end_date) - pd.Timestamp(start_date)).total_seconds() / self.max_points
+
+    def query_bivariate_line_data(self, selected_measurements, start_date, end_date):
+        # One rollup per series merged on the bucket start, raw aligned rows when the range is too short for one.
+        resolution_seconds = self.line_resolution(start_date, end_date)
+        if self.db.plan_rollup(resolution_seconds) is None:
+            return self.query_multiple_measurements(selected_measurements, start_date, end_date)[1]
+
+        def query():
+            series_ids = list(dict.fromkeys(selected_measurements))
+            rollups = dict(zip(series_ids, self.fetch_all(
+                lambda series_id: self.db.query_rollup(series_id, start_date, end_date, resolution_seconds), series_ids
+            )))
+            df = None
+            for i, series_id in enumerate(selected_measurements):
+                part = rollups[series_id][['date', 'mean']].rename(columns={'mean': f"m_{i}"})
+                df = part if df is None else df.merge(part, on='date', how='outer')
+            return df.sort_values('date', ignore_index=True)
+
+        return self.shared(
+            ('bivariate-line', tuple(selected_measurements), start_date, end_date, self.max_points),
+            selected_measurements, query
+        )
+
+    def query_scatter_data(self, selected_measurements, start_date, end_date):
+        # One pass over the pairs in chunks: the histogram and the regression statistics have a fixed size however
+        # long the range is. The bins span the monthly minima and maxima, known before the first pair is read.
+        def query():
+            x_range, y_range = (
+                self.value_range(series_id, start_date, end_date) for series_id in selected_measurements
+            )
+            if x_range is None or y_range is None:
+                return accumulate_pairs([], (0, 0), (0, 0), self.density_bins, self.scatter_max_points)
+            return accumulate_pairs(
+                self.db.iter_query_pairs(*selected_measurements, start_date, end_date), x_range, y_range,
+                self.density_bins, self.scatter_max_points
+            )
+
+        return self.shared(
+            ('scatter', tuple(selected_measurements), start_date, end_date, self.density_bins,
+             self.scatter_max_points), selected_measurements, query
+        )
+
+    def value_range(self, series_id, start_date, end_date):
+        statistics = self.db.query_statistics(series_id, start_date, end_date)
+        low, high = statistics['min'].min(), statistics['max'].max()
+        return None if pd.isna(low) or pd.isna(high) else (float(low), float(high))
+
+    def query_multiple_measurements(self, selected_measurements, start_date, end_date):
+        names = [f"m_{i}" for i in range(len(selected_measurements))]
+
+        meta_rows = self.catalog.rows(selected_measurements)
+        meta_rows.loc[:, 'index'] = names
+        df = self.shared(
+            ('aligned', tuple(selected_measurements), start_date, end_date), selected_measurements,
+            lambda: self.query_aligned(selected_measurements, start_date, end_date, names)
+        )
 
         return meta_rows, df
 
-    def create_avg_day_graph(self, df, meta_row):
-        mean_day = df.groupby('hour')['mean'].mean()
+    def query_aligned(self, selected_measurements, start_date, end_date, names):
+        # Independent series are fetched concurrently through the range cache and aligned afterwards.
+        series_ids = list(dict.fromkeys(selected_measurements))
+        frames = self.fetch_all(lambda series_id: self.db.query_series(series_id, start_date, end_date), series_ids)
+        return self.db.align_frames(dict(zip(series_ids, frames)), selected_measurements, names=names)
+
+    def shared(self, key, series_ids, compute):
+        # Results other workers already computed are read from the shared cache instead of the database.
+        if self.shared_cache is None:
+            return compute()
+        return self.shared_cache.get_or_compute(key, series_ids, compute)
+
+    @property
+    def catalog(self):
+        # Rebuilt when another process changed the metadata since this worker built its catalog.
+        generation = None if self.shared_cache is None else self.shared_cache.generation(SharedCache.METADATA)
+        if self._catalog is None or generation != self._catalog_generation:
+            if self.shared_cache is None:
+                self._catalog = MetadataCatalog.from_db(self.db)
+            else:
+                self._catalog = MetadataCatalog(self.shared_cache.metadata(self.db.query_all_metadata))
+            self._catalog_generation = generation
+        return self._catalog
+
+    def create_avg_day_graph(self, mean_day, meta_row):
         fig = px.line(mean_day, color_discrete_sequence=self.color_sequence)
         fig.update_layout(
             template=self.plot_template,
@@ -250,25 +725,38 @@ class DashApp:
 
         return fig
 
-    def create_line_graph(self, df, meta_row):
+    def create_line_graph(self, df, meta_row, uirevision=None):
+        df = downsample(df, 'date', 'mean', self.max_points, self.downsample_mode)
         fig = px.line(df, x='date', y='mean', color_discrete_sequence=self.color_sequence)
+        if 'min' in df.columns and (df['min'] != df['max']).any():
+            # Rolled up buckets keep their extremes visible as a band around the mean.
+            fig.add_traces([
+                go.Scatter(x=df['date'], y=df['max'], mode='lines', line=dict(width=0), hoverinfo='skip'),
+                go.Scatter(
+                    x=df['date'], y=df['min'], mode='lines', line=dict(width=0), fill='tonexty',
+                    fillcolor='rgba(51, 102, 204, 0.2)', hoverinfo='skip'
+                )
+            ])
         fig.update_layout(
             template=self.plot_template,
             xaxis_title='Date',
             yaxis_title=f'Value in {meta_row["unit"].values[0]}',
-            showlegend=False
+            showlegend=False,
+            # Keeps the zoom of the user when a refetched window replaces the figure.
+            uirevision=uirevision
         )
         return fig
 
-    def create_bivariate_line_graph(self, df, meta_rows):
+    def create_bivariate_line_graph(self, df, meta_rows, uirevision=None):
         fig = go.Figure()
 
         for i, (index, row) in enumerate(meta_rows.iterrows()):
             secondary_y = i > 0
+            df_trace = downsample(df, 'date', row['index'], self.max_points, self.downsample_mode)
 
             fig.add_trace(go.Scatter(
-                x=df['date'],
-                y=df[row['index']],
+                x=df_trace['date'],
+                y=df_trace[row['index']],
                 mode='lines',
                 name=row['object_name'],
                 yaxis='y2' if secondary_y else 'y1',
@@ -292,7 +780,8 @@ class DashApp:
                 y=-0.2,
                 xanchor='center',
                 x=0.5
-            )
+            ),
+            uirevision=uirevision
         )
 
         return fig
@@ -314,26 +803,45 @@ class DashApp:
 
         return fig
 
-    def create_scatter_graph(self, df, meta_rows):
+    def create_scatter_graph(self, density, meta_rows):
         first_row = meta_rows.iloc[0]
         second_row = meta_rows.iloc[1]
+        # Dates where either series has no value are left out of the plot and the fit.
+        points = density.points()
 
         fig = go.Figure()
 
-        fig.add_trace(go.Scatter(
-            x=df[first_row['index']],
-            y=df[second_row['index']],
-            mode='markers',
-            marker=dict(color=self.color_sequence[0])
-        ))
-
-        m, b = np.polyfit(df[first_row['index']], df[second_row['index']], 1)
-        fig.add_trace(go.Scatter(
-            x=df[first_row['index']],
-            y=m * df[first_row['index']] + b,
-            mode='lines',
-            line=dict(color=self.color_sequence[1])
-        ))
+        if points is None:
+            # Above scatter_max_points the pairs are binned, the payload is fixed by density_bins instead of the range.
+            counts = density.counts
+            fig.add_trace(go.Heatmap(
+                x=density.x_centers(),
+                y=density.y_centers(),
+                z=np.where(counts.T > 0, counts.T, np.nan),
+                colorscale='Blues',
+                showscale=False,
+                hovertemplate='x: %{x}<br>y: %{y}<br>count: %{z}<extra></extra>'
+            ))
+        else:
+            fig.add_trace(go.Scatter(
+                x=points[0],
+                y=points[1],
+                mode='markers',
+                marker=dict(color=self.color_sequence[0])
+            ))
+
+        # The regression needs only the sufficient statistics, the line only its two end points.
+        stats = density.stats
+        fit = stats.fit()
+        if fit is not None:
+            m, b = fit
+            line_x = np.array([stats.min_x, stats.max_x])
+            fig.add_trace(go.Scatter(
+                x=line_x,
+                y=m * line_x + b,
+                mode='lines',
+                line=dict(color=self.color_sequence[1])
+            ))
 
         fig.update_layout(
             template=self.plot_template,
@@ -344,11 +852,15 @@ class DashApp:
 
         return fig
 
-    def run(self):
-        self.app.run_server(debug=True)
+    def run(self, debug=False, **kwargs):
+        # Development server only, production runs the Flask server of create_server under a WSGI server.
+        self.app.run_server(debug=debug, **kwargs)
 
 
 if __name__ == '__main__':
-    db = PlantDataBase('db/test.db')
-    dash_app = DashApp(db)
-    dash_app.run()
+    db = PlantDataBase('db/test.db', metrics=MetricsRegistry()).open()
+    dash_app = DashApp(db, background_manager=create_background_manager(), profile_dir=os.getenv('DASH_PROFILE_DIR'))
+    try:
+        dash_app.run(debug=True)
+    finally:
+        db.close()
@@ -1,18 +1,137 @@
 import json
+import math
+import time
 import sqlite3
 import logging
 import hashlib
+import threading
+import numpy as np
 import pandas as pd
+from pathlib import Path
+from itertools import repeat
+
+from pool import ConnectionPool
+from cache import RangeCache, SharedCache
+from aggregate import DaySlotAccumulator
+from metrics import MetricsRegistry
+
+# Bumped whenever the on-disk layout changes, stored in PRAGMA user_version.
+SCHEMA_VERSION = 5
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Rollup resolutions from fine to coarse: SQL expression of the bucket start in epoch seconds and nominal bucket
+# width in seconds.
+ROLLUP_RESOLUTIONS = {
+    'hour': ("date - date % 3600", 3600),
+    'day': ("date - date % 86400", 86400),
+    'month': ("CAST(strftime('%s', date, 'unixepoch', 'start of month') AS INTEGER)", 2629746),
+}
+
+RASTER_UNIT_SECONDS = {
+    's': 1, 'sec': 1, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400,
+}
+
+# Measurements live in one table per calendar year, named Data_<year>, behind the UNION ALL view Data.
+PARTITION_PATTERN = 'Data_[0-9][0-9][0-9][0-9]'
+
+METADATA_COLUMNS = [
+    'series_id', 'msr', 'msr_attribute', 'object_id', 'object_type', 'cfg', 'device', 'number',
+    'object_description', 'object_name', 'unit', 'start_date', 'end_date', 'raster_size', 'raster_unit', 'scale'
+]
+
+# Columns of SeriesStatistics the Metadata page joins in. They are stored rather than computed in the query, so
+# that the text values of a table filter compare as numbers through the column affinity.
+STATISTICS_COLUMNS = ['rows', 'null_ratio', 'min', 'max', 'mean']
+METADATA_PAGE_SOURCE = f'''
+    SELECT m.*, {', '.join(f's.{column}' for column in STATISTICS_COLUMNS)}
+    FROM Metadata m LEFT JOIN SeriesStatistics s USING (series_id)
+'''
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def to_epoch(value) -> int:
+    # Dates are stored as integer seconds since 1970-01-01 of the naive plant time.
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).to_datetime64().astype('datetime64[s]').astype(np.int64))
+
+
+def from_epoch(seconds) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(np.asarray(seconds, dtype=np.int64).astype('datetime64[s]').astype('datetime64[ns]'))
+
+
+def epoch_years(seconds) -> np.ndarray:
+    return np.asarray(seconds, dtype=np.int64).astype('datetime64[s]').astype('datetime64[Y]').astype(np.int64) + 1970
+
+
+def year_bounds(year: int) -> tuple:
+    # [start, end) of a calendar year in epoch seconds.
+    return to_epoch(f"{int(year):04d}-01-01"), to_epoch(f"{int(year) + 1:04d}-01-01")
+
+
+def partition_name(year: int) -> str:
+    return f"Data_{int(year):04d}"
+
+
+def raster_seconds(raster_size: int, raster_unit: str) -> int:
+    if raster_unit not in RASTER_UNIT_SECONDS:
+        raise ValueError(f"Unknown raster unit {raster_unit}, expected one of {list(RASTER_UNIT_SECONDS)}")
+    return int(raster_size) * RASTER_UNIT_SECONDS[raster_unit]
 
 
 class PlantDataBase:
-    def __init__(self, db_name: str) -> None:
+    def __init__(
+            self, db_name: str, wal: bool = True, mmap_size: int = 256 * 1024 ** 2, cache_size: int = -64 * 1024,
+            read_only: bool = False, result_cache_bytes: int = 256 * 1024 ** 2, value_dtype: str = 'float32',
+            metrics: MetricsRegistry = None, shared_cache: SharedCache = None, vacuum_interval: float = None) -> None:
         self.db_name = db_name
+        # Cross-process cache of the dashboard workers, told about every write so that their entries go stale.
+        self.shared_cache = shared_cache
+        # Optional registry that every statement run through the pool reports its duration and row count to.
+        self.metrics = metrics
+        self.pool = ConnectionPool(
+            db_name, wal=wal, mmap_size=mmap_size, cache_size=cache_size, read_only=read_only, metrics=metrics)
+        self.cache = RangeCache(
+            result_cache_bytes, generations=None if shared_cache is None else shared_cache.generations)
+        # dtype of measurement values in returned frames, aggregates are always computed in double precision.
+        self.value_dtype = np.dtype(value_dtype)
+        self._statuses: dict = {}
+        # Seconds between background incremental vacuum runs of a writable database, None disables the thread.
+        self.vacuum_interval = vacuum_interval
+        self._vacuum_thread: threading.Thread | None = None
+        self._vacuum_stop = threading.Event()
+        self._vacuum_wake = threading.Event()
+
+    def open(self):
+        # Opens the writer eagerly so that the journal mode is settled before the first reader connects.
+        if not self.pool.read_only:
+            with self.pool.writer():
+                pass
+            if self.vacuum_interval is not None:
+                self.start_background_vacuum(self.vacuum_interval)
+        self.pool.reader()
+        return self
+
+    def close(self):
+        self.stop_background_vacuum()
+        self.pool.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def create_tables(self):
 
-        conn: sqlite3.Connection = sqlite3.connect(self.db_name)
-        cursor: sqlite3.Cursor = conn.cursor()
+        with self.pool.writer() as conn:
+            self._create_tables(conn.cursor())
+
+        self.migrate()
+
+    def _create_tables(self, cursor: sqlite3.Cursor):
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS Metadata (
@@ -35,111 +154,1068 @@ class PlantDataBase:
             )
         ''')
 
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name='Data'")
+        if cursor.fetchone() is None:
+            cursor.execute('''
+                CREATE TABLE Status (
+                    status_code INTEGER PRIMARY KEY,
+                    status TEXT NOT NULL UNIQUE
+                )
+            ''')
+            # Partitions are created by the first ingest that has rows of their year.
+            self._create_data_view(cursor, [])
+            self._create_statistics_tables(cursor)
+            cursor.execute('''
+                CREATE TABLE Rollup (
+                    series_id TEXT NOT NULL,
+                    resolution TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    sum REAL,
+                    min REAL,
+                    max REAL,
+                    PRIMARY KEY (series_id, resolution, bucket)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _create_partition(self, cursor: sqlite3.Cursor, year: int):
+        # Each partition is clustered on (series_id, date) so that every range read is an index seek.
+        # date holds epoch seconds and status a code from the Status table.
+        lower, upper = year_bounds(year)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {partition_name(year)} (
+                series_id TEXT NOT NULL,
+                date INTEGER NOT NULL CHECK (date >= {lower} AND date < {upper}),
+                mean REAL,
+                status INTEGER,
+                PRIMARY KEY (series_id, date),
+                FOREIGN KEY(series_id) REFERENCES Metadata(series_id),
+                FOREIGN KEY(status) REFERENCES Status(status_code)
+            ) WITHOUT ROWID
+        ''')
+
+    def _create_data_view(self, cursor: sqlite3.Cursor, years: list):
+        # SQLite pushes the series_id and date terms of a query on Data down into every partition, so a range
+        # read stays one primary key seek per partition and ORDER BY date merges the already ordered partitions.
+        if years:
+            select = ' UNION ALL '.join(
+                f"SELECT series_id, date, mean, status FROM {partition_name(year)}" for year in sorted(years))
+        else:
+            select = "SELECT CAST(NULL AS TEXT) AS series_id, CAST(NULL AS INTEGER) AS date, " \
+                "CAST(NULL AS REAL) AS mean, CAST(NULL AS INTEGER) AS status WHERE 0"
+        cursor.execute("DROP VIEW IF EXISTS Data")
+        cursor.execute(f"CREATE VIEW Data AS {select}")
+
+    def _create_statistics_tables(self, cursor: sqlite3.Cursor):
+        # count includes rows without a value, null_count is the number of those. month is the epoch second the
+        # month starts at, slot the second of the day a raster slot starts at.
+        cursor.execute('''
+            CREATE TABLE MonthStatistics (
+                series_id TEXT NOT NULL,
+                month INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                null_count INTEGER NOT NULL,
+                sum REAL,
+                min REAL,
+                max REAL,
+                PRIMARY KEY (series_id, month)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE SeriesStatistics (
+                series_id TEXT PRIMARY KEY,
+                rows INTEGER NOT NULL,
+                null_ratio REAL,
+                min REAL,
+                max REAL,
+                mean REAL
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE DayProfile (
+                series_id TEXT NOT NULL,
+                month INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL,
+                PRIMARY KEY (series_id, month, slot)
+            ) WITHOUT ROWID
+        ''')
+
+    def partitions(self, cursor: sqlite3.Cursor = None) -> list:
+        # Years that have a Data partition, ascending.
+        cursor = cursor or self.pool.reader().cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name GLOB ?", (PARTITION_PATTERN,))
+        return sorted(int(name[len('Data_'):]) for name, in cursor.fetchall())
+
+    def get_schema_version(self) -> int:
+        return self.pool.reader().execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self) -> int:
+        # Upgrades the file in place to SCHEMA_VERSION, one transaction per version step.
+        version = self.get_schema_version()
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"Database schema version {version} is newer than supported version {SCHEMA_VERSION}")
+        if version == SCHEMA_VERSION:
+            return version
+
+        with self.pool.writer() as conn:
+            cursor: sqlite3.Cursor = conn.cursor()
+            while version < SCHEMA_VERSION:
+                logger.info(f"Migrating {self.db_name} from schema version {version} to {version + 1}")
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    getattr(self, f"_migrate_to_v{version + 1}")(cursor)
+                    cursor.execute(f"PRAGMA user_version = {version + 1}")
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+                version += 1
+
+        return version
+
+    def _migrate_to_v1(self, cursor: sqlite3.Cursor):
+        # v0 stored Data in insertion order behind an AUTOINCREMENT rowid without any index.
+        cursor.execute("ALTER TABLE Data RENAME TO Data_v0")
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Data (
-                data_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CREATE TABLE Data (
                 series_id TEXT NOT NULL,
-                date DATETIME,
+                date DATETIME NOT NULL,
                 mean REAL,
                 status TEXT,
+                PRIMARY KEY (series_id, date),
                 FOREIGN KEY(series_id) REFERENCES Metadata(series_id)
+            ) WITHOUT ROWID
+        ''')
+        # Later duplicates of the same (series_id, date) win, as they did for readers of the last row.
+        cursor.execute('''
+            INSERT OR REPLACE INTO Data (series_id, date, mean, status)
+            SELECT series_id, date, mean, status FROM Data_v0
+            WHERE date IS NOT NULL
+            ORDER BY data_id
+        ''')
+        cursor.execute("DROP TABLE Data_v0")
+
+    def _migrate_to_v2(self, cursor: sqlite3.Cursor):
+        cursor.execute('''
+            CREATE TABLE Rollup (
+                series_id TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                bucket DATETIME NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL,
+                min REAL,
+                max REAL,
+                PRIMARY KEY (series_id, resolution, bucket)
+            ) WITHOUT ROWID
+        ''')
+        for resolution, key_format in [
+                ('hour', '%Y-%m-%d %H:00:00'), ('day', '%Y-%m-%d 00:00:00'), ('month', '%Y-%m-01 00:00:00')]:
+            cursor.execute('''
+                INSERT INTO Rollup (series_id, resolution, bucket, count, sum, min, max)
+                SELECT series_id, ?, strftime(?, date) AS bucket, COUNT(mean), SUM(mean), MIN(mean), MAX(mean)
+                FROM Data GROUP BY series_id, bucket
+            ''', (resolution, key_format))
+
+    def _migrate_to_v3(self, cursor: sqlite3.Cursor):
+        # v2 stored dates as '%Y-%m-%d %H:%M:%S' text and status as free text on every row.
+        cursor.execute('''
+            CREATE TABLE Status (
+                status_code INTEGER PRIMARY KEY,
+                status TEXT NOT NULL UNIQUE
             )
         ''')
+        cursor.execute("INSERT INTO Status (status) SELECT DISTINCT status FROM Data WHERE status IS NOT NULL")
+
+        cursor.execute("ALTER TABLE Data RENAME TO Data_v2")
+        cursor.execute('''
+            CREATE TABLE Data (
+                series_id TEXT NOT NULL,
+                date INTEGER NOT NULL,
+                mean REAL,
+                status INTEGER,
+                PRIMARY KEY (series_id, date),
+                FOREIGN KEY(series_id) REFERENCES Metadata(series_id),
+                FOREIGN KEY(status) REFERENCES Status(status_code)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            INSERT OR REPLACE INTO Data (series_id, date, mean, status)
+            SELECT d.series_id, CAST(strftime('%s', d.date) AS INTEGER), d.mean, s.status_code
+            FROM Data_v2 d LEFT JOIN Status s ON s.status = d.status
+            ORDER BY d.series_id, d.date
+        ''')
+        cursor.execute("DROP TABLE Data_v2")
+
+        cursor.execute("ALTER TABLE Rollup RENAME TO Rollup_v2")
+        cursor.execute('''
+            CREATE TABLE Rollup (
+                series_id TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL,
+                min REAL,
+                max REAL,
+                PRIMARY KEY (series_id, resolution, bucket)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            INSERT INTO Rollup (series_id, resolution, bucket, count, sum, min, max)
+            SELECT series_id, resolution, CAST(strftime('%s', bucket) AS INTEGER), count, sum, min, max FROM Rollup_v2
+        ''')
+        cursor.execute("DROP TABLE Rollup_v2")
+
+    def _migrate_to_v4(self, cursor: sqlite3.Cursor):
+        # v3 kept every row in a single Data table, deleting a series or old years meant deleting row by row.
+        cursor.execute("ALTER TABLE Data RENAME TO Data_v3")
+        cursor.execute("SELECT MIN(date), MAX(date) FROM Data_v3")
+        first, last = cursor.fetchone()
+
+        years = []
+        if first is not None:
+            for year in range(int(epoch_years(first)), int(epoch_years(last)) + 1):
+                self._create_partition(cursor, year)
+                cursor.execute(
+                    f"INSERT INTO {partition_name(year)} (series_id, date, mean, status) "
+                    "SELECT series_id, date, mean, status FROM Data_v3 WHERE date >= ? AND date < ? "
+                    "ORDER BY series_id, date", year_bounds(year)
+                )
+                if cursor.rowcount:
+                    years.append(year)
+                else:
+                    cursor.execute(f"DROP TABLE {partition_name(year)}")
+        cursor.execute("DROP TABLE Data_v3")
+        self._create_data_view(cursor, years)
 
-        conn.commit()
-        conn.close()
+    def _migrate_to_v5(self, cursor: sqlite3.Cursor):
+        self._create_statistics_tables(cursor)
+        for series_id, in cursor.execute("SELECT series_id FROM Metadata").fetchall():
+            self._refresh_statistics(cursor, series_id)
 
     def query_measurements(
             self, msr: str, msr_attribute: str, start_date: str, end_date: str, raster_size: int = 15,
             raster_unit: str = "min"):
 
-        conn: sqlite3.Connection = sqlite3.connect(self.db_name)
-        cursor: sqlite3.Cursor = conn.cursor()
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
 
         series_id = self.get_hash(msr, msr_attribute, start_date, end_date, raster_size, raster_unit)
-        cursor.execute("SELECT * FROM Data WHERE series_id=?", (series_id,))
-        rows = cursor.fetchall()
-        df = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
+        cursor.execute(*self._data_query(series_id))
+        df = self._decode(series_id, cursor.fetchall())
 
         cursor.execute("SELECT * FROM Metadata WHERE series_id=?", (series_id,))
         rows = cursor.fetchall()
         df_meta = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
 
-        conn.close()
+        cursor.close()
 
         return df, df_meta
 
     def query_all_metadata(self) -> pd.DataFrame:
 
-        conn: sqlite3.Connection = sqlite3.connect(self.db_name)
-        cursor: sqlite3.Cursor = conn.cursor()
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
 
         cursor.execute("SELECT * FROM Metadata")
         rows = cursor.fetchall()
         df = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
 
-        conn.close()
+        cursor.close()
 
         return df
 
+    def query_metadata_page(
+            self, where: str = '', params: list = (), order_by: list = (), offset: int = 0,
+            limit: int = 25) -> tuple:
+        # One page of Metadata with the series statistics plus the number of matching rows. where is a clause with
+        # placeholders, order_by a list of (column, 'asc' | 'desc'); series_id breaks ties so that pages do not overlap.
+        orders = []
+        for column, direction in order_by:
+            if column not in METADATA_COLUMNS + STATISTICS_COLUMNS or direction.lower() not in ('asc', 'desc'):
+                raise ValueError(f"Cannot sort by {column} {direction}")
+            orders.append(f'"{column}" {direction.upper()}')
+        orders.append('series_id')
+        clause = f" WHERE {where}" if where else ''
+
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM ({METADATA_PAGE_SOURCE}){clause}", params)
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT * FROM ({METADATA_PAGE_SOURCE}){clause} ORDER BY {', '.join(orders)} LIMIT ? OFFSET ?",
+            [*params, limit, offset]
+        )
+        df = pd.DataFrame(cursor.fetchall(), columns=[x[0] for x in cursor.description])
+        cursor.close()
+
+        return df, total
+
     def delete_measurements(self, series_id: str):
 
-        conn: sqlite3.Connection = sqlite3.connect(self.db_name)
-        cursor: sqlite3.Cursor = conn.cursor()
+        with self.pool.writer() as conn:
+            cursor: sqlite3.Cursor = conn.cursor()
+            # One primary key range per partition, partitions left empty are dropped as a whole.
+            years = self.partitions(cursor)
+            for year in years:
+                cursor.execute(f"DELETE FROM {partition_name(year)} WHERE series_id=?", (series_id,))
+            empty = [
+                year for year in years
+                if cursor.execute(f"SELECT 1 FROM {partition_name(year)} LIMIT 1").fetchone() is None
+            ]
+            if empty:
+                for year in empty:
+                    cursor.execute(f"DROP TABLE {partition_name(year)}")
+                self._create_data_view(cursor, [year for year in years if year not in empty])
+            cursor.execute("DELETE FROM Rollup WHERE series_id=?", (series_id,))
+            for table in ('MonthStatistics', 'SeriesStatistics', 'DayProfile'):
+                cursor.execute(f"DELETE FROM {table} WHERE series_id=?", (series_id,))
+            cursor.execute("DELETE FROM Metadata WHERE series_id=?", (series_id,))
+        self._invalidate(series_id)
+        self._vacuum_wake.set()
 
-        cursor.execute("DELETE FROM Data WHERE series_id=?", (series_id,))
-        cursor.execute("DELETE FROM Metadata WHERE series_id=?", (series_id,))
+    def drop_partitions(self, before) -> list:
+        # Retention: drops every partition whose year ends at or before `before`, rows of the year that contains
+        # `before` are kept. Returns the dropped years.
+        cutoff = to_epoch(before)
+        with self.pool.writer() as conn:
+            cursor: sqlite3.Cursor = conn.cursor()
+            years = self.partitions(cursor)
+            dropped = [year for year in years if year_bounds(year)[1] <= cutoff]
+            if not dropped:
+                return []
+            for year in dropped:
+                cursor.execute(f"DROP TABLE {partition_name(year)}")
+            self._create_data_view(cursor, [year for year in years if year not in dropped])
+            # Year boundaries are bucket boundaries of every rollup resolution, so whole buckets go with them.
+            cutoff = year_bounds(max(dropped))[1]
+            cursor.execute("DELETE FROM Rollup WHERE bucket < ?", (cutoff,))
+            cursor.execute("DELETE FROM MonthStatistics WHERE month < ?", (cutoff,))
+            cursor.execute("DELETE FROM DayProfile WHERE month < ?", (cutoff,))
+            self._refresh_series_statistics(cursor)
+        self._invalidate()
+        self._vacuum_wake.set()
+        logger.info(f"Dropped partitions {dropped} of {self.db_name}")
 
-        conn.commit()
-        conn.close()
+        return dropped
 
-    def query_data(self, series_id: str, start_date=None, end_date=None) -> pd.DataFrame:
+    def incremental_vacuum(self, pages: int = 1024) -> int:
+        # Returns up to `pages` free pages to the file system and the number of pages freed, 0 once nothing is left
+        # or when the file is not in incremental auto_vacuum mode.
+        with self.pool.writer() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free:
+                # executescript steps the pragma to completion, Connection.execute would free a single page.
+                conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        return min(free, pages)
+
+    def enable_incremental_vacuum(self) -> bool:
+        # Files created before schema version 4 have auto_vacuum off, switching it on takes one full VACUUM.
+        with self.pool.writer() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        return True
+
+    def start_background_vacuum(self, interval: float = 60.0, pages: int = 1024):
+        # Frees pages in steps of `pages`, the writer lock is released between steps so that ingests are not held
+        # up. Runs every interval seconds and right after deletes and dropped partitions.
+        if self._vacuum_thread is not None:
+            return
+        self._vacuum_stop.clear()
+        self._vacuum_thread = threading.Thread(
+            target=self._vacuum_loop, args=(interval, pages), name=f"vacuum-{self.db_name}", daemon=True)
+        self._vacuum_thread.start()
+
+    def _vacuum_loop(self, interval: float, pages: int):
+        while not self._vacuum_stop.is_set():
+            self._vacuum_wake.wait(interval)
+            self._vacuum_wake.clear()
+            try:
+                while not self._vacuum_stop.is_set() and self.incremental_vacuum(pages):
+                    pass
+            except sqlite3.Error as e:
+                logger.warning(f"Incremental vacuum of {self.db_name} failed: {e}")
 
-        conn: sqlite3.Connection = sqlite3.connect(self.db_name)
-        cursor: sqlite3.Cursor = conn.cursor()
+    def stop_background_vacuum(self):
+        if self._vacuum_thread is None:
+            return
+        self._vacuum_stop.set()
+        self._vacuum_wake.set()
+        self._vacuum_thread.join()
+        self._vacuum_thread = None
+
+    def ingest_series(
+            self, chunks, msr: str, msr_attribute: str, start_date: str, end_date: str, raster_size: int = 15,
+            raster_unit: str = "min", batch_size: int = 50_000, **metadata) -> dict:
+        # chunks is an iterable of DataFrames or CSV/Parquet paths with columns date, mean and optionally status.
+        unknown = set(metadata) - set(METADATA_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown metadata fields: {sorted(unknown)}")
+
+        series_id = self.get_hash(msr, msr_attribute, start_date, end_date, raster_size, raster_unit)
+        meta = {
+            **metadata, 'series_id': series_id, 'msr': msr, 'msr_attribute': msr_attribute,
+            'start_date': start_date, 'end_date': end_date, 'raster_size': raster_size, 'raster_unit': raster_unit
+        }
+
+        started = time.perf_counter()
+        n_rows = 0
+        first_date, last_date = None, None
+        with self.pool.writer() as conn:
+            cursor: sqlite3.Cursor = conn.cursor()
+            self._upsert_metadata(cursor, meta)
+
+            partitions = set(self.partitions(cursor))
+            created = False
+            for chunk in self._iter_chunks(chunks, batch_size):
+                status_codes = self._encode_status(cursor, chunk['status'])
+                # Chunks are sorted by date, so the rows of one year are contiguous.
+                years = epoch_years(chunk['date'].to_numpy())
+                bounds = (np.flatnonzero(np.diff(years)) + 1).tolist()
+                for first, stop in zip([0, *bounds], [*bounds, len(chunk)]):
+                    year = int(years[first])
+                    if year not in partitions:
+                        self._create_partition(cursor, year)
+                        partitions.add(year)
+                        created = True
+                    for offset in range(first, stop, batch_size):
+                        batch = slice(offset, min(offset + batch_size, stop))
+                        cursor.executemany(
+                            f"INSERT OR REPLACE INTO {partition_name(year)} (series_id, date, mean, status) "
+                            "VALUES (?, ?, ?, ?)",
+                            zip(repeat(series_id), chunk['date'].iloc[batch].tolist(),
+                                chunk['mean'].iloc[batch].tolist(), status_codes[batch])
+                        )
+                        n_rows += batch.stop - batch.start
+                if len(chunk):
+                    chunk_first, chunk_last = int(chunk['date'].iloc[0]), int(chunk['date'].iloc[-1])
+                    first_date = chunk_first if first_date is None else min(first_date, chunk_first)
+                    last_date = chunk_last if last_date is None else max(last_date, chunk_last)
+            if created:
+                self._create_data_view(cursor, partitions)
+
+            if n_rows:
+                self._refresh_rollups(cursor, series_id, first_date, last_date)
+                self._refresh_statistics(cursor, series_id, first_date, last_date)
+        self._invalidate(series_id)
+
+        seconds = time.perf_counter() - started
+        stats = {
+            'series_id': series_id, 'rows': n_rows, 'seconds': seconds,
+            'rows_per_sec': n_rows / seconds if seconds > 0 else float('inf')
+        }
+        logger.info(
+            f"Ingested {n_rows} rows into {series_id} in {seconds:.2f}s ({stats['rows_per_sec']:.0f} rows/s)")
+
+        return stats
+
+    def _upsert_metadata(self, cursor: sqlite3.Cursor, meta: dict):
+        columns = [column for column in METADATA_COLUMNS if column in meta]
+        cursor.execute("SELECT 1 FROM Metadata WHERE series_id=?", (meta['series_id'],))
+        if cursor.fetchone() is None:
+            cursor.execute(
+                f"INSERT INTO Metadata ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [meta[column] for column in columns]
+            )
+        else:
+            # Existing series only get the fields that were passed, the rest of the row is kept.
+            columns.remove('series_id')
+            cursor.execute(
+                f"UPDATE Metadata SET {', '.join(f'{column} = ?' for column in columns)} WHERE series_id = ?",
+                [meta[column] for column in columns] + [meta['series_id']]
+            )
 
-        query = f"SELECT * FROM Data WHERE series_id = '{series_id}'"
+    def _iter_chunks(self, chunks, batch_size: int):
+        if isinstance(chunks, (pd.DataFrame, str, Path)):
+            chunks = [chunks]
+
+        for chunk in chunks:
+            if isinstance(chunk, (str, Path)):
+                path = Path(chunk)
+                if path.suffix == '.csv':
+                    frames = pd.read_csv(path, chunksize=batch_size)
+                elif path.suffix in ('.parquet', '.pq'):
+                    import pyarrow.parquet as pq
+                    frames = (
+                        batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size)
+                    )
+                else:
+                    raise ValueError(f"Unsupported file type {path.suffix}, expected .csv or .parquet")
+            else:
+                frames = [chunk]
+
+            for frame in frames:
+                yield self._normalise_chunk(frame)
+
+    def _normalise_chunk(self, frame: pd.DataFrame) -> pd.DataFrame:
+        missing = {'date', 'mean'} - set(frame.columns)
+        if missing:
+            raise ValueError(f"Chunk is missing columns {sorted(missing)}")
+
+        chunk = pd.DataFrame({
+            'date': pd.to_datetime(frame['date']),
+            'mean': frame['mean'].astype(float),
+            'status': frame['status'] if 'status' in frame.columns else None
+        })
+        chunk = chunk.dropna(subset=['date']).sort_values('date')
+        chunk['date'] = chunk['date'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        # NaN binds as NULL, so the values can stay floats.
+        return chunk
+
+    def _encode_status(self, cursor: sqlite3.Cursor, statuses: pd.Series) -> list:
+        names = [name for name in statuses.dropna().unique().tolist()]
+        if not set(names) <= set(self._statuses.values()):
+            cursor.executemany("INSERT OR IGNORE INTO Status (status) VALUES (?)", [(name,) for name in names])
+            self._statuses = dict(cursor.execute("SELECT status_code, status FROM Status").fetchall())
+        codes = {name: code for code, name in self._statuses.items()}
+
+        return [None if pd.isna(name) else codes[name] for name in statuses.tolist()]
+
+    def _decode_status(self, codes) -> pd.Categorical:
+        codes = np.nan_to_num(np.asarray(codes, dtype=np.float64)).astype(np.int64)
+        if not set(np.unique(codes[codes > 0]).tolist()) <= self._statuses.keys():
+            self._statuses = dict(self.pool.reader().execute("SELECT status_code, status FROM Status").fetchall())
+
+        table = sorted(self._statuses)
+        lookup = np.full(max(table, default=0) + 1, -1)
+        lookup[table] = np.arange(len(table))
+        return pd.Categorical.from_codes(lookup[codes], categories=[self._statuses[code] for code in table])
+
+    def _columns(self, rows: list) -> dict:
+        # (date, mean, status) rows as arrays: epoch seconds, float64 values with NaN and status codes with 0.
+        if not rows:
+            return {'date': np.empty(0, np.int64), 'mean': np.empty(0), 'status': np.empty(0, np.int64)}
+        dates, means, statuses = zip(*rows)
+        return {
+            'date': np.array(dates, dtype=np.int64),
+            'mean': np.array(means, dtype=np.float64),
+            'status': np.nan_to_num(np.array(statuses, dtype=np.float64)).astype(np.int64)
+        }
+
+    def _decode(self, series_id: str, rows: list) -> pd.DataFrame:
+        # The single place where stored integers become dates, compact values and status categories.
+        columns = self._columns(rows)
+        return pd.DataFrame({
+            'series_id': pd.Categorical.from_codes(np.zeros(len(rows), dtype=np.int8), categories=[series_id]),
+            'date': from_epoch(columns['date']),
+            'mean': columns['mean'].astype(self.value_dtype),
+            'status': self._decode_status(columns['status'])
+        })
+
+    def _refresh_rollups(self, cursor: sqlite3.Cursor, series_id: str, start_date=None, end_date=None):
+        # Recomputes only the buckets that overlap [start_date, end_date], so replaced rows are accounted for.
+        for resolution, (bucket, _) in ROLLUP_RESOLUTIONS.items():
+            query = "DELETE FROM Rollup WHERE series_id = ? AND resolution = ?"
+            source = f"SELECT ?, ?, {bucket} AS bucket, COUNT(mean), SUM(mean), MIN(mean), MAX(mean) " \
+                "FROM Data WHERE series_id = ?"
+            params = [series_id, resolution]
+            if start_date is not None and end_date is not None:
+                lower, upper = self._bucket_bounds(resolution, start_date, end_date)
+                query += " AND bucket >= ? AND bucket < ?"
+                source += " AND date >= ? AND date < ?"
+                params += [lower, upper]
+
+            cursor.execute(query, params)
+            cursor.execute(
+                f"INSERT INTO Rollup (series_id, resolution, bucket, count, sum, min, max) {source} GROUP BY bucket",
+                [series_id, resolution, series_id] + params[2:]
+            )
+
+    def _bucket_bounds(self, resolution: str, start_date, end_date):
+        start, end = from_epoch([to_epoch(start_date), to_epoch(end_date)])
+        if resolution == 'hour':
+            lower, upper = start.floor('h'), end.floor('h') + pd.Timedelta(hours=1)
+        elif resolution == 'day':
+            lower, upper = start.floor('D'), end.floor('D') + pd.Timedelta(days=1)
+        else:
+            lower, upper = start.to_period('M').start_time, end.to_period('M').start_time + pd.offsets.MonthBegin()
+        return to_epoch(lower), to_epoch(upper)
+
+    def rebuild_rollups(self, series_ids: list = None):
+        with self.pool.writer() as conn:
+            cursor: sqlite3.Cursor = conn.cursor()
+            if series_ids is None:
+                series_ids = [row[0] for row in cursor.execute("SELECT series_id FROM Metadata").fetchall()]
+            for series_id in series_ids:
+                self._refresh_rollups(cursor, series_id)
+        if self.shared_cache is not None:
+            # Prepared line data of other processes is read from the rollups.
+            for series_id in series_ids:
+                self.shared_cache.invalidate(series_id)
+
+    def _refresh_statistics(self, cursor: sqlite3.Cursor, series_id: str, start_date=None, end_date=None):
+        # Like _refresh_rollups: only the months that overlap [start_date, end_date] are recomputed from Data.
+        cursor.execute("SELECT raster_size, raster_unit FROM Metadata WHERE series_id = ?", (series_id,))
+        step = raster_seconds(*cursor.fetchone())
+        month = ROLLUP_RESOLUTIONS['month'][0]
+
+        condition, params = "series_id = ?", [series_id]
+        source_condition, source_params = "series_id = ?", [series_id]
+        if start_date is not None and end_date is not None:
+            lower, upper = self._bucket_bounds('month', start_date, end_date)
+            condition += " AND month >= ? AND month < ?"
+            source_condition += " AND date >= ? AND date < ?"
+            params += [lower, upper]
+            source_params += [lower, upper]
+
+        cursor.execute(f"DELETE FROM MonthStatistics WHERE {condition}", params)
+        cursor.execute(f'''
+            INSERT INTO MonthStatistics (series_id, month, count, null_count, sum, min, max)
+            SELECT ?, {month} AS month, COUNT(*), COUNT(*) - COUNT(mean), SUM(mean), MIN(mean), MAX(mean)
+            FROM Data WHERE {source_condition} GROUP BY month
+        ''', [series_id, *source_params])
+        cursor.execute(f"DELETE FROM DayProfile WHERE {condition}", params)
+        cursor.execute(f'''
+            INSERT INTO DayProfile (series_id, month, slot, count, sum)
+            SELECT ?, {month} AS month, date % 86400 / ? * ? AS slot, COUNT(mean), SUM(mean)
+            FROM Data WHERE {source_condition} AND mean IS NOT NULL GROUP BY month, slot
+        ''', [series_id, step, step, *source_params])
+        self._refresh_series_statistics(cursor, series_id)
+
+    def _refresh_series_statistics(self, cursor: sqlite3.Cursor, series_id: str = None):
+        # Totals per series are summed up from the months, all series without series_id.
+        condition, params = ("WHERE series_id = ?", [series_id]) if series_id is not None else ('', [])
+        cursor.execute(f"DELETE FROM SeriesStatistics {condition}", params)
+        cursor.execute(f'''
+            INSERT INTO SeriesStatistics (series_id, rows, null_ratio, min, max, mean)
+            SELECT series_id, SUM(count), CAST(SUM(null_count) AS REAL) / SUM(count), MIN(min), MAX(max),
+                SUM(sum) / (SUM(count) - SUM(null_count))
+            FROM MonthStatistics {condition} GROUP BY series_id
+        ''', params)
+
+    def rebuild_statistics(self, series_ids: list = None):
+        with self.pool.writer() as conn:
+            cursor: sqlite3.Cursor = conn.cursor()
+            if series_ids is None:
+                series_ids = [row[0] for row in cursor.execute("SELECT series_id FROM Metadata").fetchall()]
+            for series_id in series_ids:
+                self._refresh_statistics(cursor, series_id)
+        for series_id in series_ids:
+            self._invalidate(series_id)
+
+    def query_statistics(self, series_id: str, start_date=None, end_date=None) -> pd.DataFrame:
+        # Monthly statistics of the months that overlap the range, read without touching Data.
+        query = "SELECT month, count, null_count, min, max, sum FROM MonthStatistics WHERE series_id = ?"
+        params = [series_id]
         if start_date:
-            query += f" AND date >= '{start_date}'"
+            query += " AND month >= ?"
+            params.append(self._bucket_bounds('month', start_date, start_date)[0])
         if end_date:
-            query += f" AND date <= '{end_date}'"
+            query += " AND month <= ?"
+            params.append(to_epoch(end_date))
+        query += " ORDER BY month"
 
-        cursor.execute(query)
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        cursor.execute(query, params)
+        df = pd.DataFrame(cursor.fetchall(), columns=[x[0] for x in cursor.description])
+        cursor.close()
+
+        df['month'] = from_epoch(df['month'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['null_ratio'] = df['null_count'] / df['count']
+            df['mean'] = df['sum'] / (df['count'] - df['null_count'])
+        return df.drop(columns='sum')
+
+    def query_average_day(self, series_id: str, start_date=None, end_date=None) -> pd.Series:
+        # Mean per raster slot of the day, shaped like DaySlotAccumulator.average_day. Months that lie entirely
+        # in the range come from DayProfile, only the partial months at either end are aggregated from Data.
+        step = self.raster_step([series_id])
+        start = to_epoch(start_date) if start_date else None
+        end = to_epoch(end_date) if end_date else None
+        # [lower, upper) are the whole months in the range, end is inclusive.
+        lower, upper = None, None
+        if start is not None:
+            month_start, next_month = self._bucket_bounds('month', start, start)
+            lower = start if start == month_start else next_month
+        if end is not None:
+            upper = self._bucket_bounds('month', end + 1, end + 1)[0]
+
+        raw = f"SELECT date % 86400 / {step} * {step} AS slot, COUNT(mean) AS count, SUM(mean) AS sum FROM Data " \
+            "WHERE series_id = ? AND mean IS NOT NULL"
+        parts, params = [], []
+        if lower is not None and upper is not None and lower >= upper:
+            # No whole month in the range.
+            parts.append(f"{raw} AND date >= ? AND date <= ? GROUP BY slot")
+            params += [series_id, start, end]
+        else:
+            profile, profile_params = "SELECT slot, count, sum FROM DayProfile WHERE series_id = ?", [series_id]
+            if lower is not None:
+                profile += " AND month >= ?"
+                profile_params.append(lower)
+                parts.append(f"{raw} AND date >= ? AND date < ? GROUP BY slot")
+                params += [series_id, start, lower]
+            if upper is not None:
+                profile += " AND month < ?"
+                profile_params.append(upper)
+                parts.append(f"{raw} AND date >= ? AND date <= ? GROUP BY slot")
+                params += [series_id, upper, end]
+            parts.append(profile)
+            params += profile_params
+
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        cursor.execute(
+            f"SELECT slot, SUM(sum) / SUM(count) FROM ({' UNION ALL '.join(parts)}) "
+            "GROUP BY slot HAVING SUM(count) > 0 ORDER BY slot", params
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+
+        slots, means = zip(*rows) if rows else ((), ())
+        return pd.Series(
+            np.array(means, dtype=np.float64), index=pd.Index(np.array(slots, dtype=np.float64) / 3600, name='hour'),
+            name='mean'
+        )
+
+    def plan_rollup(self, resolution_seconds: float):
+        # Coarsest rollup whose buckets are not wider than the requested resolution, None means raw rows.
+        chosen = None
+        for resolution, (_, width) in ROLLUP_RESOLUTIONS.items():
+            if width <= resolution_seconds:
+                chosen = resolution
+        return chosen
+
+    def query_rollup(
+            self, series_id: str, start_date=None, end_date=None, resolution_seconds: float = 0) -> pd.DataFrame:
+        resolution = self.plan_rollup(resolution_seconds)
+        if resolution is None:
+            df = self.query_series(series_id, start_date, end_date)
+            return pd.DataFrame({
+                'date': df['date'], 'mean': df['mean'], 'min': df['mean'], 'max': df['mean'],
+                'count': df['mean'].notna().astype(int)
+            })
+
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+
+        query = "SELECT bucket AS date, sum / count AS mean, min, max, count FROM Rollup " \
+            "WHERE series_id = ? AND resolution = ?"
+        params = [series_id, resolution]
+        if start_date:
+            # Starts at the bucket that contains start_date instead of the first bucket after it.
+            query += " AND bucket >= ?"
+            params.append(self._bucket_bounds(resolution, start_date, start_date)[0])
+        if end_date:
+            query += " AND bucket <= ?"
+            params.append(to_epoch(end_date))
+        query += " ORDER BY bucket"
+
+        cursor.execute(query, params)
         rows = cursor.fetchall()
         df = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
 
-        conn.close()
+        cursor.close()
 
+        df['date'] = from_epoch(df['date'])
         return df
 
+    def query_day_slots(self, series_id: str, start_date=None, end_date=None, slot_seconds: int = 3600):
+        # Day x time-of-day aggregation done by SQLite. For whole-hour slots the hours that lie entirely in the
+        # range are summed up from the hourly rollup, only the partial hours at either end are read from Data.
+        start = to_epoch(start_date) if start_date else None
+        end = to_epoch(end_date) if end_date else None
+        raw = "SELECT date / 86400 AS day, (date % 86400) / ? AS slot, SUM(mean) AS sum, COUNT(mean) AS count " \
+            "FROM Data WHERE series_id = ?"
+        # [lower, upper) are the whole hours in the range, end is inclusive.
+        lower = None if start is None else -(-start // 3600) * 3600
+        upper = None if end is None else (end + 1) // 3600 * 3600
+
+        parts, params = [], []
+        if slot_seconds % 3600 or (lower is not None and upper is not None and lower >= upper):
+            part, part_params = raw, [slot_seconds, series_id]
+            if start is not None:
+                part += " AND date >= ?"
+                part_params.append(start)
+            if end is not None:
+                part += " AND date <= ?"
+                part_params.append(end)
+            parts.append(f"{part} GROUP BY day, slot")
+            params += part_params
+        else:
+            rollup = "SELECT bucket / 86400 AS day, (bucket % 86400) / ? AS slot, sum, count FROM Rollup " \
+                "WHERE series_id = ? AND resolution = 'hour'"
+            rollup_params = [slot_seconds, series_id]
+            if lower is not None:
+                rollup += " AND bucket >= ?"
+                rollup_params.append(lower)
+                if start < lower:
+                    parts.append(f"{raw} AND date >= ? AND date < ? GROUP BY day, slot")
+                    params += [slot_seconds, series_id, start, lower]
+            if upper is not None:
+                rollup += " AND bucket < ?"
+                rollup_params.append(upper)
+                if upper <= end:
+                    parts.append(f"{raw} AND date >= ? AND date <= ? GROUP BY day, slot")
+                    params += [slot_seconds, series_id, upper, end]
+            parts.append(rollup)
+            params += rollup_params
+
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        cursor.execute(
+            f"SELECT day, slot, SUM(sum), SUM(count) FROM ({' UNION ALL '.join(parts)}) GROUP BY day, slot", params)
+        rows = cursor.fetchall()
+        cursor.close()
+
+        accumulator = DaySlotAccumulator(slot_seconds)
+        if rows:
+            days, slots, sums, counts = (np.array(column) for column in zip(*rows))
+            valid = counts > 0
+            accumulator.add_aggregates(
+                days[valid], slots[valid], sums[valid].astype(np.float64), counts[valid].astype(np.float64))
+        return accumulator
+
+    def query_data(self, series_id: str, start_date=None, end_date=None) -> pd.DataFrame:
+
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+
+        cursor.execute(*self._data_query(series_id, start_date, end_date))
+        rows = cursor.fetchall()
+
+        cursor.close()
+
+        return self._decode(series_id, rows)
+
+    def _data_query(self, series_id: str, start_date=None, end_date=None):
+        query = "SELECT date, mean, status FROM Data WHERE series_id = ?"
+        params = [series_id]
+        if start_date:
+            query += " AND date >= ?"
+            params.append(to_epoch(start_date))
+        if end_date:
+            query += " AND date <= ?"
+            params.append(to_epoch(end_date))
+        query += " ORDER BY date"
+
+        return query, params
+
+    def iter_query(self, query: str, params=(), chunk_size: int = 100_000, as_numpy: bool = False):
+        # Yields the result in chunks of at most chunk_size rows, either as DataFrames or as dicts of column arrays.
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        try:
+            cursor.execute(query, params)
+            columns = [x[0] for x in cursor.description]
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if as_numpy:
+                    yield {column: np.array(values) for column, values in zip(columns, zip(*rows))}
+                else:
+                    yield pd.DataFrame(rows, columns=columns)
+        finally:
+            cursor.close()
+
+    def iter_query_data(
+            self, series_id: str, start_date=None, end_date=None, chunk_size: int = 100_000, as_numpy: bool = False):
+        # NumPy chunks keep the stored representation: epoch seconds and status codes.
+        query, params = self._data_query(series_id, start_date, end_date)
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield self._columns(rows) if as_numpy else self._decode(series_id, rows)
+        finally:
+            cursor.close()
+
+    def iter_query_pairs(
+            self, series_id_x: str, series_id_y: str, start_date=None, end_date=None, chunk_size: int = 100_000):
+        # (x, y) float64 arrays of the dates where both series have a value. Both sides live in the partition of
+        # the same year, so each pair is a range scan of x plus a primary key seek of y and nothing is aligned.
+        start = to_epoch(start_date) if start_date else None
+        end = to_epoch(end_date) if end_date else None
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        years = [
+            year for year in self.partitions(cursor)
+            if (start is None or year_bounds(year)[1] > start) and (end is None or year_bounds(year)[0] <= end)
+        ]
+        if not years:
+            cursor.close()
+            return
+
+        condition = "a.series_id = ?1 AND a.mean IS NOT NULL AND b.mean IS NOT NULL"
+        params = [series_id_x, series_id_y]
+        if start is not None:
+            condition += f" AND a.date >= ?{len(params) + 1}"
+            params.append(start)
+        if end is not None:
+            condition += f" AND a.date <= ?{len(params) + 1}"
+            params.append(end)
+        query = ' UNION ALL '.join(
+            f"SELECT a.mean, b.mean FROM {partition_name(year)} a JOIN {partition_name(year)} b "
+            f"ON b.series_id = ?2 AND b.date = a.date WHERE {condition}" for year in years
+        )
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                pairs = np.array(rows, dtype=np.float64)
+                yield pairs[:, 0], pairs[:, 1]
+        finally:
+            cursor.close()
+
+    def iter_query_measurements(
+            self, msr: str, msr_attribute: str, start_date: str, end_date: str, raster_size: int = 15,
+            raster_unit: str = "min", chunk_size: int = 100_000):
+        # Counterpart of query_measurements: the metadata frame and a generator over the data chunks.
+        series_id = self.get_hash(msr, msr_attribute, start_date, end_date, raster_size, raster_unit)
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        cursor.execute("SELECT * FROM Metadata WHERE series_id=?", (series_id,))
+        rows = cursor.fetchall()
+        df_meta = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
+        cursor.close()
+
+        return self.iter_query_data(series_id, chunk_size=chunk_size), df_meta
+
+    def iter_execute_query(self, query: str, chunk_size: int = 100_000, as_numpy: bool = False):
+        return self.iter_query(query, chunk_size=chunk_size, as_numpy=as_numpy)
+
+    def _invalidate(self, series_id: str = None):
+        self.cache.invalidate(series_id)
+        if self.shared_cache is not None:
+            self.shared_cache.invalidate(series_id)
+
+    def query_series(self, series_id: str, start_date=None, end_date=None) -> pd.DataFrame:
+        # Like query_data without the series_id column, served from the range cache where possible.
+        return self.cache.get(series_id, start_date, end_date, self._fetch_series)
+
+    def _fetch_series(self, series_id: str, start_date, end_date) -> pd.DataFrame:
+        return self.query_data(series_id, start_date, end_date)[['date', 'mean', 'status']]
+
     def query_multiple(self, series_ids: list):
-        meta_all = self.query_all_metadata()
-
-        for i, series_id in enumerate(series_ids):
-            df_series = self.query_data(series_id)
-            df_series['date'] = pd.to_datetime(df_series['date'], format='%Y-%m-%d %H:%M:%S')
-            df_series.rename(columns={'mean': f'm_{i}'}, inplace=True)
-            if i == 0:
-                df = df_series[['date', f'm_{i}']]
-                meta = meta_all[meta_all['series_id'] == series_id].copy()
-                meta['name'] = f'm_{i}'
-            else:
-                df = pd.merge(df, df_series[['date', f'm_{i}']], on='date', how='outer')
-                meta_row = meta_all[meta_all['series_id'] == series_id].copy()
-                meta_row['name'] = f'm_{i}'
-                meta = pd.concat([meta, meta_row])
+        names = [f'm_{i}' for i in range(len(series_ids))]
+        df = self.query_aligned(series_ids, names=names)
+
+        meta = self.query_all_metadata().set_index('series_id').loc[series_ids].reset_index()
+        meta['name'] = names
 
         return df, meta
 
+    def query_aligned(self, series_ids: list, start_date=None, end_date=None, names: list = None) -> pd.DataFrame:
+        # Fetches all series in one pass and places every value on the shared raster grid by index arithmetic,
+        # the result has one date column plus one float column per requested series.
+        unique_ids = list(dict.fromkeys(series_ids))
+        placeholders = ', '.join('?' * len(unique_ids))
+
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+
+        query = f"SELECT series_id, date, mean FROM Data WHERE series_id IN ({placeholders})"
+        params = list(unique_ids)
+        if start_date:
+            query += " AND date >= ?"
+            params.append(to_epoch(start_date))
+        if end_date:
+            query += " AND date <= ?"
+            params.append(to_epoch(end_date))
+
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        cursor.close()
+
+        if rows:
+            series_col, date_col, mean_col = zip(*rows)
+            codes = pd.Categorical(series_col, categories=unique_ids).codes
+            seconds = np.array(date_col, dtype=np.int64)
+            values = np.array(mean_col, dtype=np.float64)
+        else:
+            codes, seconds, values = np.empty(0, np.int8), np.empty(0, np.int64), np.empty(0)
+
+        return self._align(series_ids, names, codes, seconds, values)
+
+    def align_frames(self, frames: dict, series_ids: list, names: list = None) -> pd.DataFrame:
+        # Same grid as query_aligned for series that were already read, e.g. concurrently through query_series.
+        unique_ids = list(dict.fromkeys(series_ids))
+        parts = [frames[series_id] for series_id in unique_ids]
+        codes = np.concatenate([np.full(len(part), code, dtype=np.int64) for code, part in enumerate(parts)])
+        seconds = np.concatenate([part['date'].to_numpy().astype('datetime64[s]').astype(np.int64) for part in parts])
+        values = np.concatenate([part['mean'].to_numpy(dtype=np.float64) for part in parts])
+
+        return self._align(series_ids, names, codes, seconds, values)
+
+    def date_range(self, series_ids: list) -> tuple:
+        # First and last stored date of the series as epoch seconds, (None, None) without data. MIN and MAX of one
+        # series in one partition are single seeks, the same aggregate over the Data view would read every row.
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        years = self.partitions(cursor)
+        if not years or not series_ids:
+            cursor.close()
+            return None, None
+        bounds = ' UNION ALL '.join(
+            f"SELECT (SELECT MIN(date) FROM {partition_name(year)} WHERE series_id = ?{i}) AS first, "
+            f"(SELECT MAX(date) FROM {partition_name(year)} WHERE series_id = ?{i}) AS last"
+            for year in years for i in range(1, len(series_ids) + 1)
+        )
+        cursor.execute(f"SELECT MIN(first), MAX(last) FROM ({bounds})", list(series_ids))
+        first, last = cursor.fetchone()
+        cursor.close()
+
+        return first, last
+
+    def raster_step(self, series_ids: list) -> int:
+        # Greatest common raster of the series in seconds, the step of a grid that holds all of them.
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
+        cursor.execute(
+            f"SELECT raster_size, raster_unit FROM Metadata WHERE series_id IN ({', '.join('?' * len(series_ids))})",
+            list(series_ids)
+        )
+        step = 0
+        for raster_size, raster_unit in cursor.fetchall():
+            step = math.gcd(step, raster_seconds(raster_size, raster_unit))
+        cursor.close()
+
+        return step or 1
+
+    def _align(self, series_ids: list, names: list, codes, seconds, values) -> pd.DataFrame:
+        # codes index into the unique series_ids, seconds are epoch seconds of every value.
+        names = list(names) if names is not None else list(series_ids)
+        unique_ids = list(dict.fromkeys(series_ids))
+        if len(seconds) == 0:
+            return pd.DataFrame({
+                'date': pd.Series(dtype='datetime64[ns]'), **{name: pd.Series(dtype=self.value_dtype) for name in names}
+            })
+
+        step = self.raster_step(unique_ids)
+        origin = seconds.min()
+        offsets = seconds - origin
+        if np.all(offsets % step == 0):
+            # Every value sits on the shared raster, its row follows from the offset alone.
+            slots = offsets // step
+            occupied = np.zeros(slots.max() + 1, dtype=bool)
+            occupied[slots] = True
+            slot_index = np.flatnonzero(occupied)
+            dates = origin + slot_index * step
+            slots = np.cumsum(occupied)[slots] - 1
+        else:
+            # Values off the declared raster keep their own timestamps, one row per distinct date.
+            dates = np.unique(seconds)
+            slots = np.searchsorted(dates, seconds)
+
+        filled = np.zeros((len(dates), len(unique_ids)), dtype=bool)
+        filled[slots, codes] = True
+        if np.count_nonzero(filled) != len(seconds):
+            raise ValueError("Series have more than one value for the same date")
+        grid = np.full((len(dates), len(unique_ids)), np.nan, dtype=self.value_dtype)
+        grid[slots, codes] = values
+
+        columns = {'date': from_epoch(dates)}
+        for name, series_id in zip(names, series_ids):
+            columns[name] = grid[:, unique_ids.index(series_id)]
+
+        return pd.DataFrame(columns)
+
     def execute_query(self, query: str) -> pd.DataFrame:
-        conn: sqlite3.Connection = sqlite3.connect(self.db_name)
-        cursor: sqlite3.Cursor = conn.cursor()
+        cursor: sqlite3.Cursor = self.pool.reader().cursor()
 
         cursor.execute(query)
         rows = cursor.fetchall()
         df = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
 
-        conn.close()
+        cursor.close()
 
         return df
 
@@ -153,24 +1229,28 @@ class PlantDataBase:
 
     def drop_tables(self):
 
-        conn: sqlite3.Connection = sqlite3.connect(self.db_name)
-        cursor: sqlite3.Cursor = conn.cursor()
-
-        cursor.execute("DROP TABLE Data")
-        cursor.execute("DROP TABLE Metadata")
-
-        conn.commit()
-        conn.close()
+        with self.pool.writer() as conn:
+            cursor: sqlite3.Cursor = conn.cursor()
+            cursor.execute("DROP TABLE Rollup")
+            for table in ('MonthStatistics', 'SeriesStatistics', 'DayProfile'):
+                cursor.execute(f"DROP TABLE {table}")
+            cursor.execute("DROP VIEW Data")
+            for year in self.partitions(cursor):
+                cursor.execute(f"DROP TABLE {partition_name(year)}")
+            cursor.execute("DROP TABLE Status")
+            cursor.execute("DROP TABLE Metadata")
+        self._statuses = {}
+        self._invalidate()
 
 
 if __name__ == '__main__':
-    logger: logging.Logger = logging.getLogger(__name__)
     logging.basicConfig(level=logging.WARNING)
     logger.info('Started')
 
-    db = PlantDataBase('db/test.db')
+    db = PlantDataBase('db/test.db').open()
     db.create_tables()
     meta_all = db.query_all_metadata()
     df = db.query_data(meta_all['series_id'][0], '2023-01-01', '2023-12-31')
     df, df_meta = db.query_measurements('10BGA.80.01', 'ISTWERT', '2016-01-01', '2024-01-01')
     print(len(df), len(df_meta))
+    db.close()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+DOWNSAMPLE_MODES = ('lttb', 'minmax')
+
+
+def _as_float(x) -> np.ndarray:
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+        # Relative to the first sample so the float64 conversion keeps sub-second precision.
+        return (x - x[0]).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: keeps the point of each bucket that spans the largest triangle with the
+    # point picked in the previous bucket and the mean of the next bucket.
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Bucket means for all buckets at once, the trailing entry is the last point of the series.
+    counts = np.maximum(ends - starts, 1)
+    mean_x = np.append(np.add.reduceat(x[:-1], starts) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], starts) / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        ax, ay = x[a], y[a]
+        cx, cy = mean_x[i + 1], mean_y[i + 1]
+        area = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def min_max_indices(y, n_out: int) -> np.ndarray:
+    # Keeps the minimum and the maximum of every bucket, so no peak disappears from the plot.
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    n_buckets = n_out // 2
+    if n_out >= n or n_buckets < 1:
+        return np.arange(n)
+
+    bucket_size = -(-n // n_buckets)
+    padded = np.full(n_buckets * bucket_size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, bucket_size)
+
+    offsets = np.arange(n_buckets) * bucket_size
+    argmin = np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1) + offsets
+    argmax = np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1) + offsets
+
+    indices = np.concatenate([[0, n - 1], argmin, argmax])
+    return np.unique(indices[indices < n])
+
+
+def downsample(df: pd.DataFrame, x: str, y: str, n_out: int = 2000, mode: str = 'lttb') -> pd.DataFrame:
+    if mode not in DOWNSAMPLE_MODES:
+        raise ValueError(f"mode must be one of {DOWNSAMPLE_MODES}")
+
+    df = df[df[y].notna()]
+    if len(df) <= n_out:
+        return df
+
+    if mode == 'lttb':
+        indices = lttb_indices(df[x].to_numpy(), df[y].to_numpy(), n_out)
+    else:
+        indices = min_max_indices(df[y].to_numpy(), n_out)
+
+    return df.iloc[indices]
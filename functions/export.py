@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+from db import PlantDataBase, to_epoch
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+EXPORT_LAYOUTS = ('long', 'wide')
+
+
+def _open_writer(path: str, schema: pa.Schema, fmt: str):
+    if fmt == 'parquet':
+        return pq.ParquetWriter(path, schema, compression='zstd')
+    if fmt == 'arrow':
+        return pa.ipc.new_file(path, schema)
+    raise ValueError(f"Unknown export format {fmt}, expected parquet or arrow")
+
+
+def _status_dictionary(db: PlantDataBase):
+    # Fixed for the whole file, IPC files cannot replace a dictionary between batches.
+    statuses = dict(db.pool.reader().execute("SELECT status_code, status FROM Status").fetchall())
+    codes = sorted(statuses)
+    lookup = np.full(max(codes, default=0) + 1, -1, dtype=np.int32)
+    lookup[codes] = np.arange(len(codes), dtype=np.int32)
+    return lookup, pa.array([statuses[code] for code in codes], pa.string())
+
+
+def _long_batches(db: PlantDataBase, series_ids: list, start_date, end_date, chunk_size: int, schema: pa.Schema):
+    # One batch per fetched chunk, straight from the stored integers: no DataFrame, no per-row Python objects.
+    lookup, statuses = _status_dictionary(db)
+    series = pa.array(series_ids, pa.string())
+    for position, series_id in enumerate(series_ids):
+        for chunk in db.iter_query_data(series_id, start_date, end_date, chunk_size=chunk_size, as_numpy=True):
+            n = len(chunk['date'])
+            codes = chunk['status']
+            known = (codes > 0) & (codes < len(lookup))
+            status_index = np.where(known, lookup[np.where(known, codes, 0)], -1)
+            yield pa.record_batch([
+                pa.DictionaryArray.from_arrays(pa.array(np.full(n, position, dtype=np.int32)), series),
+                pa.array(chunk['date'], pa.timestamp('s')),
+                pa.array(chunk['mean'].astype(db.value_dtype)),
+                pa.DictionaryArray.from_arrays(pa.array(status_index, mask=status_index < 0), statuses)
+            ], schema=schema)
+
+
+def _wide_batches(db: PlantDataBase, series_ids: list, names: list, start_date, end_date, chunk_size: int,
+                  schema: pa.Schema):
+    # Aligned windows of chunk_size raster slots, so memory stays bounded however long the range is.
+    first, last = db.date_range(series_ids)
+    if first is None:
+        return
+    if start_date:
+        first = max(first, to_epoch(start_date))
+    if end_date:
+        last = min(last, to_epoch(end_date))
+
+    window = chunk_size * db.raster_step(series_ids)
+    for window_start in range(first, last + 1, window):
+        window_end = min(window_start + window - 1, last)
+        df = db.query_aligned(series_ids, window_start, window_end, names=names)
+        if len(df):
+            yield pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def export_series(
+        db: PlantDataBase, path: str, series_ids: list, start_date=None, end_date=None, layout: str = 'long',
+        fmt: str = None, names: list = None, chunk_size: int = 100_000) -> dict:
+    # Streams the series to a Parquet or Arrow IPC file. long: one row per (series, date) with series_id, date,
+    # mean and status. wide: one row per raster slot and one value column per series (names, default series_id).
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"layout must be one of {EXPORT_LAYOUTS}")
+    if not series_ids:
+        raise ValueError("No series selected for export")
+    fmt = fmt or EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    started = time.perf_counter()
+
+    value_type = pa.from_numpy_dtype(db.value_dtype)
+    if layout == 'long':
+        schema = pa.schema([
+            ('series_id', pa.dictionary(pa.int32(), pa.string())), ('date', pa.timestamp('s')), ('mean', value_type),
+            ('status', pa.dictionary(pa.int32(), pa.string()))
+        ])
+        batches = _long_batches(db, list(series_ids), start_date, end_date, chunk_size, schema)
+    else:
+        names = list(names) if names is not None else list(series_ids)
+        schema = pa.schema([('date', pa.timestamp('ns')), *[(name, value_type) for name in names]])
+        batches = _wide_batches(db, list(series_ids), names, start_date, end_date, chunk_size, schema)
+
+    rows = 0
+    writer = _open_writer(path, schema, fmt)
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+
+    stats = {'path': path, 'rows': rows, 'bytes': os.path.getsize(path), 'seconds': time.perf_counter() - started}
+    logger.info(f"Exported {len(series_ids)} series ({layout}) to {path}: {rows} rows in {stats['seconds']:.2f}s")
+    return stats
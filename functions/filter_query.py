@@ -0,0 +1,65 @@
+import re
+
+# DataTable filter operators -> SQL comparison, the 's'/'i' prefixes of the case-sensitive and -insensitive
+# variants are stripped before the lookup.
+COMPARISONS = {
+    'eq': '=', '=': '=', 'ne': '!=', '!=': '!=', 'lt': '<', '<': '<', 'le': '<=', '<=': '<=',
+    'gt': '>', '>': '>', 'ge': '>=', '>=': '>=',
+}
+PATTERN_OPERATORS = ('contains', 'datestartswith')
+FILTER_PART = re.compile(r'^\{(?P<column>[^}]+)\}\s+(?P<operator>\S+)(?:\s+(?P<value>.*))?$')
+
+
+def _unquote(value: str) -> str:
+    # Values stay text, SQLite applies the column affinity, so "15" compares as a number against raster_size.
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+        return value[1:-1].replace(f'\\{value[0]}', value[0])
+    return value
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def filter_to_sql(filter_query: str, columns: list) -> tuple:
+    # Translates a DataTable filter query such as "{msr} icontains SYN && {raster_size} s= 15" into a WHERE
+    # clause with placeholders and its parameters. Only known columns and operators are accepted.
+    conditions, params = [], []
+    for part in (filter_query or '').split(' && '):
+        part = part.strip()
+        if not part:
+            continue
+        match = FILTER_PART.match(part)
+        if match is None:
+            raise ValueError(f"Unsupported filter expression: {part}")
+
+        column, operator, value = match['column'], match['operator'], match['value']
+        if column not in columns:
+            raise ValueError(f"Unknown filter column {column}")
+        if value is None:
+            raise ValueError(f"Filter expression {part} has no value")
+
+        case_insensitive = operator.startswith('i')
+        if operator[0] in 'si' and operator[1:] in (*COMPARISONS, *PATTERN_OPERATORS):
+            operator = operator[1:]
+        value = _unquote(value)
+
+        if operator == 'contains':
+            if case_insensitive:
+                conditions.append(f'"{column}" LIKE ? ESCAPE \'\\\'')
+                params.append(f"%{_escape_like(value)}%")
+            else:
+                conditions.append(f'instr("{column}", ?) > 0')
+                params.append(value)
+        elif operator == 'datestartswith':
+            conditions.append(f'"{column}" LIKE ? ESCAPE \'\\\'')
+            params.append(f"{_escape_like(value)}%")
+        elif operator in COMPARISONS:
+            collate = ' COLLATE NOCASE' if case_insensitive else ''
+            conditions.append(f'"{column}" {COMPARISONS[operator]} ?{collate}')
+            params.append(value)
+        else:
+            raise ValueError(f"Unsupported filter operator {operator}")
+
+    return ' AND '.join(conditions), params
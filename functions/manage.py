@@ -0,0 +1,226 @@
+import json
+import logging
+import argparse
+from datetime import date
+
+from db import PlantDataBase, SCHEMA_VERSION
+
+
+def migrate(args):
+    for db_name in args.db_names:
+        db = PlantDataBase(db_name)
+        before = db.get_schema_version()
+        after = db.migrate()
+        db.close()
+        print(f"{db_name}: schema version {before} -> {after}")
+
+
+def shared_cache(args):
+    # Writers invalidate the cache of running dashboard workers, see wsgi.py.
+    if not args.shared_cache:
+        return None
+    from cache import SharedCache
+    return SharedCache(args.shared_cache)
+
+
+def ingest(args):
+    metadata = dict(item.split('=', 1) for item in args.meta)
+    with PlantDataBase(args.db_name, shared_cache=shared_cache(args)) as db:
+        db.create_tables()
+        stats = db.ingest_series(
+            args.files, args.msr, args.msr_attribute, args.start_date, args.end_date, args.raster_size,
+            args.raster_unit, batch_size=args.batch_size, **metadata
+        )
+    print(f"{stats['series_id']}: {stats['rows']} rows in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/s)")
+
+
+def rebuild_rollups(args):
+    with PlantDataBase(args.db_name, shared_cache=shared_cache(args)) as db:
+        db.rebuild_rollups(args.series_ids or None)
+
+
+def rebuild_statistics(args):
+    with PlantDataBase(args.db_name, shared_cache=shared_cache(args)) as db:
+        db.rebuild_statistics(args.series_ids or None)
+
+
+def vacuum_free_pages(db: PlantDataBase, pages: int = 1024) -> int:
+    freed = 0
+    while True:
+        step = db.incremental_vacuum(pages)
+        if not step:
+            return freed
+        freed += step
+
+
+def retention(args):
+    before = args.before or f"{date.today().year - args.keep_years + 1}-01-01"
+    with PlantDataBase(args.db_name, shared_cache=shared_cache(args)) as db:
+        dropped = db.drop_partitions(before)
+        freed = vacuum_free_pages(db)
+    print(f"{args.db_name}: dropped partitions {dropped or 'none'} before {before}, freed {freed} pages")
+
+
+def vacuum(args):
+    with PlantDataBase(args.db_name) as db:
+        if db.enable_incremental_vacuum():
+            print(f"{args.db_name}: switched to incremental auto_vacuum")
+        print(f"{args.db_name}: freed {vacuum_free_pages(db)} pages")
+
+
+def convert_columnar(args):
+    from columnar import ColumnarPlantDataBase, compare_backends
+
+    with ColumnarPlantDataBase(args.db_name, args.store_dir) as db:
+        series_ids = db.convert_from_sqlite(args.series_ids or None)
+        print(f"Converted {len(series_ids)} series to {db.store_dir}")
+        if args.verify:
+            with PlantDataBase(args.db_name) as reference:
+                mismatches = compare_backends(reference, db, series_ids)
+            for mismatch in mismatches:
+                print(mismatch)
+            print(f"Parity check: {len(mismatches)} mismatches")
+
+
+def generate(args):
+    from synthetic import generate_database
+
+    series_ids = generate_database(
+        args.db_name, args.series, args.years, args.raster_size, args.raster_unit, args.start_date, args.seed
+    )
+    print(f"Generated {len(series_ids)} series in {args.db_name}")
+
+
+def benchmark(args):
+    from benchmark import run_benchmarks, write_results
+
+    results = run_benchmarks(args.db_name, args.repeat, series_count=args.series_count)
+    output = args.output or f"benchmarks/{results['timestamp'].replace(':', '')}.json"
+    write_results(results, output)
+    print(f"Wrote {len(results['results'])} results to {output}")
+
+
+def benchmark_compare(args):
+    from benchmark import compare_results
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for row in compare_results(baseline, current):
+        before = 'n/a' if row['baseline'] is None else f"{row['baseline'] * 1000:.1f} ms"
+        ratio = 'n/a' if row['ratio'] is None else f"{row['ratio']:.2f}x"
+        print(f"{row['name']} {row['params']}: {before} -> {row['current'] * 1000:.1f} ms ({ratio})")
+
+
+def export(args):
+    from export import export_series
+
+    with PlantDataBase(args.db_name, read_only=True) as db:
+        stats = export_series(
+            db, args.output, args.series_ids, args.start_date, args.end_date, args.layout, args.format,
+            chunk_size=args.chunk_size
+        )
+    print(f"Wrote {stats['rows']} rows ({stats['bytes']} bytes) to {stats['path']} in {stats['seconds']:.2f}s")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Maintenance commands for plant databases.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser(
+        'migrate', help=f'upgrade database files in place to schema version {SCHEMA_VERSION}')
+    migrate_parser.add_argument('db_names', nargs='+', help='paths to the database files, e.g. db/*.db')
+    migrate_parser.set_defaults(func=migrate)
+
+    ingest_parser = subparsers.add_parser('ingest', help='bulk load CSV/Parquet exports into one series')
+    ingest_parser.add_argument('db_name', help='path to the database file')
+    ingest_parser.add_argument('files', nargs='+', help='CSV or Parquet files with date, mean and status columns')
+    ingest_parser.add_argument('--msr', required=True)
+    ingest_parser.add_argument('--msr-attribute', required=True)
+    ingest_parser.add_argument('--start-date', required=True)
+    ingest_parser.add_argument('--end-date', required=True)
+    ingest_parser.add_argument('--raster-size', type=int, default=15)
+    ingest_parser.add_argument('--raster-unit', default='min')
+    ingest_parser.add_argument('--batch-size', type=int, default=50_000)
+    ingest_parser.add_argument(
+        '--meta', action='append', default=[], metavar='FIELD=VALUE',
+        help='further Metadata fields, e.g. --meta object_id=10BGA --meta scale=1')
+    ingest_parser.add_argument('--shared-cache', help='cache directory of the dashboard workers to invalidate')
+    ingest_parser.set_defaults(func=ingest)
+
+    rollup_parser = subparsers.add_parser('rebuild-rollups', help='recompute the hourly/daily/monthly rollups')
+    rollup_parser.add_argument('db_name', help='path to the database file')
+    rollup_parser.add_argument('series_ids', nargs='*', help='series to rebuild, all series if omitted')
+    rollup_parser.add_argument('--shared-cache', help='cache directory of the dashboard workers to invalidate')
+    rollup_parser.set_defaults(func=rebuild_rollups)
+
+    statistics_parser = subparsers.add_parser(
+        'rebuild-statistics', help='recompute the monthly statistics and time-of-day profiles')
+    statistics_parser.add_argument('db_name', help='path to the database file')
+    statistics_parser.add_argument('series_ids', nargs='*', help='series to rebuild, all series if omitted')
+    statistics_parser.add_argument('--shared-cache', help='cache directory of the dashboard workers to invalidate')
+    statistics_parser.set_defaults(func=rebuild_statistics)
+
+    retention_parser = subparsers.add_parser(
+        'retention', help='drop the yearly Data partitions that lie entirely before a date')
+    retention_parser.add_argument('db_name', help='path to the database file')
+    cutoff = retention_parser.add_mutually_exclusive_group(required=True)
+    cutoff.add_argument('--before', help='drop every year that ends at or before this date')
+    cutoff.add_argument('--keep-years', type=int, help='keep the current and the previous N-1 calendar years')
+    retention_parser.add_argument('--shared-cache', help='cache directory of the dashboard workers to invalidate')
+    retention_parser.set_defaults(func=retention)
+
+    vacuum_parser = subparsers.add_parser(
+        'vacuum', help='return free pages to the file system, converts older files to incremental auto_vacuum')
+    vacuum_parser.add_argument('db_name', help='path to the database file')
+    vacuum_parser.set_defaults(func=vacuum)
+
+    columnar_parser = subparsers.add_parser(
+        'convert-columnar', help='write the memory-mapped columnar copy of the Data table')
+    columnar_parser.add_argument('db_name', help='path to the database file')
+    columnar_parser.add_argument('series_ids', nargs='*', help='series to convert, all series if omitted')
+    columnar_parser.add_argument('--store-dir', help='target directory, defaults to <db_name>.columns')
+    columnar_parser.add_argument('--verify', action='store_true', help='compare query results of both backends')
+    columnar_parser.set_defaults(func=convert_columnar)
+
+    generate_parser = subparsers.add_parser('generate', help='create a database filled with synthetic series')
+    generate_parser.add_argument('db_name', help='path to the database file')
+    generate_parser.add_argument('--series', type=int, default=10, help='number of series')
+    generate_parser.add_argument('--years', type=float, default=1, help='years of history per series')
+    generate_parser.add_argument('--raster-size', type=int, default=15)
+    generate_parser.add_argument('--raster-unit', default='min')
+    generate_parser.add_argument('--start-date', default='2023-01-01')
+    generate_parser.add_argument('--seed', type=int, default=0)
+    generate_parser.set_defaults(func=generate)
+
+    benchmark_parser = subparsers.add_parser('benchmark', help='time queries and dashboard callbacks')
+    benchmark_parser.add_argument('db_name', help='path to the database file')
+    benchmark_parser.add_argument('--repeat', type=int, default=5)
+    benchmark_parser.add_argument('--series-count', type=int, default=2, help='series used by multi-series queries')
+    benchmark_parser.add_argument('--output', help='JSON result file, defaults to benchmarks/<timestamp>.json')
+    benchmark_parser.set_defaults(func=benchmark)
+
+    compare_parser = subparsers.add_parser('benchmark-compare', help='compare two benchmark result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.set_defaults(func=benchmark_compare)
+
+    export_parser = subparsers.add_parser('export', help='write series to a Parquet or Arrow IPC file')
+    export_parser.add_argument('db_name', help='path to the database file')
+    export_parser.add_argument('output', help='target file, .parquet or .arrow/.feather/.ipc')
+    export_parser.add_argument('series_ids', nargs='+')
+    export_parser.add_argument('--start-date')
+    export_parser.add_argument('--end-date')
+    export_parser.add_argument('--layout', choices=['long', 'wide'], default='long')
+    export_parser.add_argument('--format', choices=['parquet', 'arrow'], help='defaults to the output file suffix')
+    export_parser.add_argument('--chunk-size', type=int, default=100_000)
+    export_parser.set_defaults(func=export)
+
+    return parser
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args()
+    args.func(args)
@@ -0,0 +1,224 @@
+import re
+import sqlite3
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# name -> (help text, bucket bounds, label names)
+HISTOGRAMS = {
+    'sqlite_query_seconds': ('Time spent in SQLite per statement, execute plus fetch', SECONDS_BUCKETS,
+                             ('statement',)),
+    'sqlite_query_rows': ('Rows fetched or written per statement', ROWS_BUCKETS, ('statement',)),
+    'dash_callback_seconds': ('Duration of a dashboard callback', SECONDS_BUCKETS, ('callback',)),
+    'dash_stage_seconds': ('Duration of a stage within a dashboard callback', SECONDS_BUCKETS,
+                           ('callback', 'stage')),
+    'dash_request_seconds': ('Duration of a callback request including serialization', SECONDS_BUCKETS,
+                             ('output',)),
+    'dash_response_bytes': ('Size of the JSON response of a callback request', BYTES_BUCKETS, ('output',)),
+}
+
+STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF(?:\s+NOT)?\s+EXISTS)?)\s+"?(\w+)', re.IGNORECASE)
+
+
+def statement_label(sql: str) -> str:
+    # Verb and first table, e.g. "SELECT Data": few enough distinct values to be used as a label.
+    words = sql.split(None, 1)
+    if not words:
+        return 'EMPTY'
+    table = STATEMENT_TABLE.search(sql)
+    return f"{words[0].upper()} {table.group(1)}" if table else words[0].upper()
+
+
+class Histogram:
+    def __init__(self, buckets: tuple) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, slow_query_seconds: float = 0.25, slow_query_log_size: int = 100) -> None:
+        self.slow_query_seconds = slow_query_seconds
+        # Most recent statements slower than slow_query_seconds, with their full SQL text.
+        self.slow_queries: deque = deque(maxlen=slow_query_log_size)
+        self._histograms: dict = {name: {} for name in HISTOGRAMS}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        buckets, label_names = HISTOGRAMS[name][1:]
+        key = tuple(str(labels[label]) for label in label_names)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - started, **labels)
+
+    def record_query(self, sql: str, rows: int, seconds: float):
+        label = statement_label(sql)
+        self.observe('sqlite_query_seconds', seconds, statement=label)
+        self.observe('sqlite_query_rows', rows, statement=label)
+        if seconds >= self.slow_query_seconds:
+            self.slow_queries.append({'sql': ' '.join(sql.split()), 'rows': rows, 'seconds': seconds})
+            logger.debug(f"Slow query ({seconds:.3f}s, {rows} rows): {' '.join(sql.split())}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {
+                name: [
+                    {
+                        'labels': dict(zip(HISTOGRAMS[name][2], key)), 'count': histogram.count, 'sum': histogram.sum,
+                        'buckets': dict(zip(map(str, [*histogram.buckets, '+Inf']), histogram.counts))
+                    }
+                    for key, histogram in series.items()
+                ]
+                for name, series in self._histograms.items()
+            }
+            return {'histograms': histograms, 'slow_queries': list(self.slow_queries)}
+
+    def render(self) -> str:
+        # Prometheus text exposition format, bucket counts are cumulative there.
+        lines = []
+        with self._lock:
+            for name, series in self._histograms.items():
+                help_text, _, label_names = HISTOGRAMS[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    labels = ','.join(f'{label}="{value}"' for label, value in zip(label_names, key))
+                    cumulative = 0
+                    for bound, count in zip([*histogram.buckets, '+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times execute and fetch calls of a statement and reports it once its result is consumed, the cursor is
+    # closed or collected, or the next statement starts. Python work between fetches is not counted. Collection
+    # covers the throwaway cursors of conn.execute(...).fetchone(), which are never read to the end.
+    metrics: MetricsRegistry = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._sql = None
+        self._rows = 0
+        self._seconds = 0.0
+
+    def _timed(self, method, *args):
+        started = perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._seconds += perf_counter() - started
+
+    def _finish(self):
+        if self._sql is not None:
+            self.metrics.record_query(self._sql, self._rows, self._seconds)
+            self._sql = None
+
+    def _start(self, sql: str):
+        self._finish()
+        self._sql, self._rows, self._seconds = sql, 0, 0.0
+
+    def execute(self, sql, parameters=()):
+        self._start(sql)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql)
+        cursor = self._timed(super().executemany, sql, seq_of_parameters)
+        self._rows = max(self.rowcount, 0)
+        return cursor
+
+    def executescript(self, sql_script):
+        # Also the path of Connection.executescript, the script runs to completion within the call.
+        self._start(sql_script)
+        try:
+            return self._timed(super().executescript, sql_script)
+        finally:
+            self._finish()
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        if getattr(self, '_sql', None) is not None:
+            self._finish()
+
+
+def connection_factory(metrics: MetricsRegistry):
+    # sqlite3.connect(factory=...) for connections whose cursors, including the implicit cursors of
+    # Connection.execute and executescript, report to metrics.
+    cursor_class = type('InstrumentedCursor', (InstrumentedCursor,), {'metrics': metrics})
+
+    class InstrumentedConnection(sqlite3.Connection):
+        def cursor(self, factory=cursor_class):
+            return super().cursor(factory)
+
+        def execute(self, sql, parameters=()):
+            return self.cursor().execute(sql, parameters)
+
+        def executemany(self, sql, seq_of_parameters):
+            return self.cursor().executemany(sql, seq_of_parameters)
+
+        def executescript(self, sql_script):
+            return self.cursor().executescript(sql_script)
+
+    return InstrumentedConnection
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import logging
+import weakref
+import threading
+from contextlib import contextmanager
+
+from metrics import MetricsRegistry, connection_factory
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class _ReaderHandle:
+    # Held only by the thread-local of the reading thread, so it is dropped when that thread ends.
+    __slots__ = ('conn', 'generation', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection, generation: int) -> None:
+        self.conn = conn
+        self.generation = generation
+
+
+class ConnectionPool:
+    def __init__(
+            self, db_name: str, wal: bool = True, mmap_size: int = 256 * 1024 ** 2, cache_size: int = -64 * 1024,
+            read_only: bool = False, timeout: float = 30.0, metrics: MetricsRegistry = None) -> None:
+        self.db_name = db_name
+        self.wal = wal
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size  # negative values are KiB, positive values are pages (SQLite semantics)
+        self.read_only = read_only
+        self.timeout = timeout
+        self.factory = sqlite3.Connection if metrics is None else connection_factory(metrics)
+
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        # Reentrant because a reader can be released by a finalizer that runs while the lock is held.
+        self._readers_lock = threading.RLock()
+        self._writer: sqlite3.Connection | None = None
+        self._writer_lock = threading.RLock()
+        self._generation = 0
+        self._pid = os.getpid()
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        if read_only:
+            conn = sqlite3.connect(
+                f"file:{self.db_name}?mode=ro", uri=True, timeout=self.timeout, check_same_thread=False,
+                factory=self.factory)
+        else:
+            conn = sqlite3.connect(self.db_name, timeout=self.timeout, check_same_thread=False, factory=self.factory)
+
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _check_fork(self):
+        # Connections must not be used across fork (background callback workers, pre-forking WSGI servers): a
+        # child process drops the inherited handles without closing them and opens its own.
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._readers = []
+            self._writer = None
+            self._readers_lock = threading.RLock()
+            self._writer_lock = threading.RLock()
+
+    def reader(self) -> sqlite3.Connection:
+        # One connection per thread, so concurrent callbacks never share a cursor or a page cache lock.
+        self._check_fork()
+        handle = getattr(self._local, 'handle', None)
+        if handle is not None and handle.generation == self._generation:
+            return handle.conn
+
+        conn = self._connect(read_only=self.read_only)
+        with self._readers_lock:
+            self._readers.append(conn)
+        handle = _ReaderHandle(conn, self._generation)
+        # Servers that start a thread per request would otherwise leave one open connection per request behind.
+        weakref.finalize(handle, self._release, conn)
+        self._local.handle = handle
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._readers_lock:
+            if conn in self._readers:
+                self._readers.remove(conn)
+        conn.close()
+
+    @contextmanager
+    def writer(self):
+        if self.read_only:
+            raise ValueError(f"Database {self.db_name} is opened in read-only mode")
+
+        self._check_fork()
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+                # Only takes effect in a new file and has to precede the switch to WAL, older files are converted
+                # by a one-off VACUUM (PlantDataBase.enable_incremental_vacuum).
+                self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                if self.wal:
+                    # WAL lets the reader connections keep reading while a write transaction is open.
+                    self._writer.execute("PRAGMA journal_mode = WAL")
+                    self._writer.execute("PRAGMA synchronous = NORMAL")
+
+            try:
+                yield self._writer
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                raise
+
+    def close(self):
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            # Invalidates the thread-local handles that other threads still hold.
+            self._generation += 1
+
+        logger.debug(f"Closed connection pool for {self.db_name}")
@@ -1,31 +1,27 @@
 import pandas as pd
 
 
-def query_and_prepare_data(db, meta_all, msr, start_date, end_date):
+def lookup_meta_row(meta_all, msr):
     meta_row = meta_all[meta_all['msr'] == msr]
     if meta_row.empty:
         raise ValueError(f"Measurement {msr} not found in metadata")
     elif meta_row.shape[0] > 1:
         raise ValueError(f"Measurement {msr} has multiple entries in metadata")
 
+    return meta_row
+
+
+def query_and_prepare_data(db, meta_all, msr, start_date, end_date):
+    meta_row = lookup_meta_row(meta_all, msr)
     series_id = meta_row.iloc[0, 0]
 
     df = db.query_data(series_id, start_date, end_date)
-    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d %H:%M:%S')
 
     return meta_row, df
 
 
 def query_multiple_msr(db, meta_all, msr_list):
-    for i, msr in enumerate(msr_list):
-        meta_row, df_single = query_and_prepare_data(db, meta_all, msr, '2023-01-01', '2023-02-31')
-        if i == 0:
-            df_single.rename(columns={'mean': msr}, inplace=True)
-            df = df_single[['date', msr]]
-            meta = meta_row
-        else:
-            df_single.rename(columns={'mean': msr}, inplace=True)
-            df = pd.merge(df, df_single[['date', msr]], on='date', how='outer')
-            meta = pd.concat([meta, meta_row])
+    meta = pd.concat([lookup_meta_row(meta_all, msr) for msr in msr_list])
+    df = db.query_aligned(list(meta['series_id']), '2023-01-01', '2023-02-28 23:59:59', names=msr_list)
 
     return df, meta
@@ -0,0 +1,68 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from db import PlantDataBase, raster_seconds
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Measurement kinds the synthetic series are modelled on: (msr_attribute, object_type, unit, base, amplitude).
+MEASUREMENT_KINDS = [
+    ('IST', 'Pumpe', 'm3/h', 120.0, 40.0),
+    ('TEMP', 'Sensor', '°C', 18.0, 6.0),
+    ('DRUCK', 'Ventil', 'bar', 4.0, 0.8),
+    ('LEISTUNG', 'Motor', 'kW', 55.0, 20.0),
+]
+STATUSES = ['OK', 'ERSATZWERT', 'GESTOERT']
+STATUS_WEIGHTS = [0.97, 0.02, 0.01]
+
+
+def generate_chunks(
+        rng: np.random.Generator, start: pd.Timestamp, end: pd.Timestamp, step: int, base: float, amplitude: float,
+        gap_rate: float = 0.001, chunk_size: int = 100_000):
+    # Daily and yearly cycle plus noise, with missing rows, missing values and a few non-OK statuses.
+    first = start.value // 10 ** 9
+    periods = (end.value // 10 ** 9 - first) // step
+    phase = rng.uniform(0, 2 * np.pi)
+
+    for offset in range(0, periods, chunk_size):
+        seconds = first + (offset + np.arange(min(chunk_size, periods - offset))) * step
+        daily = np.sin(2 * np.pi * (seconds % 86400) / 86400 - np.pi / 2 + phase / 4)
+        yearly = np.sin(2 * np.pi * seconds / (365.2425 * 86400) + phase)
+        values = base + amplitude * (0.6 * daily + 0.4 * yearly) + rng.normal(0, amplitude * 0.05, len(seconds))
+        values[rng.random(len(seconds)) < gap_rate] = np.nan
+
+        keep = rng.random(len(seconds)) >= gap_rate
+        yield pd.DataFrame({
+            'date': pd.to_datetime(seconds[keep], unit='s'),
+            'mean': values[keep],
+            'status': rng.choice(STATUSES, size=int(keep.sum()), p=STATUS_WEIGHTS)
+        })
+
+
+def generate_database(
+        db_name: str, n_series: int = 10, years: float = 1, raster_size: int = 15, raster_unit: str = 'min',
+        start_date: str = '2023-01-01', seed: int = 0) -> list:
+    # Fills Metadata and Data with series shaped like the plant exports, reproducible for a given seed.
+    rng = np.random.default_rng(seed)
+    step = raster_seconds(raster_size, raster_unit)
+    start = pd.Timestamp(start_date)
+    end = start + pd.Timedelta(days=round(365.2425 * years))
+
+    series_ids = []
+    with PlantDataBase(db_name) as db:
+        db.create_tables()
+        for i in range(n_series):
+            msr_attribute, object_type, unit, base, amplitude = MEASUREMENT_KINDS[i % len(MEASUREMENT_KINDS)]
+            stats = db.ingest_series(
+                generate_chunks(rng, start, end, step, base * rng.uniform(0.5, 1.5), amplitude),
+                f"SYN{i:04d}", msr_attribute, str(start.date()), str(end.date()), raster_size, raster_unit,
+                object_id=f"10BG{i:04d}", object_type=object_type, cfg='SYN', device=f"D{i % 7}", number=str(i),
+                object_description=f"Synthetic {object_type} {i}", object_name=f"{object_type} {i}", unit=unit,
+                scale=1
+            )
+            series_ids.append(stats['series_id'])
+            logger.info(f"Generated series {i + 1}/{n_series}: {stats['rows']} rows")
+
+    return series_ids
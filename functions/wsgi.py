@@ -0,0 +1,6 @@
+# Entry point for multi-worker deployments, e.g. from the functions directory:
+#   PLANT_DB=../db/test.db PLANT_CACHE_DIR=../cache/shared PLANT_BACKGROUND_DIR=../cache/background \
+#       gunicorn --workers 4 --threads 4 wsgi:server
+from dashboard import create_server
+
+server = create_server()
@@ -0,0 +1,53 @@
+import sys
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules in functions/ import each other by their plain names.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'functions'))
+
+from db import PlantDataBase  # noqa: E402
+from synthetic import generate_database  # noqa: E402
+
+START = pd.Timestamp('2023-01-01')
+
+
+def gappy_chunk() -> pd.DataFrame:
+    # Ten days of 15 min rows with a missing day, NULL values and NULL statuses.
+    dates = pd.date_range(START, START + pd.Timedelta(days=10), freq='15min', inclusive='left')
+    dates = dates[(dates < START + pd.Timedelta(days=4)) | (dates >= START + pd.Timedelta(days=5))]
+    values = np.linspace(0, 100, len(dates))
+    values[::17] = np.nan
+    statuses = np.array(['OK', 'ERSATZWERT', None], dtype=object)[np.arange(len(dates)) % 3]
+    return pd.DataFrame({'date': dates, 'mean': values, 'status': statuses})
+
+
+def ingest_gappy(db: PlantDataBase, msr: str = 'GAP0000') -> str:
+    return db.ingest_series(
+        gappy_chunk(), msr, 'IST', '2023-01-01', '2023-01-11', 15, 'min', object_id='GAP', object_description='Gaps',
+        object_name='Gaps', unit='m3/h', scale=1
+    )['series_id']
+
+
+@pytest.fixture(scope='session')
+def synthetic_db(tmp_path_factory) -> str:
+    # Two synthetic series over about five weeks plus one series with gaps and NULL statuses.
+    db_name = str(tmp_path_factory.mktemp('db') / 'synthetic.db')
+    generate_database(db_name, n_series=2, years=0.1, seed=1)
+    with PlantDataBase(db_name) as db:
+        ingest_gappy(db)
+    return db_name
+
+
+@pytest.fixture
+def db_copy(synthetic_db, tmp_path) -> str:
+    # Writable copy for tests that change the database.
+    target = str(tmp_path / 'copy.db')
+    source, copy = sqlite3.connect(synthetic_db), sqlite3.connect(target)
+    source.backup(copy)
+    source.close()
+    copy.close()
+    return target
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from aggregate import PairStats, accumulate_pairs
+from db import PlantDataBase
+
+
+@pytest.fixture(scope='module')
+def db(synthetic_db):
+    db = PlantDataBase(synthetic_db, read_only=True).open()
+    yield db
+    db.close()
+
+
+def aligned_pairs(db, series_ids, start_date, end_date):
+    df = db.query_aligned(series_ids, start_date, end_date, names=['x', 'y'])
+    df = df.dropna()
+    return df['x'].to_numpy(np.float64), df['y'].to_numpy(np.float64)
+
+
+@pytest.mark.parametrize('start_date, end_date', [
+    (None, None), ('2023-01-02 06:00:00', '2023-01-06'), ('2023-01-04 12:00:00', '2023-01-04 18:00:00'),
+    ('2022-01-01', '2022-12-31')
+])
+def test_pairs_match_the_aligned_frame(db, start_date, end_date):
+    # The last series has gaps and NULL values, so its pairs with the others drop both.
+    series_ids = list(db.query_all_metadata()['series_id'])
+    for pair in [series_ids[:2], series_ids[1:]]:
+        chunks = list(db.iter_query_pairs(*pair, start_date, end_date, chunk_size=100))
+        x = np.concatenate([x for x, _ in chunks]) if chunks else np.empty(0)
+        y = np.concatenate([y for _, y in chunks]) if chunks else np.empty(0)
+        expected_x, expected_y = aligned_pairs(db, pair, start_date, end_date)
+        np.testing.assert_allclose(x, expected_x, rtol=1e-6)
+        np.testing.assert_allclose(y, expected_y, rtol=1e-6)
+
+
+def test_chunked_density_matches_the_full_arrays():
+    rng = np.random.default_rng(0)
+    x = rng.normal(1000, 5, 10_000)
+    y = 0.5 * x + rng.normal(0, 1, 10_000)
+    x[::11] = np.nan
+    chunks = [(x[i:i + 999], y[i:i + 999]) for i in range(0, len(x), 999)]
+    x_range, y_range = (np.nanmin(x) - 1, np.nanmax(x)), (y.min(), y.max() + 1)
+
+    density = accumulate_pairs(chunks, x_range, y_range, bins=20)
+    valid = np.isfinite(x)
+    counts = np.histogram2d(x[valid], y[valid], bins=20, range=[x_range, y_range])[0]
+    np.testing.assert_array_equal(density.counts, counts)
+    assert density.points() is None
+
+    expected = PairStats().update(x, y)
+    assert density.stats.n == expected.n == valid.sum()
+    np.testing.assert_allclose(density.stats.fit(), expected.fit())
+    np.testing.assert_allclose(density.stats.fit(), np.polyfit(x[valid], y[valid], 1))
+
+
+def test_density_keeps_the_points_up_to_max_points():
+    chunks = [(np.arange(3.0), np.arange(3.0) * 2), (np.array([3.0, np.nan]), np.array([6.0, 1.0]))]
+    density = accumulate_pairs(chunks, (0, 3), (0, 6), bins=4, max_points=4)
+    x, y = density.points()
+    np.testing.assert_array_equal(x, [0.0, 1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(y, [0.0, 2.0, 4.0, 6.0])
+    assert density.counts.sum() == 4
+    assert accumulate_pairs(chunks, (0, 3), (0, 6), bins=4, max_points=3).points() is None
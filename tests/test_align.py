@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from db import PlantDataBase
+
+
+def ingest(db: PlantDataBase, msr: str, dates: list, values: list) -> str:
+    return db.ingest_series(
+        pd.DataFrame({'date': pd.to_datetime(dates), 'mean': values}), msr, 'IST', '2023-01-01', '2023-01-02', 15,
+        'min', object_id=msr, object_description=msr, object_name=msr, unit='m3/h', scale=1
+    )['series_id']
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = PlantDataBase(str(tmp_path / 'align.db')).open()
+    db.create_tables()
+    yield db
+    db.close()
+
+
+def test_on_raster_series_share_the_grid(db):
+    first = ingest(db, 'A', ['2023-01-01 00:00', '2023-01-01 00:15', '2023-01-01 01:00'], [1.0, 2.0, 3.0])
+    second = ingest(db, 'B', ['2023-01-01 00:15', '2023-01-01 00:30'], [4.0, 5.0])
+    df = db.query_aligned([first, second], names=['a', 'b'])
+    assert df['date'].tolist() == list(pd.to_datetime(
+        ['2023-01-01 00:00', '2023-01-01 00:15', '2023-01-01 00:30', '2023-01-01 01:00']))
+    np.testing.assert_array_equal(df['a'], [1.0, 2.0, np.nan, 3.0])
+    np.testing.assert_array_equal(df['b'], [np.nan, 4.0, 5.0, np.nan])
+
+
+def test_off_raster_values_keep_their_dates(db):
+    dates = ['2023-01-01 00:07:30', '2023-01-01 00:14:00', '2023-01-01 00:16:00', '2023-01-01 00:30:00']
+    series_id = ingest(db, 'OFF', dates, [1.0, 2.0, 3.0, 4.0])
+    df, meta = db.query_multiple([series_id])
+    assert df['date'].tolist() == list(pd.to_datetime(dates))
+    np.testing.assert_array_equal(df['m_0'], [1.0, 2.0, 3.0, 4.0])
+
+
+def test_series_with_different_phases_are_not_shifted(db):
+    first = ingest(db, 'A', ['2023-01-01 00:00', '2023-01-01 00:15'], [1.0, 2.0])
+    second = ingest(db, 'B', ['2023-01-01 00:07:30', '2023-01-01 00:22:30'], [3.0, 4.0])
+    df = db.query_aligned([first, second], names=['a', 'b'])
+    assert len(df) == 4
+    np.testing.assert_array_equal(df['a'], [1.0, np.nan, 2.0, np.nan])
+    np.testing.assert_array_equal(df['b'], [np.nan, 3.0, np.nan, 4.0])
+
+
+def test_duplicate_dates_of_one_series_raise(db):
+    frame = pd.DataFrame({'date': pd.to_datetime(['2023-01-01 00:00', '2023-01-01 00:00']), 'mean': [1.0, 2.0]})
+    with pytest.raises(ValueError):
+        db.align_frames({'s': frame}, ['s'])
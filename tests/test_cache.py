@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from cache import RangeCache
+from db import PlantDataBase
+
+
+@pytest.fixture
+def db(synthetic_db):
+    db = PlantDataBase(synthetic_db, read_only=True).open()
+    yield db
+    db.close()
+
+
+def expected(db, series_id, start_date, end_date):
+    return db.query_data(series_id, start_date or None, end_date or None)[['date', 'mean', 'status']]
+
+
+def test_open_entry_followed_by_earlier_range(db):
+    # The open upper bound of the cached entry must not be shifted by a second.
+    series_id = db.query_all_metadata()['series_id'][0]
+    db.query_series(series_id, '2023-01-20', None)
+    frame = db.query_series(series_id, '2023-01-01', '2023-01-05')
+    pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected(db, series_id, '2023-01-01', '2023-01-05'))
+
+
+def test_open_lower_entry_followed_by_later_range(db):
+    series_id = db.query_all_metadata()['series_id'][0]
+    db.query_series(series_id, None, '2023-01-05')
+    frame = db.query_series(series_id, '2023-01-20', '2023-01-25')
+    pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected(db, series_id, '2023-01-20', '2023-01-25'))
+
+
+def test_empty_string_bounds_are_open(db):
+    series_id = db.query_all_metadata()['series_id'][0]
+    for start_date, end_date in [('', ''), ('2023-01-10', ''), ('', None), (None, '')]:
+        frame = db.query_series(series_id, start_date, end_date)
+        pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected(db, series_id, start_date, end_date))
+    stats = db.cache.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 3
+
+
+def test_adjacent_ranges_are_merged():
+    fetched = []
+
+    def fetch(series_id, start, end):
+        fetched.append((start, end))
+        dates = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq='h')
+        return pd.DataFrame({'date': dates, 'mean': range(len(dates))})
+
+    cache = RangeCache()
+    cache.get('s', '2023-01-01 00:00:00', '2023-01-01 23:59:59', fetch)
+    frame = cache.get('s', '2023-01-02 00:00:00', '2023-01-02 23:59:59', fetch)
+    assert len(frame) == 24
+    assert cache.stats()['partial_hits'] == 1
+    assert fetched[-1][0] == pd.Timestamp('2023-01-02 00:00:00')
+
+
+def test_range_cache_follows_shared_cache_generations(db_copy, tmp_path):
+    # A writer in another process only reaches the reader through the shared cache, two instances stand in here.
+    from cache import SharedCache
+
+    reader = PlantDataBase(db_copy, read_only=True, shared_cache=SharedCache(str(tmp_path / 'shared'))).open()
+    writer = PlantDataBase(db_copy, shared_cache=SharedCache(str(tmp_path / 'shared'))).open()
+    meta = reader.query_all_metadata().iloc[0]
+    before = reader.query_series(meta['series_id'], '2023-01-01', '2023-01-02')
+    assert (before['mean'] != 999).all()
+
+    writer.ingest_series(
+        pd.DataFrame({'date': pd.date_range('2023-01-01', '2023-01-02', freq='15min'), 'mean': 999.0}),
+        meta['msr'], meta['msr_attribute'], meta['start_date'], meta['end_date'], int(meta['raster_size']),
+        meta['raster_unit']
+    )
+    after = reader.query_series(meta['series_id'], '2023-01-01', '2023-01-02')
+    assert (after['mean'] == 999).all()
+    writer.close()
+    reader.close()
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from catalog import MetadataCatalog
+
+# msr, object_name, object_description
+SERIES = [
+    ('PUMP1', 'Pumps north', 'Inflow'),
+    ('PUMP10', 'Pumping unit', 'Outflow north'),
+    ('VALVE3', 'Valve pump side', 'Pump pressure'),
+    ('FLOW7', 'Flowmeter', 'Pump1 outflow'),
+    ('TEMP2', 'Temperature', 'Hall'),
+]
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return MetadataCatalog(pd.DataFrame([
+        {'series_id': f"id-{msr}", 'msr': msr, 'msr_attribute': 'IST', 'object_name': object_name,
+         'object_description': object_description, 'unit': 'm3/h', 'start_date': '2023-01-01',
+         'end_date': '2023-12-31'}
+        for msr, object_name, object_description in SERIES
+    ]))
+
+
+def ids(*msrs) -> list:
+    return [f"id-{msr}" for msr in msrs]
+
+
+@pytest.mark.parametrize('query, expected', [
+    # Prefixes of tokens in any search field, case does not matter.
+    ('pum', ids('PUMP1', 'PUMP10', 'VALVE3', 'FLOW7')),
+    ('PUMP1', ids('PUMP1', 'FLOW7', 'PUMP10')),
+    ('outfl', ids('PUMP10', 'FLOW7')),
+    # Every query token has to match, in any field and order.
+    ('north pump', ids('PUMP1', 'PUMP10')),
+    ('pump hall', []),
+    ('ump', []),
+])
+def test_search_matches_token_prefixes(catalog, query, expected):
+    assert catalog.search(query) == expected
+
+
+def test_search_ranking(catalog):
+    # The exact msr first, then more exact token matches, then the catalog order.
+    assert catalog.search('pump1') == ids('PUMP1', 'FLOW7', 'PUMP10')
+    assert catalog.search('pump10') == ids('PUMP10')
+    assert catalog.search('pump') == ids('VALVE3', 'PUMP1', 'PUMP10', 'FLOW7')
+    assert catalog.search('pump north') == ids('PUMP1', 'PUMP10')
+
+
+def test_search_limit_and_empty_query(catalog):
+    assert catalog.search('pum', limit=2) == ids('PUMP1', 'PUMP10')
+    assert catalog.search('', limit=3) == ids('PUMP1', 'PUMP10', 'VALVE3')
+    assert catalog.search('  ') == ids(*[msr for msr, _, _ in SERIES])
+
+
+def test_search_options_keep_the_selected_value(catalog):
+    options = catalog.search_options('temp', selected='id-VALVE3')
+    assert [option['value'] for option in options] == ids('VALVE3', 'TEMP2')
+    assert options[1]['label'] == 'Hall - Temperature (m3/h | 2023-01-01 - 2023-12-31 | TEMP2.IST)'
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from columnar import ColumnarPlantDataBase
+from db import PlantDataBase
+
+# Range edges: open bounds, bounds on and between raster slots, a range inside the gap of the gappy series, an
+# end before the first row and a range past the last row.
+RANGES = [
+    (None, None),
+    ('2023-01-01', None),
+    (None, '2023-01-03 12:00:00'),
+    ('2023-01-02 00:00:00', '2023-01-02 23:45:00'),
+    ('2023-01-02 00:07:30', '2023-01-02 06:07:30'),
+    ('2023-01-04 12:00:00', '2023-01-05 12:00:00'),
+    ('2023-01-05 00:00:00', '2023-01-05 00:00:00'),
+    ('2022-12-01', '2022-12-31 23:59:59'),
+    ('2023-06-01', None),
+]
+
+
+@pytest.fixture(scope='module')
+def backends(synthetic_db, tmp_path_factory):
+    reference = PlantDataBase(synthetic_db, read_only=True).open()
+    candidate = ColumnarPlantDataBase(synthetic_db, str(tmp_path_factory.mktemp('columns')), read_only=True).open()
+    candidate.convert_from_sqlite()
+    yield reference, candidate
+    reference.close()
+    candidate.close()
+
+
+@pytest.fixture(scope='module')
+def series_ids(backends):
+    return list(backends[0].query_all_metadata()['series_id'])
+
+
+def assert_frames_equal(expected: pd.DataFrame, actual: pd.DataFrame):
+    pd.testing.assert_frame_equal(
+        expected.reset_index(drop=True), actual.reset_index(drop=True), check_dtype=False, check_categorical=False
+    )
+    if 'status' in expected.columns:
+        # Categories may differ in order, the decoded labels and NULLs may not.
+        assert expected['status'].astype(object).tolist() == actual['status'].astype(object).tolist()
+
+
+@pytest.mark.parametrize('start_date, end_date', RANGES)
+def test_query_data(backends, series_ids, start_date, end_date):
+    reference, candidate = backends
+    for series_id in series_ids:
+        assert_frames_equal(
+            reference.query_data(series_id, start_date, end_date), candidate.query_data(series_id, start_date, end_date)
+        )
+
+
+@pytest.mark.parametrize('start_date, end_date', RANGES)
+def test_query_series(backends, series_ids, start_date, end_date):
+    reference, candidate = backends
+    for series_id in series_ids:
+        assert_frames_equal(
+            reference.query_series(series_id, start_date, end_date),
+            candidate.query_series(series_id, start_date, end_date)
+        )
+
+
+@pytest.mark.parametrize('start_date, end_date', RANGES)
+def test_query_aligned(backends, series_ids, start_date, end_date):
+    reference, candidate = backends
+    assert_frames_equal(
+        reference.query_aligned(series_ids, start_date, end_date),
+        candidate.query_aligned(series_ids, start_date, end_date)
+    )
+
+
+@pytest.mark.parametrize('start_date, end_date', RANGES)
+def test_iter_query_data(backends, series_ids, start_date, end_date):
+    # Chunk boundaries differ between the backends, the concatenated rows may not.
+    reference, candidate = backends
+    for series_id in series_ids:
+        expected = list(reference.iter_query_data(series_id, start_date, end_date, chunk_size=250))
+        actual = list(candidate.iter_query_data(series_id, start_date, end_date, chunk_size=250))
+        if expected or actual:
+            assert_frames_equal(pd.concat(expected), pd.concat(actual))
+
+        expected = list(reference.iter_query_data(series_id, start_date, end_date, chunk_size=250, as_numpy=True))
+        actual = list(candidate.iter_query_data(series_id, start_date, end_date, chunk_size=250, as_numpy=True))
+        for column in ('date', 'mean', 'status'):
+            np.testing.assert_array_equal(
+                np.concatenate([chunk[column] for chunk in expected]) if expected else np.empty(0),
+                np.concatenate([chunk[column] for chunk in actual]) if actual else np.empty(0)
+            )
+
+
+def test_gappy_series_has_gaps_and_null_statuses(backends, series_ids):
+    # Guards the fixture: without gaps and NULLs the parity tests above would not cover them.
+    reference, _ = backends
+    df = reference.query_data(series_ids[-1])
+    assert df['mean'].isna().any()
+    assert df['status'].isna().any()
+    assert df['date'].diff().max() > pd.Timedelta(days=1)
@@ -0,0 +1,141 @@
+import threading
+
+import numpy as np
+import pytest
+
+from dashboard import DashApp
+from db import PlantDataBase
+
+
+@pytest.fixture(scope='module')
+def db(synthetic_db):
+    db = PlantDataBase(synthetic_db, read_only=True).open()
+    yield db
+    db.close()
+
+
+def run_with_timeout(fn, timeout: float = 30.0):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('value', fn()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'callback did not finish, the executor is starved'
+    return result['value']
+
+
+@pytest.mark.parametrize('start_date, end_date', [('2023-01-01', '2023-01-03'), ('2023-01-01', '2023-02-05')])
+def test_multivariate_graphs_with_a_single_worker(db, start_date, end_date):
+    # The short range reads aligned raw rows, the long one rollups; both fetch per series from an executor job.
+    dash_app = DashApp(db, max_workers=1)
+    series_ids = [record['series_id'] for record in dash_app.catalog.records[:2]]
+    figures = run_with_timeout(
+        lambda: dash_app.update_multivariate_graphs(*series_ids, 0, start_date, end_date)
+    )
+    assert len(figures) == 2
+
+
+def test_table_and_dropdown_callbacks_are_instrumented(db):
+    from metrics import MetricsRegistry
+
+    dash_app = DashApp(db, metrics=MetricsRegistry())
+    client = dash_app.app.server.test_client()
+    client.get('/_dash-dependencies')
+    client.post('/_dash-update-component', json={
+        'output': '..metadata-table.data...metadata-table.page_count..',
+        'outputs': [{'id': 'metadata-table', 'property': 'data'}, {'id': 'metadata-table', 'property': 'page_count'}],
+        'inputs': [
+            {'id': 'metadata-table', 'property': 'page_current', 'value': 0},
+            {'id': 'metadata-table', 'property': 'page_size', 'value': 25},
+            {'id': 'metadata-table', 'property': 'sort_by', 'value': []},
+            {'id': 'metadata-table', 'property': 'filter_query', 'value': ''}
+        ],
+        'changedPropIds': ['metadata-table.page_current']
+    })
+    client.post('/_dash-update-component', json={
+        'output': 'univariate-measurement-dropdown.options',
+        'outputs': {'id': 'univariate-measurement-dropdown', 'property': 'options'},
+        'inputs': [{'id': 'univariate-measurement-dropdown', 'property': 'search_value', 'value': 'syn'}],
+        'state': [{'id': 'univariate-measurement-dropdown', 'property': 'value', 'value': None}],
+        'changedPropIds': ['univariate-measurement-dropdown.search_value']
+    })
+
+    histograms = dash_app.metrics.snapshot()['histograms']
+    callbacks = {entry['labels']['callback'] for entry in histograms['dash_callback_seconds']}
+    stages = {tuple(entry['labels'].values()) for entry in histograms['dash_stage_seconds']}
+    assert {'metadata-table', 'dropdown-search'} <= callbacks
+    assert {('metadata-table', 'serialize'), ('dropdown-search', 'serialize')} <= stages
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_export_is_downloaded_from_a_route(db, tmp_path, fmt):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    dash_app = DashApp(db, export_dir=str(tmp_path / 'exports'))
+    series_ids = [record['series_id'] for record in dash_app.catalog.records[:2]]
+    href, label = dash_app.export_selected(1, series_ids, '2023-01-01', '2023-01-03', 'long', fmt)
+    # Only the link goes through the callback, never the file.
+    assert href.startswith('/export/') and label.startswith('Download')
+
+    response = dash_app.app.server.test_client().get(href)
+    assert response.status_code == 200
+    assert 'attachment' in response.headers['Content-Disposition']
+    body = pa.BufferReader(response.get_data())
+    table = pq.read_table(body) if fmt == 'parquet' else pa.ipc.open_file(body).read_all()
+    response.close()
+    expected = sum(len(db.query_data(series_id, '2023-01-01', '2023-01-03')) for series_id in series_ids)
+    assert table.num_rows == expected
+
+
+def test_stale_exports_are_removed(db, tmp_path):
+    dash_app = DashApp(db, export_dir=str(tmp_path / 'exports'), export_max_age=-1)
+    series_ids = [dash_app.catalog.records[0]['series_id']]
+    first, _ = dash_app.export_selected(1, series_ids, '2023-01-01', '2023-01-02', 'long', 'parquet')
+    second, _ = dash_app.export_selected(1, series_ids, '2023-01-01', '2023-01-02', 'wide', 'arrow')
+    client = dash_app.app.server.test_client()
+    assert client.get(first).status_code == 404
+    assert client.get(second).status_code == 200
+    assert len(list((tmp_path / 'exports').iterdir())) == 1
+
+
+def test_export_route_rejects_paths_outside_the_export_dir(db, tmp_path):
+    dash_app = DashApp(db, export_dir=str(tmp_path / 'exports'))
+    (tmp_path / 'secret.txt').write_text('secret')
+    client = dash_app.app.server.test_client()
+    for url in ['/export/00000000-0000-0000-0000-000000000000/..%2F..%2Fsecret.txt', '/export/..%2F../secret.txt']:
+        assert client.get(url).get_data() != b'secret'
+
+
+@pytest.mark.parametrize('scatter_max_points, trace_type', [(10, 'heatmap'), (10 ** 6, 'scatter')])
+def test_scatter_switches_to_a_density_above_max_points(db, scatter_max_points, trace_type):
+    dash_app = DashApp(db, scatter_max_points=scatter_max_points, density_bins=20)
+    series_ids = [record['series_id'] for record in dash_app.catalog.records[:2]]
+    scatter, _ = dash_app.update_multivariate_graphs(*series_ids, 0, '2023-01-01', '2023-01-05')
+    points, line = scatter.data
+    assert points.type == trace_type
+    assert line.mode == 'lines'
+    if trace_type == 'heatmap':
+        assert np.nansum(np.asarray(points.z, dtype=float)) == dash_app.query_scatter_data(
+            series_ids, '2023-01-01', '2023-01-05').stats.n
+
+
+def test_create_server_reads_the_background_dir_from_the_environment(synthetic_db, tmp_path, monkeypatch):
+    import dashboard
+
+    created = []
+    create_app = dashboard.create_app
+
+    def record(*args, **kwargs):
+        created.append(create_app(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(dashboard, 'create_app', record)
+    monkeypatch.setenv('PLANT_BACKGROUND_DIR', str(tmp_path / 'background'))
+    dashboard.create_server(synthetic_db, str(tmp_path / 'shared'), export_dir=str(tmp_path / 'exports'))
+    dash_app = created[0]
+    try:
+        assert dash_app.background_manager is not None
+        assert (tmp_path / 'background').is_dir()
+        assert dash_app.background_options('univariate-update-button')['background']
+    finally:
+        dash_app.db.close()
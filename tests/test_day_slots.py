@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard import DashApp
+from db import PlantDataBase
+
+# Mid-hour bounds on either end, both within one hour, whole hours and open bounds.
+RANGES = [
+    (None, None),
+    ('2023-01-02 10:20:00', '2023-01-04 07:40:00'),
+    ('2023-01-02 10:00:00', '2023-01-04 07:00:00'),
+    ('2023-01-03 05:10:00', '2023-01-03 05:50:00'),
+    (None, '2023-01-03 12:30:00'),
+    ('2023-01-03 12:30:00', None),
+]
+
+
+def chunk(minutes: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2023-01-01', '2023-01-06', freq=f"{minutes}min", inclusive='left')
+    values = rng.normal(50, 10, len(dates))
+    values[rng.random(len(dates)) < 0.1] = np.nan
+    return pd.DataFrame({'date': dates, 'mean': values})
+
+
+def ingest(db: PlantDataBase, msr: str, minutes: int) -> str:
+    return db.ingest_series(
+        chunk(minutes), msr, 'IST', '2023-01-01', '2023-01-06', minutes, 'min', object_id=msr,
+        object_description=msr, object_name=msr, unit='m3/h', scale=1
+    )['series_id']
+
+
+def hourly_pivot(db: PlantDataBase, series_id: str, start_date, end_date) -> pd.DataFrame:
+    df = db.query_data(series_id, start_date, end_date).dropna(subset=['mean'])
+    df = df.assign(hour=df['date'].dt.hour.astype(np.float64), day=df['date'].dt.date,
+                   mean=df['mean'].astype(np.float64))
+    return df.pivot_table(index='hour', columns='day', values='mean')
+
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    db = PlantDataBase(str(tmp_path_factory.mktemp('day_slots') / 'day_slots.db')).open()
+    db.create_tables()
+    yield db
+    db.close()
+
+
+@pytest.mark.parametrize('start_date, end_date', RANGES)
+def test_hourly_slots_stop_at_the_range(db, start_date, end_date):
+    # Whole hours come from the rollup, the partial hours at either end from the raw rows.
+    series_id = ingest(db, 'QUARTER', 15)
+    pd.testing.assert_frame_equal(
+        db.query_day_slots(series_id, start_date, end_date).pivot(),
+        hourly_pivot(db, series_id, start_date, end_date), check_names=False, rtol=1e-5
+    )
+
+
+@pytest.mark.parametrize('start_date, end_date', [('2023-01-02', '2023-01-04 07:40:00'), ('2023-01-01', '2023-01-06')])
+def test_heatmap_of_a_raster_that_does_not_divide_a_day(db, start_date, end_date):
+    series_id = ingest(db, 'SEVEN', 7)
+    dash_app = DashApp(db)
+    figures = dash_app.update_univariate_graphs(series_id, 0, start_date, end_date)
+    assert len(figures) == 3
+
+    # Averaged per hour of the day, like ranges too long for the raw grid.
+    _, grid = dash_app.query_and_prepare_data(series_id, start_date, end_date)
+    pd.testing.assert_frame_equal(
+        grid.pivot(), hourly_pivot(db, series_id, start_date, end_date), check_names=False, rtol=1e-5
+    )
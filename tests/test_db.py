@@ -0,0 +1,34 @@
+from conftest import gappy_chunk, ingest_gappy
+from db import PlantDataBase
+
+
+def test_drop_create_ingest(db_copy):
+    db = PlantDataBase(db_copy).open()
+    db.drop_tables()
+    db.create_tables()
+    assert db.query_all_metadata().empty
+    assert db.partitions() == []
+
+    # Codes restart after the Status table is recreated, so the decoded labels show whether the old map was kept.
+    chunk = gappy_chunk()
+    chunk['status'] = chunk['status'].map({'OK': 'GESTOERT', 'ERSATZWERT': 'OK', None: None})
+    series_id = db.ingest_series(
+        chunk, 'GAP0000', 'IST', '2023-01-01', '2023-01-11', 15, 'min', object_id='GAP', object_description='Gaps',
+        object_name='Gaps', unit='m3/h', scale=1
+    )['series_id']
+    df = db.query_data(series_id)
+    assert len(df) == len(chunk)
+    assert df['status'].astype(object).fillna('NULL').tolist() == chunk['status'].fillna('NULL').tolist()
+    assert list(db.query_all_metadata()['series_id']) == [series_id]
+    db.close()
+
+
+def test_drop_tables_twice_through_create(db_copy):
+    db = PlantDataBase(db_copy).open()
+    for _ in range(2):
+        db.drop_tables()
+        db.create_tables()
+        ingest_gappy(db)
+    assert db.get_schema_version() == db.migrate()
+    assert db.partitions() == [2023]
+    db.close()
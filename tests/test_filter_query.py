@@ -0,0 +1,121 @@
+import pandas as pd
+import pytest
+
+from db import PlantDataBase, METADATA_COLUMNS, STATISTICS_COLUMNS
+from filter_query import filter_to_sql
+
+COLUMNS = METADATA_COLUMNS + STATISTICS_COLUMNS
+# msr, object_name, raster_size, value of every row
+SERIES = [
+    ('SYN0001', 'Pump 10% load', 15, 5.0),
+    ('syn0002', 'Pump_1', 15, 50.0),
+    ('ABC0003', 'Valve "main"', 60, 500.0),
+    ('ABC0004', "Sensor's 2", 60, 5000.0),
+]
+
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    db = PlantDataBase(str(tmp_path_factory.mktemp('filter') / 'filter.db')).open()
+    db.create_tables()
+    for msr, object_name, raster_size, value in SERIES:
+        dates = pd.date_range('2023-01-01', periods=4, freq=f"{raster_size}min")
+        db.ingest_series(
+            pd.DataFrame({'date': dates, 'mean': value}), msr, 'IST', '2023-01-01', '2023-01-02', raster_size, 'min',
+            object_id=msr, object_description=object_name, object_name=object_name, unit='m3/h', scale=1
+        )
+    yield db
+    db.close()
+
+
+def matching(db: PlantDataBase, filter_query: str) -> list:
+    where, params = filter_to_sql(filter_query, COLUMNS)
+    page, total = db.query_metadata_page(where, params, [('msr', 'asc')], 0, 100)
+    assert total == len(page)
+    return page['msr'].tolist()
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{raster_size} = 15', ['SYN0001', 'syn0002']),
+    ('{raster_size} s= 15', ['SYN0001', 'syn0002']),
+    ('{raster_size} eq 60', ['ABC0003', 'ABC0004']),
+    ('{raster_size} ne 60', ['SYN0001', 'syn0002']),
+    ('{raster_size} != 60', ['SYN0001', 'syn0002']),
+    ('{raster_size} < 60', ['SYN0001', 'syn0002']),
+    ('{raster_size} lt 60', ['SYN0001', 'syn0002']),
+    ('{raster_size} <= 15', ['SYN0001', 'syn0002']),
+    ('{raster_size} le 15', ['SYN0001', 'syn0002']),
+    ('{raster_size} > 15', ['ABC0003', 'ABC0004']),
+    ('{raster_size} gt 15', ['ABC0003', 'ABC0004']),
+    ('{raster_size} >= 60', ['ABC0003', 'ABC0004']),
+    ('{raster_size} ge 60', ['ABC0003', 'ABC0004']),
+    ('{msr} = syn0002', ['syn0002']),
+    ('{msr} s= SYN0002', []),
+    ('{msr} i= SYN0002', ['syn0002']),
+    ('{msr} ieq SYN0002', ['syn0002']),
+    ('{msr} ine SYN0002', ['ABC0003', 'ABC0004', 'SYN0001']),
+    ('{msr} contains SYN', ['SYN0001']),
+    ('{msr} scontains SYN', ['SYN0001']),
+    ('{msr} icontains SYN', ['SYN0001', 'syn0002']),
+    ('{start_date} datestartswith 2023-01', ['ABC0003', 'ABC0004', 'SYN0001', 'syn0002']),
+    ('{start_date} datestartswith 2023-02', []),
+    ('{msr} icontains syn && {raster_size} s= 15 && {object_name} contains 10', ['SYN0001']),
+])
+def test_operators(db, filter_query, expected):
+    assert matching(db, filter_query) == expected
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{object_name} contains "Valve \\"main\\""', ['ABC0003']),
+    ("{object_name} = 'Sensor\\'s 2'", ['ABC0004']),
+    ('{object_name} icontains `PUMP 10%`', ['SYN0001']),
+    ('{object_name} = "Pump_1"', ['syn0002']),
+])
+def test_quoted_values(db, filter_query, expected):
+    assert matching(db, filter_query) == expected
+
+
+def test_like_wildcards_are_escaped(db):
+    # Unescaped, % and _ would match any text and any single character.
+    assert matching(db, '{object_name} icontains %') == ['SYN0001']
+    assert matching(db, '{object_name} icontains p_mp') == []
+    assert matching(db, '{object_name} icontains _') == ['syn0002']
+    assert matching(db, '{start_date} datestartswith 2023_01') == []
+    where, params = filter_to_sql('{object_name} icontains 10%_\\', COLUMNS)
+    assert params == ['%10\\%\\_\\\\%']
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{mean} > 50', ['ABC0003', 'ABC0004']),
+    ('{mean} >= 50', ['ABC0003', 'ABC0004', 'syn0002']),
+    ('{mean} < 1000', ['ABC0003', 'SYN0001', 'syn0002']),
+    ('{max} = 5000', ['ABC0004']),
+    ('{rows} = 4', ['ABC0003', 'ABC0004', 'SYN0001', 'syn0002']),
+    ('{null_ratio} > 0', []),
+])
+def test_statistics_columns_compare_as_numbers(db, filter_query, expected):
+    # As text '5000' < '600' would hold, the stored REAL columns turn the filter value into a number.
+    assert matching(db, filter_query) == expected
+
+
+@pytest.mark.parametrize('filter_query', [
+    '{unknown} = 1',
+    '{msr} like SYN%',
+    '{msr} is blank',
+    '{msr} =',
+    'msr = SYN0001',
+])
+def test_unsupported_filters_raise(filter_query):
+    with pytest.raises(ValueError):
+        filter_to_sql(filter_query, COLUMNS)
+
+
+def test_values_are_bound_parameters():
+    where, params = filter_to_sql('{msr} = 1; DROP TABLE Metadata', COLUMNS)
+    assert where == '"msr" = ?'
+    assert params == ['1; DROP TABLE Metadata']
+
+
+def test_empty_filter():
+    assert filter_to_sql('', COLUMNS) == ('', [])
+    assert filter_to_sql(None, COLUMNS) == ('', [])
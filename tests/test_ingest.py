@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from conftest import gappy_chunk
+from db import PlantDataBase
+
+
+@pytest.mark.parametrize('suffix', ['.csv', '.parquet'])
+def test_file_ingest_is_read_in_batches(db_copy, tmp_path, monkeypatch, suffix):
+    chunk = gappy_chunk()
+    path = tmp_path / f'gappy{suffix}'
+    if suffix == '.csv':
+        chunk.to_csv(path, index=False)
+    else:
+        chunk.to_parquet(path, index=False)
+
+    db = PlantDataBase(db_copy).open()
+    sizes = []
+    normalise = db._normalise_chunk
+    monkeypatch.setattr(db, '_normalise_chunk', lambda frame: sizes.append(len(frame)) or normalise(frame))
+    result = db.ingest_series(
+        path, 'FILE0000', 'IST', '2023-01-01', '2023-01-11', 15, 'min', batch_size=100, object_id='FILE',
+        object_description='File', object_name='File', unit='m3/h', scale=1
+    )
+
+    # Neither format is read whole, every frame holds at most one batch.
+    assert max(sizes) == 100
+    assert sum(sizes) == len(chunk)
+    df = db.query_data(result['series_id'])
+    pd.testing.assert_series_equal(
+        df['mean'].reset_index(drop=True), chunk['mean'], check_names=False, check_dtype=False
+    )
+    assert df['status'].astype(object).fillna('NULL').tolist() == chunk['status'].fillna('NULL').tolist()
+    db.close()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregate import accumulate_day_slots
+from conftest import gappy_chunk
+from db import PlantDataBase
+
+
+@pytest.fixture(scope='module')
+def db(synthetic_db):
+    db = PlantDataBase(synthetic_db, read_only=True).open()
+    yield db
+    db.close()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 250, 100_000])
+def test_iter_query_measurements_matches_query_measurements(db, chunk_size):
+    key = ('GAP0000', 'IST', '2023-01-01', '2023-01-11', 15, 'min')
+    df, df_meta = db.query_measurements(*key)
+    chunks, chunk_meta = db.iter_query_measurements(*key, chunk_size=chunk_size)
+    chunks = list(chunks)
+    assert len(chunks) == -(-len(df) // chunk_size)
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df)
+    pd.testing.assert_frame_equal(chunk_meta, df_meta)
+    assert len(df) == len(gappy_chunk())
+
+
+def test_iter_execute_query_matches_execute_query(db):
+    query = "SELECT series_id, date, mean FROM Data ORDER BY series_id, date"
+    expected = db.execute_query(query)
+    pd.testing.assert_frame_equal(pd.concat(db.iter_execute_query(query, chunk_size=999), ignore_index=True), expected)
+
+    # NumPy chunks hold the values as SQLite returns them, NULL stays None.
+    chunks = list(db.iter_execute_query(query, chunk_size=999, as_numpy=True))
+    rows = db.pool.reader().execute(query).fetchall()
+    for i, column in enumerate(expected.columns):
+        assert np.concatenate([chunk[column] for chunk in chunks]).tolist() == [row[i] for row in rows]
+    assert list(db.iter_execute_query("SELECT * FROM Data WHERE date < 0")) == []
+
+
+@pytest.mark.parametrize('as_numpy', [False, True])
+def test_accumulate_day_slots_matches_a_pivot(db, as_numpy):
+    for series_id in db.query_all_metadata()['series_id']:
+        step = db.raster_step([series_id])
+        chunks = db.iter_query_data(series_id, chunk_size=500, as_numpy=as_numpy)
+        accumulator = accumulate_day_slots(chunks, step)
+
+        df = db.query_data(series_id).dropna(subset=['mean'])
+        df = df.assign(
+            hour=(df['date'] - df['date'].dt.normalize()).dt.total_seconds() / 3600, day=df['date'].dt.date,
+            mean=df['mean'].astype(np.float64)
+        )
+        pd.testing.assert_frame_equal(
+            accumulator.pivot(), df.pivot_table(index='hour', columns='day', values='mean'), check_names=False
+        )
+        pd.testing.assert_series_equal(
+            accumulator.average_day(), df.groupby('hour')['mean'].mean(), check_names=False, rtol=1e-6
+        )
@@ -0,0 +1,59 @@
+import sqlite3
+
+from conftest import ingest_gappy
+from db import PlantDataBase
+from metrics import MetricsRegistry, connection_factory
+
+
+def counts(metrics: MetricsRegistry, name: str = 'sqlite_query_seconds') -> dict:
+    return {entry['labels']['statement']: entry['count'] for entry in metrics.snapshot()['histograms'][name]}
+
+
+def rows(metrics: MetricsRegistry) -> dict:
+    histograms = metrics.snapshot()['histograms']
+    return {entry['labels']['statement']: entry['sum'] for entry in histograms['sqlite_query_rows']}
+
+
+def test_throwaway_cursors_are_recorded(synthetic_db):
+    metrics = MetricsRegistry()
+    db = PlantDataBase(synthetic_db, read_only=True, metrics=metrics).open()
+    before = counts(metrics).get('PRAGMA', 0)
+    for _ in range(5):
+        db.get_schema_version()
+    assert counts(metrics)['PRAGMA'] == before + 5
+    db.close()
+
+
+def test_each_statement_is_recorded_once():
+    metrics = MetricsRegistry()
+    conn = sqlite3.connect(':memory:', factory=connection_factory(metrics))
+    conn.executescript("CREATE TABLE t (a); INSERT INTO t VALUES (1), (2), (3);")
+    assert counts(metrics) == {'CREATE t': 1}
+
+    cursor = conn.execute("SELECT a FROM t")
+    assert len(cursor.fetchall()) == 3
+    del cursor
+    # Partly read and then closed.
+    cursor = conn.execute("SELECT a FROM t ORDER BY a")
+    cursor.fetchone()
+    cursor.close()
+    # Partly read and replaced by the next statement on the same cursor.
+    cursor = conn.cursor()
+    cursor.execute("SELECT a FROM t").fetchmany(2)
+    cursor.execute("INSERT INTO t VALUES (4)")
+    cursor.close()
+
+    assert counts(metrics) == {'CREATE t': 1, 'SELECT t': 3, 'INSERT t': 1}
+    assert rows(metrics)['SELECT t'] == 3 + 1 + 2
+    conn.close()
+
+
+def test_incremental_vacuum_is_recorded(db_copy):
+    metrics = MetricsRegistry()
+    db = PlantDataBase(db_copy, metrics=metrics).open()
+    db.delete_measurements(ingest_gappy(db, 'GAP0001'))
+    before = counts(metrics).get('PRAGMA', 0)
+    assert db.incremental_vacuum() > 0
+    # auto_vacuum, freelist_count and the incremental_vacuum script.
+    assert counts(metrics)['PRAGMA'] == before + 3
+    db.close()
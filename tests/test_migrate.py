@@ -0,0 +1,171 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from db import PlantDataBase, SCHEMA_VERSION
+
+# Data rows of a schema version 0 file in insertion order: (series_id, date, mean, status). Rows 1 and 4 and rows
+# 5 and 8 share (series_id, date), the later one has to win. The row without a date cannot be migrated.
+V0_ROWS = [
+    ('A', '2022-12-31 23:30:00', 1.0, 'OK'),
+    ('A', '2022-12-31 23:45:00', 2.0, None),
+    ('A', '2023-01-01 00:00:00', None, 'ERSATZWERT'),
+    ('A', '2022-12-31 23:30:00', 10.0, 'ERSATZWERT'),
+    ('A', '2023-01-01 00:15:00', 4.0, 'OK'),
+    ('A', None, 5.0, 'OK'),
+    ('B', '2023-01-01 00:00:00', 7.0, 'GESTOERT'),
+    ('A', '2023-01-01 00:15:00', 40.0, None),
+    ('B', '2023-01-01 00:15:00', 8.0, 'OK'),
+]
+
+
+@pytest.fixture
+def v0_db(tmp_path) -> str:
+    # Metadata and Data as created by the baseline create_tables, without a user_version.
+    db_name = str(tmp_path / 'v0.db')
+    conn = sqlite3.connect(db_name)
+    conn.execute('''
+        CREATE TABLE Metadata (
+            series_id TEXT PRIMARY KEY, msr TEXT NOT NULL, msr_attribute TEXT NOT NULL, object_id TEXT NOT NULL,
+            object_type TEXT, cfg TEXT, device TEXT, number TEXT, object_description TEXT, object_name TEXT,
+            unit TEXT, start_date TEXT NOT NULL, end_date TEXT NOT NULL, raster_size INTEGER NOT NULL,
+            raster_unit TEXT NOT NULL, scale INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE Data (
+            data_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            series_id TEXT NOT NULL,
+            date DATETIME,
+            mean REAL,
+            status TEXT,
+            FOREIGN KEY(series_id) REFERENCES Metadata(series_id)
+        )
+    ''')
+    for series_id in ('A', 'B'):
+        conn.execute(
+            "INSERT INTO Metadata (series_id, msr, msr_attribute, object_id, start_date, end_date, raster_size, "
+            "raster_unit, scale) VALUES (?, ?, 'IST', ?, '2022-12-31', '2023-01-02', 15, 'min', 1)",
+            (series_id, f"MSR{series_id}", series_id)
+        )
+    conn.executemany("INSERT INTO Data (series_id, date, mean, status) VALUES (?, ?, ?, ?)", V0_ROWS)
+    conn.commit()
+    conn.close()
+    return db_name
+
+
+def expected_rows() -> pd.DataFrame:
+    # What a reader of the v0 file saw as the current value: the last row per (series_id, date).
+    df = pd.DataFrame(V0_ROWS, columns=['series_id', 'date', 'mean', 'status']).dropna(subset=['date'])
+    df = df.drop_duplicates(['series_id', 'date'], keep='last')
+    return df.sort_values(['series_id', 'date'], ignore_index=True)
+
+
+def test_migrate_from_v0(v0_db):
+    db = PlantDataBase(v0_db).open()
+    assert db.get_schema_version() == 0
+    assert db.migrate() == SCHEMA_VERSION
+    assert db.get_schema_version() == SCHEMA_VERSION
+    # A second run has nothing left to do.
+    assert db.migrate() == SCHEMA_VERSION
+
+    rows = db.pool.reader().execute('''
+        SELECT d.series_id, strftime('%Y-%m-%d %H:%M:%S', d.date, 'unixepoch'), d.mean, s.status
+        FROM Data d LEFT JOIN Status s ON s.status_code = d.status ORDER BY d.series_id, d.date
+    ''').fetchall()
+    actual = pd.DataFrame(rows, columns=['series_id', 'date', 'mean', 'status'])
+    pd.testing.assert_frame_equal(actual, expected_rows())
+
+    # The later duplicates won, including one that replaced a status with NULL.
+    assert actual.loc[0, ['mean', 'status']].tolist() == [10.0, 'ERSATZWERT']
+    assert actual.loc[3, 'mean'] == 40.0 and actual.loc[3, 'status'] is None
+    db.close()
+
+
+def decoded_v2(db: PlantDataBase, series_id: str, start_date=None, end_date=None) -> pd.DataFrame:
+    # query_data of a v2 file: text dates and statuses compared and returned as stored.
+    query, params = "SELECT date, mean, status FROM Data WHERE series_id = ?", [series_id]
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND date <= ?"
+        params.append(end_date)
+    df = pd.DataFrame(
+        db.pool.reader().execute(f"{query} ORDER BY date", params).fetchall(), columns=['date', 'mean', 'status'])
+    df['date'] = pd.to_datetime(df['date'])
+    df['mean'] = df['mean'].astype(db.value_dtype)
+    return df
+
+
+def test_migrate_v2_to_epoch_dates_and_status_codes(v0_db, monkeypatch):
+    import db as db_module
+
+    db = PlantDataBase(v0_db).open()
+    monkeypatch.setattr(db_module, 'SCHEMA_VERSION', 2)
+    db.migrate()
+    ranges = [(None, None), ('2022-12-31 23:45:00', '2023-01-01 00:00:00'), ('2023-01-01', None)]
+    before = {
+        (series_id, start_date, end_date): decoded_v2(db, series_id, start_date, end_date)
+        for series_id in ('A', 'B') for start_date, end_date in ranges
+    }
+    rollups_before = db.pool.reader().execute(
+        "SELECT series_id, resolution, bucket, count, sum, min, max FROM Rollup ORDER BY 1, 2, 3").fetchall()
+
+    monkeypatch.undo()
+    db.migrate()
+    for (series_id, start_date, end_date), expected in before.items():
+        actual = db.query_data(series_id, start_date, end_date)
+        pd.testing.assert_frame_equal(actual[['date', 'mean']], expected[['date', 'mean']])
+        # NULL statuses and NULL values survive the conversion, the codes decode to the same labels.
+        assert actual['status'].astype(object).fillna('NULL').tolist() == expected['status'].fillna('NULL').tolist()
+        assert actual['mean'].isna().tolist() == expected['mean'].isna().tolist()
+
+    rollups_after = db.pool.reader().execute(
+        "SELECT series_id, resolution, strftime('%Y-%m-%d %H:%M:%S', bucket, 'unixepoch'), count, sum, min, max "
+        "FROM Rollup ORDER BY 1, 2, 3").fetchall()
+    assert rollups_after == rollups_before
+    statuses = [row[0] for row in db.pool.reader().execute("SELECT status FROM Status ORDER BY status")]
+    assert statuses == ['ERSATZWERT', 'GESTOERT', 'OK']
+    db.close()
+
+
+def test_migrate_splits_data_into_year_partitions(v0_db):
+    db = PlantDataBase(v0_db).open()
+    db.migrate()
+    # The v0 rows span the turn of the year 2022/2023.
+    assert db.partitions() == [2022, 2023]
+    reader = db.pool.reader()
+    expected = expected_rows()
+    for year in (2022, 2023):
+        rows = reader.execute(
+            f"SELECT series_id, strftime('%Y-%m-%d %H:%M:%S', date, 'unixepoch') FROM Data_{year} "
+            "ORDER BY series_id, date").fetchall()
+        in_year = expected[expected['date'].str.startswith(str(year))]
+        assert rows == list(in_year[['series_id', 'date']].itertuples(index=False, name=None))
+    assert reader.execute("SELECT type FROM sqlite_master WHERE name = 'Data'").fetchone() == ('view',)
+    db.close()
+
+
+def test_migrate_fills_the_statistics_of_existing_series(v0_db):
+    db = PlantDataBase(v0_db).open()
+    db.migrate()
+    expected = expected_rows()
+    expected['date'] = pd.to_datetime(expected['date'])
+    reader = db.pool.reader()
+    for series_id, rows in expected.groupby('series_id'):
+        statistics = db.query_statistics(series_id)
+        months = rows.groupby(rows['date'].dt.to_period('M').dt.start_time)['mean']
+        assert statistics['month'].tolist() == list(months.size().index)
+        assert statistics['count'].tolist() == months.size().tolist()
+        assert statistics['null_count'].tolist() == months.apply(lambda values: values.isna().sum()).tolist()
+        assert statistics['mean'].tolist() == pytest.approx(months.mean().tolist())
+
+        valid = rows.dropna(subset=['mean'])
+        average_day = valid.groupby((valid['date'] - valid['date'].dt.normalize()).dt.total_seconds() / 3600)['mean']
+        pd.testing.assert_series_equal(
+            db.query_average_day(series_id), average_day.mean(), check_names=False, check_index_type=False)
+        assert reader.execute("SELECT rows FROM SeriesStatistics WHERE series_id = ?", (series_id,)).fetchone() \
+            == (len(rows),)
+    db.close()
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from db import PlantDataBase, to_epoch
+
+
+def hourly_chunk(start: str, end: str) -> pd.DataFrame:
+    dates = pd.date_range(start, end, freq='h', inclusive='left')
+    values = np.arange(len(dates), dtype=np.float64)
+    values[::50] = np.nan
+    return pd.DataFrame({'date': dates, 'mean': values, 'status': np.where(np.arange(len(dates)) % 7, 'OK', None)})
+
+
+def ingest(db: PlantDataBase, msr: str, chunk: pd.DataFrame) -> str:
+    return db.ingest_series(
+        chunk, msr, 'IST', str(chunk['date'].iloc[0].date()), str(chunk['date'].iloc[-1].date()), 1, 'h',
+        object_id=msr, object_description=msr, object_name=msr, unit='m3/h', scale=1
+    )['series_id']
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = PlantDataBase(str(tmp_path / 'partitions.db')).open()
+    db.create_tables()
+    yield db
+    db.close()
+
+
+def assert_data_equal(db: PlantDataBase, series_id: str, chunk: pd.DataFrame, start_date=None, end_date=None):
+    df = db.query_data(series_id, start_date, end_date)
+    expected = chunk
+    if start_date:
+        expected = expected[expected['date'] >= pd.Timestamp(start_date)]
+    if end_date:
+        expected = expected[expected['date'] <= pd.Timestamp(end_date)]
+    assert df['date'].tolist() == expected['date'].tolist()
+    np.testing.assert_array_equal(df['mean'].to_numpy(np.float64), expected['mean'].to_numpy())
+    assert df['status'].astype(object).fillna('NULL').tolist() == expected['status'].fillna('NULL').tolist()
+
+
+def test_series_across_year_boundaries(db):
+    chunk = hourly_chunk('2021-12-31', '2023-01-02')
+    series_id = ingest(db, 'SPAN', chunk)
+    assert db.partitions() == [2021, 2022, 2023]
+    assert_data_equal(db, series_id, chunk)
+    assert_data_equal(db, series_id, chunk, '2021-12-31 20:00:00', '2022-01-01 04:00:00')
+    assert_data_equal(db, series_id, chunk, '2022-12-31 23:00:00', '2023-01-01 00:00:00')
+    assert db.date_range([series_id]) == (to_epoch('2021-12-31'), to_epoch('2023-01-01 23:00:00'))
+
+
+@pytest.mark.parametrize('before, dropped', [
+    ('2022-01-01', [2021]), ('2022-06-15 12:00:00', [2021]), ('2023-01-01', [2021, 2022])
+])
+def test_drop_partitions_keeps_the_year_of_before(db, before, dropped):
+    chunk = hourly_chunk('2021-12-31', '2023-01-02')
+    series_id = ingest(db, 'SPAN', chunk)
+    rollup_before = db.query_rollup(series_id, resolution_seconds=86400)
+
+    assert db.drop_partitions(before) == dropped
+    assert db.partitions() == [year for year in (2021, 2022, 2023) if year not in dropped]
+    cutoff = pd.Timestamp(f"{max(dropped) + 1}-01-01")
+    kept = chunk[chunk['date'] >= cutoff]
+    assert_data_equal(db, series_id, kept)
+
+    # Rollups and statistics lose exactly the buckets of the dropped years.
+    rollup = db.query_rollup(series_id, resolution_seconds=86400)
+    pd.testing.assert_frame_equal(rollup, rollup_before[rollup_before['date'] >= cutoff].reset_index(drop=True))
+    reader = db.pool.reader()
+    for table, column in [('Rollup', 'bucket'), ('MonthStatistics', 'month'), ('DayProfile', 'month')]:
+        first = reader.execute(f"SELECT MIN({column}) FROM {table} WHERE series_id = ?", (series_id,)).fetchone()[0]
+        assert first == to_epoch(cutoff)
+    assert db.query_statistics(series_id)['count'].sum() == len(kept)
+    rows, null_ratio = reader.execute(
+        "SELECT rows, null_ratio FROM SeriesStatistics WHERE series_id = ?", (series_id,)).fetchone()
+    assert rows == len(kept)
+    assert null_ratio == pytest.approx(kept['mean'].isna().mean())
+
+
+def test_view_is_rebuilt_after_the_last_partition_is_dropped(db):
+    chunk = hourly_chunk('2022-12-30', '2023-01-02')
+    series_id = ingest(db, 'SPAN', chunk)
+    assert db.drop_partitions('2030-01-01') == [2022, 2023]
+    assert db.partitions() == []
+    assert db.query_data(series_id).empty
+    assert db.date_range([series_id]) == (None, None)
+    assert db.pool.reader().execute("SELECT COUNT(*) FROM Data").fetchone()[0] == 0
+
+    # The next ingest creates its partition and puts it back into the view.
+    assert db.drop_partitions('2030-01-01') == []
+    chunk = hourly_chunk('2024-01-01', '2024-01-02')
+    series_id = ingest(db, 'NEW', chunk)
+    assert db.partitions() == [2024]
+    assert_data_equal(db, series_id, chunk)
+
+
+def test_delete_measurements_drops_partitions_left_empty(db):
+    old = hourly_chunk('2021-12-31', '2022-01-02')
+    new = hourly_chunk('2022-06-01', '2022-06-02')
+    old_id, new_id = ingest(db, 'OLD', old), ingest(db, 'NEW', new)
+    assert db.partitions() == [2021, 2022]
+
+    db.delete_measurements(old_id)
+    assert db.partitions() == [2022]
+    assert db.query_data(old_id).empty
+    assert_data_equal(db, new_id, new)
+    assert list(db.query_all_metadata()['series_id']) == [new_id]
+    for table in ('Rollup', 'MonthStatistics', 'SeriesStatistics', 'DayProfile'):
+        assert db.pool.reader().execute(f"SELECT COUNT(*) FROM {table} WHERE series_id = ?", (old_id,)).fetchone() \
+            == (0,)
+
+    db.delete_measurements(new_id)
+    assert db.partitions() == []
+    assert db.pool.reader().execute("SELECT COUNT(*) FROM Data").fetchone()[0] == 0
@@ -0,0 +1,31 @@
+import gc
+import threading
+
+from pool import ConnectionPool
+
+
+def test_reader_is_closed_when_its_thread_ends(synthetic_db):
+    pool = ConnectionPool(synthetic_db, read_only=True)
+    pool.reader().execute("SELECT 1").fetchone()
+
+    def read():
+        pool.reader().execute("SELECT COUNT(*) FROM Metadata").fetchone()
+
+    # A thread per request, like the Dash development server.
+    for _ in range(50):
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert len(pool._readers) == 1
+    pool.close()
+
+
+def test_reader_is_reused_within_a_thread(synthetic_db):
+    pool = ConnectionPool(synthetic_db, read_only=True)
+    assert pool.reader() is pool.reader()
+    pool.close()
+    # close() invalidates the handle of this thread, the next read opens a new connection.
+    assert pool.reader().execute("SELECT 1").fetchone() == (1,)
+    pool.close()
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from db import PlantDataBase, ROLLUP_RESOLUTIONS
+
+# Frequency of the pandas grouping that matches each rollup resolution.
+FREQUENCIES = {'hour': 'h', 'day': 'D', 'month': 'M'}
+
+
+def chunk(start: str, end: str, offset: float = 0.0, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq='15min', inclusive='left')
+    dates = dates[rng.random(len(dates)) > 0.1]
+    values = offset + rng.normal(50, 10, len(dates))
+    values[rng.random(len(dates)) < 0.1] = np.nan
+    # A whole hour without values, its bucket has rows but a count of 0.
+    hour = pd.Timestamp(start) + pd.Timedelta(hours=5)
+    values[(dates >= hour) & (dates < hour + pd.Timedelta(hours=1))] = np.nan
+    return pd.DataFrame({'date': dates, 'mean': values})
+
+
+def ingest(db: PlantDataBase, msr: str, frame: pd.DataFrame) -> str:
+    return db.ingest_series(
+        frame, msr, 'IST', '2023-01-01', '2023-12-31', 15, 'min', object_id=msr, object_description=msr,
+        object_name=msr, unit='m3/h', scale=1
+    )['series_id']
+
+
+def expected_rollup(db: PlantDataBase, series_id: str, resolution: str) -> pd.DataFrame:
+    df = db.query_data(series_id)
+    buckets = df['date'].dt.to_period(FREQUENCIES[resolution]).dt.start_time if resolution == 'month' \
+        else df['date'].dt.floor(FREQUENCIES[resolution])
+    grouped = df['mean'].astype(np.float64).groupby(buckets.rename('date'))
+    return pd.DataFrame({
+        'mean': grouped.mean(), 'min': grouped.min(), 'max': grouped.max(), 'count': grouped.count()
+    }).reset_index()
+
+
+def assert_rollups_match(db: PlantDataBase, series_id: str):
+    for resolution, (_, width) in ROLLUP_RESOLUTIONS.items():
+        assert db.plan_rollup(width) == resolution
+        pd.testing.assert_frame_equal(
+            db.query_rollup(series_id, resolution_seconds=width), expected_rollup(db, series_id, resolution),
+            check_dtype=False, rtol=1e-5
+        )
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = PlantDataBase(str(tmp_path / 'rollups.db')).open()
+    db.create_tables()
+    yield db
+    db.close()
+
+
+def test_plan_rollup():
+    db = PlantDataBase.__new__(PlantDataBase)
+    assert db.plan_rollup(0) is None
+    assert db.plan_rollup(3599) is None
+    assert db.plan_rollup(3600) == 'hour'
+    assert db.plan_rollup(86399) == 'hour'
+    assert db.plan_rollup(86400) == 'day'
+    assert db.plan_rollup(10 ** 9) == 'month'
+
+
+def test_rollups_follow_ingest_reingest_and_delete(db):
+    series_id = ingest(db, 'ROLL', chunk('2023-01-25', '2023-03-05'))
+    assert_rollups_match(db, series_id)
+
+    # Overlaps the end of the first ingest from the middle of an hour and extends it into the next month.
+    ingest(db, 'ROLL', chunk('2023-02-27 12:30:00', '2023-04-02', offset=1000, seed=1))
+    assert_rollups_match(db, series_id)
+
+    other_id = ingest(db, 'OTHER', chunk('2023-02-01', '2023-03-01', seed=2))
+    assert_rollups_match(db, other_id)
+    db.delete_measurements(other_id)
+    assert db.pool.reader().execute("SELECT COUNT(*) FROM Rollup WHERE series_id = ?", (other_id,)).fetchone() == (0,)
+    assert_rollups_match(db, series_id)
+
+
+def test_rollup_range_starts_at_the_bucket_of_start_date(db):
+    series_id = ingest(db, 'ROLL', chunk('2023-01-25', '2023-03-05'))
+    df = db.query_rollup(series_id, '2023-02-10 13:30:00', '2023-02-11 02:00:00', resolution_seconds=3600)
+    assert df['date'].iloc[0] == pd.Timestamp('2023-02-10 13:00:00')
+    assert df['date'].iloc[-1] == pd.Timestamp('2023-02-11 02:00:00')
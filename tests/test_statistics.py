@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from db import PlantDataBase
+
+# Whole months, partial months at either end, no whole month, bounds on month starts and open bounds.
+RANGES = [
+    (None, None),
+    ('2023-02-01', '2023-02-28 23:45:00'),
+    ('2023-02-01', '2023-03-01'),
+    ('2023-01-20 13:00:00', '2023-03-05 06:00:00'),
+    ('2023-02-10', '2023-02-20'),
+    ('2023-01-31 23:45:00', '2023-02-01 00:00:00'),
+    (None, '2023-02-15'),
+    ('2023-03-01', None),
+]
+
+
+def chunk(start: str, end: str, offset: float = 0.0, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq='15min', inclusive='left')
+    dates = dates[rng.random(len(dates)) > 0.05]
+    values = offset + rng.normal(50, 10, len(dates))
+    values[rng.random(len(dates)) < 0.05] = np.nan
+    return pd.DataFrame({'date': dates, 'mean': values, 'status': 'OK'})
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = PlantDataBase(str(tmp_path / 'statistics.db')).open()
+    db.create_tables()
+    yield db
+    db.close()
+
+
+def ingest(db: PlantDataBase, frame: pd.DataFrame) -> str:
+    return db.ingest_series(
+        frame, 'STAT', 'IST', '2023-01-15', '2023-04-10', 15, 'min', object_id='STAT', object_description='Stat',
+        object_name='Stat', unit='m3/h', scale=1
+    )['series_id']
+
+
+def raw_average_day(db: PlantDataBase, series_id: str, start_date, end_date) -> pd.Series:
+    df = db.query_data(series_id, start_date, end_date).dropna(subset=['mean'])
+    hours = (df['date'] - df['date'].dt.normalize()).dt.total_seconds() / 3600
+    return df['mean'].astype(np.float64).groupby(hours.rename('hour')).mean()
+
+
+def raw_month_statistics(db: PlantDataBase, series_id: str) -> pd.DataFrame:
+    df = db.query_data(series_id)
+    grouped = df.groupby(df['date'].dt.to_period('M').dt.start_time.rename('month'))['mean']
+    return pd.DataFrame({
+        'count': grouped.size(), 'null_count': grouped.apply(lambda values: values.isna().sum()),
+        'min': grouped.min().astype(np.float64), 'max': grouped.max().astype(np.float64),
+        'mean': grouped.apply(lambda values: values.astype(np.float64).mean())
+    }).reset_index()
+
+
+def assert_statistics_match_raw(db: PlantDataBase, series_id: str):
+    for start_date, end_date in RANGES:
+        pd.testing.assert_series_equal(
+            db.query_average_day(series_id, start_date, end_date), raw_average_day(db, series_id, start_date, end_date),
+            check_names=False, rtol=1e-5
+        )
+    statistics = db.query_statistics(series_id)
+    pd.testing.assert_frame_equal(
+        statistics[['month', 'count', 'null_count', 'min', 'max', 'mean']], raw_month_statistics(db, series_id),
+        check_dtype=False, rtol=1e-5
+    )
+
+
+def test_average_day_matches_raw_rows(db):
+    series_id = ingest(db, chunk('2023-01-15', '2023-04-10'))
+    assert_statistics_match_raw(db, series_id)
+
+
+def test_reingest_over_an_existing_month(db):
+    series_id = ingest(db, chunk('2023-01-15', '2023-04-10'))
+    # Replaces part of February and March and adds rows to the slots skipped by the first ingest.
+    ingest(db, chunk('2023-02-20', '2023-03-10', offset=1000, seed=1))
+    assert_statistics_match_raw(db, series_id)
+    assert db.query_average_day(series_id, '2023-03-01', '2023-03-05').min() > 500
+
+    rows, null_ratio, mean = db.pool.reader().execute(
+        "SELECT rows, null_ratio, mean FROM SeriesStatistics WHERE series_id = ?", (series_id,)).fetchone()
+    df = db.query_data(series_id)
+    assert rows == len(df)
+    assert null_ratio == pytest.approx(df['mean'].isna().mean())
+    assert mean == pytest.approx(df['mean'].astype(np.float64).mean())
+
+
+def test_average_day_of_an_empty_range(db):
+    series_id = ingest(db, chunk('2023-01-15', '2023-04-10'))
+    assert db.query_average_day(series_id, '2024-01-01', '2024-03-01').empty